@@ -1,6 +1,7 @@
 from expyriment import design, control, stimuli
+from stroop_atlas import StimulusAtlas
 from expyriment.misc.constants import C_WHITE, C_BLACK, K_j, K_f
-import random
+import random, itertools
 
 """ Constants """
 KEYS = [K_j, K_f]
@@ -18,6 +19,9 @@ Press SPACE to continue.
 INSTR_MID = """You have finished half of the experiment, well done! Your task will be the same.\nTake a break then press SPACE to move on to the second half."""
 INSTR_END = """Well done!\nPress SPACE to quit the experiment."""
 
+FIXATION_DURATION = 500
+FEEDBACK_DURATION = 1000
+
 FEEDBACK_CORRECT = """Correct"""
 FEEDBACK_INCORRECT = """Incorrect"""
 
@@ -35,18 +39,34 @@ def timed_draw(*stims):
     t1 = exp.clock.time
     return t1 - t0
 
-def present_for(*stims, t=1000):
-    dt = timed_draw(*stims)
-    exp.clock.wait(t - dt)
+# Every event of a trial has an absolute target onset (ms of exp.clock) counted from the trial start,
+# and each trial starts when the previous one is planned to end, so timing errors do not add up
+timeline = {'next_onset': None} # Planned start of the next trial (None: as soon as possible)
+draw_cost = {} # {stimuli: how long they took to draw last time (ms)}
+
+def wait_until(target):
+    exp.clock.wait(max(0, target - exp.clock.time))
+
+def present_at(*stims, target):
+    # Starts drawing early by the last draw duration, so the stimuli are on screen at target.
+    # Returns the lateness of the onset (ms, negative if early)
+    wait_until(target - draw_cost.get(stims, 0))
+    draw_cost[stims] = timed_draw(*stims)
+    return exp.clock.time - target
 
 def present_instructions(text):
+    if timeline['next_onset'] is not None:
+        wait_until(timeline['next_onset']) # The last feedback stays for its full duration
     instructions = stimuli.TextScreen(text=text, text_justification=0, heading="Instructions")
     instructions.present()
-    exp.keyboard.wait()
+    # The Stroop stimuli are loaded or rendered while the participant reads
+    exp.keyboard.wait(callback_function=atlas.preload_step)
+    timeline['next_onset'] = None # The next trial starts as soon as the participant is ready
 
 """ Global settings """
 exp = design.Experiment(name="Stroop", background_colour=C_WHITE, foreground_colour=C_BLACK)
-exp.add_data_variable_names(['block_cnt', 'trial_cnt', 'trial_type', 'word', 'colour', 'RT', 'correct'])
+exp.add_data_variable_names(['block_cnt', 'trial_cnt', 'trial_type', 'word', 'colour', 'RT', 'correct',
+                           'fixation_lateness', 'stimulus_lateness', 'feedback_lateness'])
 
 control.set_develop_mode()
 control.initialize(exp)
@@ -55,8 +75,9 @@ control.initialize(exp)
 fixation = stimuli.FixCross()
 fixation.preload()
 
-stims = stims = {w: {c: stimuli.TextLine(w, text_colour=c) for c in COLOURS} for w in COLOURS}
-load([stims[w][c] for w in COLOURS for c in COLOURS])
+# Word x colour stimuli are made on first use (and cached on disk, see stroop_atlas.py)
+atlas = StimulusAtlas()
+atlas.prerender(itertools.product(COLOURS, COLOURS))
 
 feedback_correct = stimuli.TextLine(FEEDBACK_CORRECT)
 feedback_incorrect = stimuli.TextLine(FEEDBACK_INCORRECT)
@@ -64,14 +85,19 @@ load([feedback_correct, feedback_incorrect])
 
 """ Experiment """
 def run_trial(block_id, trial_id, trial_type, word, color):
-    stim = stims[word][color]
-    present_for(fixation, t=500)
-    stim.present()
+    stim = atlas.get(word, color)
+    start = timeline['next_onset'] if timeline['next_onset'] is not None else exp.clock.time
+    fixation_lateness = present_at(fixation, target=start)
+    stimulus_lateness = present_at(stim, target=start + FIXATION_DURATION)
     key, rt = exp.keyboard.wait(KEYS)
     correct = key == K_j if trial_type == "match" else key == K_f
-    exp.data.add([block_id, trial_id, trial_type, word, color, rt, correct])
     feedback = feedback_correct if correct else feedback_incorrect
-    present_for(feedback, t=1000)
+    # The feedback is due at the key press, and lasts until the next trial
+    response_time = start + FIXATION_DURATION + stimulus_lateness + rt
+    feedback_lateness = present_at(feedback, target=response_time)
+    timeline['next_onset'] = response_time + FEEDBACK_DURATION
+    exp.data.add([block_id, trial_id, trial_type, word, color, rt, correct,
+                  fixation_lateness, stimulus_lateness, feedback_lateness])
 
 control.start(subject_id=1)
 
@@ -86,4 +112,5 @@ for block_id in range(1, N_BLOCKS + 1):
         present_instructions(INSTR_MID)
 present_instructions(INSTR_END)
 
+atlas.close()
 control.end()
\ No newline at end of file
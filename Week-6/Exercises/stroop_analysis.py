@@ -0,0 +1,198 @@
+"""
+Stroop effect analysis for the data files of stroop.py and stroop_balanced.py.
+
+Reads every Stroop data file (.xpd) of a folder, parses the files in parallel
+(one process per file) into columns (block, congruent, RT, correct), and
+computes with NumPy, for every file (subject) and for the group:
+- the error rate of congruent (word = colour) and incongruent trials
+- the mean RT of the correct trials, after trimming: RTs outside RT_MIN..RT_MAX
+  ms, then RTs more than TRIM_SD standard deviations from the mean of their
+  subject x condition, are left out
+- the Stroop effects: incongruent - congruent, for the RT and the error rate
+overall and per block. Every cell is a np.bincount over a flat index
+(subject, block, condition), so all the subjects are computed at once.
+
+Congruency comes from the word and the colour, not from the trial_type column
+(in stroop.py the trial type is drawn separately from the word and the colour).
+Every file counts as one subject: both scripts start with subject_id=1.
+
+The results are written to two CSV files in the data folder:
+- stroop_subject_summary.csv: one row per file x block (and 'all')
+- stroop_group_summary.csv:   one row per block (and 'all'): mean, SEM and
+  paired t of the effects over subjects
+
+Usage:
+    python stroop_analysis.py [data_folder] [FILE_PREFIX]
+(default: the 'data' folder next to this script, every Stroop file in it;
+ e.g. FILE_PREFIX = stroop_balanced to leave out the stroop.py files)
+"""
+
+import os
+import sys
+import csv
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+SUBJECT_SUMMARY_FILE = "stroop_subject_summary.csv"
+GROUP_SUMMARY_FILE = "stroop_group_summary.csv"
+
+# RT trimming (ms)
+RT_MIN = 200
+RT_MAX = 3000
+TRIM_SD = 2.5
+
+CONDITIONS = ['congruent', 'incongruent']
+
+""" Parsing """
+def parse_data_file(path):
+    # One Stroop data file as columns (runs in a worker process), or None if it is not a Stroop data file
+    header = None
+    rows = []
+    with open(path, 'r', encoding='utf-8') as f:
+        # Expyriment data files start with comment lines beginning with '#'
+        for row in csv.reader(line for line in f if not line.startswith('#')):
+            if not row:
+                continue
+            if header is None:
+                header = row
+                if not {'block_cnt', 'word', 'colour', 'RT', 'correct'} <= set(header):
+                    return None
+                columns = {name: i for i, name in enumerate(header)}
+                continue
+            rows.append(row)
+    if header is None or not rows:
+        return None
+
+    column = lambda name: [row[columns[name]] for row in rows]
+    return {
+        'file': os.path.basename(path),
+        'subject_id': rows[0][columns['subject_id']],
+        'block': np.array(column('block_cnt'), dtype=np.int64),
+        'congruent': np.array([w == c for w, c in zip(column('word'), column('colour'))], dtype=np.int8),
+        'rt': np.array(column('RT'), dtype=np.float64),
+        'correct': np.array([value in ('True', '1') for value in column('correct')], dtype=np.int8),
+    }
+
+def load_data_folder(data_folder, prefix=""):
+    # Parses the .xpd files of a folder in a process pool. Returns the parsed Stroop files
+    paths = sorted(os.path.join(data_folder, f) for f in os.listdir(data_folder)
+                   if f.endswith(".xpd") and f.startswith(prefix))
+    with ProcessPoolExecutor() as executor:
+        parsed = list(executor.map(parse_data_file, paths, chunksize=8))
+    subjects = []
+    for path, data in zip(paths, parsed):
+        if data is None:
+            print(f"Skipping {os.path.basename(path)} (not a Stroop data file or empty).")
+        else:
+            subjects.append(data)
+    return subjects
+
+""" Cells """
+def cell_sums(index, values, size):
+    return np.bincount(index, weights=values, minlength=size)
+
+def compute_cells(subjects):
+    # Trial counts, error counts and trimmed RT means per subject x block x condition (block 0 = all blocks)
+    subject = np.concatenate([np.full(len(s['block']), i) for i, s in enumerate(subjects)])
+    block = np.concatenate([s['block'] for s in subjects])
+    incongruent = 1 - np.concatenate([s['congruent'] for s in subjects])
+    rt = np.concatenate([s['rt'] for s in subjects])
+    correct = np.concatenate([s['correct'] for s in subjects])
+    n_subjects, n_blocks = len(subjects), int(block.max())
+
+    # RT trimming: absolute bounds, then TRIM_SD around the mean of each subject x condition
+    keep = (correct == 1) & (rt >= RT_MIN) & (rt <= RT_MAX)
+    condition_index = subject * 2 + incongruent
+    n = cell_sums(condition_index, keep, n_subjects * 2)
+    total = cell_sums(condition_index, rt * keep, n_subjects * 2)
+    squares = cell_sums(condition_index, rt ** 2 * keep, n_subjects * 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / n
+        sd = np.sqrt(np.maximum(squares / n - mean ** 2, 0) * n / (n - 1))
+    keep &= ~(np.abs(rt - mean[condition_index]) > TRIM_SD * sd[condition_index])
+
+    cells = {}
+    shape = (n_subjects, n_blocks + 1, 2)
+    for blocks in (block, np.zeros_like(block)): # Per block, then all blocks together (block 0)
+        index = (subject * (n_blocks + 1) + blocks) * 2 + incongruent
+        size = shape[0] * shape[1] * shape[2]
+        for name, values in [('trials', None), ('errors', 1 - correct), ('rt_n', keep), ('rt_sum', rt * keep)]:
+            counts = cell_sums(index, values, size).reshape(shape)
+            cells[name] = cells.get(name, 0) + counts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cells['error_rate'] = np.where(cells['trials'] > 0, cells['errors'] / cells['trials'] * 100, np.nan)
+        cells['rt'] = np.where(cells['rt_n'] > 0, cells['rt_sum'] / cells['rt_n'], np.nan)
+    cells['n_trimmed'] = int(np.sum(correct == 1) - np.sum(keep))
+    return cells
+
+def group_statistics(effects):
+    # Mean, standard error and paired t over subjects (axis 0), ignoring missing cells
+    n = np.sum(~np.isnan(effects), axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(effects, axis=0)
+        sem = np.where(n > 1, np.nanstd(effects, axis=0, ddof=1) / np.sqrt(n), np.nan)
+        t = mean / sem
+    return mean, sem, t, n
+
+def fmt(value):
+    return "NA" if np.isnan(value) else f"{value:.2f}"
+
+""" Analysis """
+def analyze_folder(data_folder, prefix=""):
+    # Runs the whole analysis for one folder, writes the two summary files and prints the group effects
+    subjects = load_data_folder(data_folder, prefix)
+    if not subjects:
+        print(f"No Stroop data files found in '{data_folder}'.")
+        return
+    cells = compute_cells(subjects)
+    print(f"Parsed {len(subjects)} data files ({cells['n_trimmed']} correct RTs trimmed).")
+
+    rt_effect = cells['rt'][:, :, 1] - cells['rt'][:, :, 0]
+    error_effect = cells['error_rate'][:, :, 1] - cells['error_rate'][:, :, 0]
+    blocks = ['all'] + list(range(1, rt_effect.shape[1]))
+
+    with open(os.path.join(data_folder, SUBJECT_SUMMARY_FILE), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file', 'subject_id', 'block', 'n_congruent', 'n_incongruent',
+                         'error_rate_congruent', 'error_rate_incongruent', 'rt_congruent', 'rt_incongruent',
+                         'error_effect', 'rt_effect'])
+        for s, data in enumerate(subjects):
+            for b, block in enumerate(blocks):
+                if cells['trials'][s, b].sum() == 0:
+                    continue
+                writer.writerow([data['file'], data['subject_id'], block, *cells['trials'][s, b].astype(int),
+                                 *map(fmt, cells['error_rate'][s, b]), *map(fmt, cells['rt'][s, b]),
+                                 fmt(error_effect[s, b]), fmt(rt_effect[s, b])])
+
+    rt_stats = group_statistics(rt_effect)
+    error_stats = group_statistics(error_effect)
+    with open(os.path.join(data_folder, GROUP_SUMMARY_FILE), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['block', 'n_subjects', 'rt_congruent', 'rt_incongruent', 'rt_effect', 'rt_effect_sem', 'rt_effect_t',
+                         'error_rate_congruent', 'error_rate_incongruent', 'error_effect', 'error_effect_sem', 'error_effect_t'])
+        rt_means = group_statistics(cells['rt'])[0]
+        error_means = group_statistics(cells['error_rate'])[0]
+        for b, block in enumerate(blocks):
+            if rt_stats[3][b] == 0 and error_stats[3][b] == 0:
+                continue
+            writer.writerow([block, error_stats[3][b], *map(fmt, rt_means[b]), *map(fmt, [stat[b] for stat in rt_stats[:3]]),
+                             *map(fmt, error_means[b]), *map(fmt, [stat[b] for stat in error_stats[:3]])])
+
+    print(f"Stroop effect over {error_stats[3][0]} subjects (incongruent - congruent):")
+    print(f"  RT:         {fmt(rt_stats[0][0])} ms (SEM {fmt(rt_stats[1][0])}, t = {fmt(rt_stats[2][0])})")
+    print(f"  Error rate: {fmt(error_stats[0][0])} % (SEM {fmt(error_stats[1][0])}, t = {fmt(error_stats[2][0])})")
+    print(f"Saved {SUBJECT_SUMMARY_FILE} and {GROUP_SUMMARY_FILE} in '{data_folder}'.")
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else DATA_FOLDER
+    prefix = sys.argv[2] if len(sys.argv) > 2 else ""
+    if not os.path.isdir(folder):
+        print(f"FATAL ERROR: Data folder '{folder}' not found.")
+        sys.exit()
+    analyze_folder(folder, prefix)
@@ -0,0 +1,114 @@
+"""
+Stimulus atlas for the Stroop scripts (stroop.py and stroop_balanced.py).
+
+Instead of building and preloading every word x colour TextLine at startup,
+the atlas makes each stimulus the first time it is needed:
+- the bitmap of every word/colour/font/size combination is saved as a PNG in
+  CACHE_FOLDER, under a name made from all its text parameters (and the pygame
+  version), so later sessions load the PNG and never rasterise the font again
+- prerender(trials) queues the combinations of a trial list: cached ones are
+  read from disk by a worker thread, the others are rasterised one per call of
+  preload_step(), which the scripts call while waiting for a key press
+- get(word, colour) returns the preloaded stimulus, making it at once if needed
+
+Font rasterisation stays on the main thread (pygame fonts are shared and not
+thread-safe); the worker thread only reads and writes PNG files.
+"""
+
+import os
+import json
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+from expyriment import stimuli
+
+CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stimulus_cache')
+
+
+class StimulusAtlas:
+    def __init__(self, text_font=None, text_size=None, cache_folder=CACHE_FOLDER):
+        self.text_font = text_font
+        self.text_size = text_size
+        self.cache_folder = cache_folder
+        os.makedirs(cache_folder, exist_ok=True)
+        self.stims = {}          # {(word, colour, font, size): preloaded stimulus}
+        self.loading = {}        # {(word, colour, font, size): Future of the cached surface}
+        self.to_render = deque() # Combinations that are not in the disk cache yet
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.n_rendered = 0
+        self.n_from_cache = 0
+
+    def combination(self, word, colour, font=None, size=None):
+        return (word, colour, font or self.text_font, size or self.text_size)
+
+    def cache_path(self, text_line):
+        # Every parameter that changes the bitmap, as resolved by Expyriment (font file, size, ...)
+        params = [text_line.text, text_line.text_font, text_line.text_size, text_line.text_bold,
+                  text_line.text_italic, text_line.text_underline, text_line.text_colour,
+                  text_line.background_colour, pygame.version.ver]
+        key = hashlib.sha1(json.dumps(params).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_folder, f"{key}.png")
+
+    def text_line(self, combination):
+        word, colour, font, size = combination
+        return stimuli.TextLine(word, text_colour=colour, text_font=font, text_size=size)
+
+    def prerender(self, trials):
+        # trials: (word, colour) pairs or dicts with 'word' and 'colour', in the order they will be needed
+        for trial in trials:
+            word, colour = (trial['word'], trial['colour']) if isinstance(trial, dict) else trial
+            combination = self.combination(word, colour)
+            if combination in self.stims or combination in self.loading or combination in self.to_render:
+                continue
+            path = self.cache_path(self.text_line(combination))
+            if os.path.isfile(path):
+                self.loading[combination] = self.executor.submit(pygame.image.load, path)
+            else:
+                self.to_render.append(combination)
+
+    def preload_step(self):
+        # One unit of work for idle time (e.g. a keyboard.wait callback): preload one cached bitmap, or render one
+        loaded = next((combination for combination, future in self.loading.items() if future.done()), None)
+        if loaded is not None:
+            self.get(*loaded)
+        elif self.to_render:
+            self.get(*self.to_render.popleft())
+
+    def get(self, word, colour, font=None, size=None):
+        combination = self.combination(word, colour, font, size)
+        if combination not in self.stims:
+            text_line = self.text_line(combination)
+            path = self.cache_path(text_line)
+            surface = None
+            try:
+                if combination in self.loading:
+                    loaded = self.loading.pop(combination).result()
+                else:
+                    loaded = pygame.image.load(path)
+                surface = loaded.convert_alpha()
+                self.n_from_cache += 1
+            except (FileNotFoundError, pygame.error):
+                pass # Not cached (or a broken file): rasterise it
+            if surface is None:
+                # The font is rasterised once: the stimulus is built from this surface, and
+                # a copy is saved, so the worker thread never touches the surface on screen
+                surface = text_line.get_surface_copy()
+                self.executor.submit(self.save, surface.copy(), path)
+                self.n_rendered += 1
+            stim = stimuli.Canvas(size=surface.get_size())
+            stim.set_surface(surface)
+            stim.preload()
+            self.stims[combination] = stim
+        return self.stims[combination]
+
+    def save(self, surface, path):
+        # Written under a temporary name first, so a session that stops halfway never leaves a broken PNG
+        temp_path = path.replace(".png", ".tmp.png")
+        pygame.image.save(surface, temp_path)
+        os.replace(temp_path, path)
+
+    def close(self):
+        # Waits for the last PNG files to be written
+        self.executor.shutdown(wait=True)
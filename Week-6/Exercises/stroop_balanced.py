@@ -1,6 +1,7 @@
 from expyriment import design, control, stimuli
 from expyriment.misc.constants import C_WHITE, C_BLACK, K_1, K_2, K_3, K_4
-import random, itertools
+from stroop_atlas import StimulusAtlas
+from stroop_sequencer import load_sequence, subject_sequence
 
 """ Constants """
 KEYS = [K_1, K_2, K_3, K_4]
@@ -19,6 +20,9 @@ Press SPACE to continue.
 INSTR_MID = """Well done! We're going to do that again.\nTake a break then press SPACE to move on to the next block."""
 INSTR_END = """Well done!\nPress SPACE to quit the experiment."""
 
+FIXATION_DURATION = 500
+FEEDBACK_DURATION = 1000
+
 FEEDBACK_CORRECT = """Correct"""
 FEEDBACK_INCORRECT = """Incorrect"""
 
@@ -36,25 +40,34 @@ def timed_draw(*stims):
     t1 = exp.clock.time
     return t1 - t0
 
-def present_for(*stims, t=1000):
-    dt = timed_draw(*stims)
-    exp.clock.wait(t - dt)
+# Every event of a trial has an absolute target onset (ms of exp.clock) counted from the trial start,
+# and each trial starts when the previous one is planned to end, so timing errors do not add up
+timeline = {'next_onset': None} # Planned start of the next trial (None: as soon as possible)
+draw_cost = {} # {stimuli: how long they took to draw last time (ms)}
+
+def wait_until(target):
+    exp.clock.wait(max(0, target - exp.clock.time))
+
+def present_at(*stims, target):
+    # Starts drawing early by the last draw duration, so the stimuli are on screen at target.
+    # Returns the lateness of the onset (ms, negative if early)
+    wait_until(target - draw_cost.get(stims, 0))
+    draw_cost[stims] = timed_draw(*stims)
+    return exp.clock.time - target
 
 def present_instructions(text):
+    if timeline['next_onset'] is not None:
+        wait_until(timeline['next_onset']) # The last feedback stays for its full duration
     instructions = stimuli.TextScreen(text=text, text_justification=0, heading="Instructions")
     instructions.present()
-    exp.keyboard.wait()
-
-def find_derangements(lst):
-    derangements = []
-    for perm in itertools.permutations(lst):
-        if all(original != perm[i] for i, original in enumerate(lst)):
-            derangements.append(perm)
-    return derangements
+    # The Stroop stimuli are loaded or rendered while the participant reads
+    exp.keyboard.wait(callback_function=atlas.preload_step)
+    timeline['next_onset'] = None # The next trial starts as soon as the participant is ready
 
 """ Global settings """
 exp = design.Experiment(name="Stroop Balanced", background_colour=C_WHITE, foreground_colour=C_BLACK)
-exp.add_data_variable_names(['block_cnt', 'trial_cnt', 'trial_type', 'word', 'colour', 'RT', 'correct'])
+exp.add_data_variable_names(['block_cnt', 'trial_cnt', 'trial_type', 'word', 'colour', 'RT', 'correct',
+                           'fixation_lateness', 'stimulus_lateness', 'feedback_lateness'])
 
 control.set_develop_mode()
 control.initialize(exp)
@@ -63,50 +76,55 @@ control.initialize(exp)
 fixation = stimuli.FixCross()
 fixation.preload()
 
-stims = {w: {c: stimuli.TextLine(w, text_colour=c) for c in COLOURS} for w in COLOURS}
-load([stims[w][c] for w in COLOURS for c in COLOURS])
+# Word x colour stimuli are made on first use (and cached on disk, see stroop_atlas.py)
+atlas = StimulusAtlas()
 
 feedback_correct = stimuli.TextLine(FEEDBACK_CORRECT)
 feedback_incorrect = stimuli.TextLine(FEEDBACK_INCORRECT)
 load([feedback_correct, feedback_incorrect])
 
 """ Experiment """
-PERMS = find_derangements(COLOURS)
-
 def get_trials(subject_id):
-    perm = PERMS[(subject_id - 1) % len(PERMS)]
-    base = [{'word': c, 'colour': c} for c in COLOURS] + [{'word': w, 'colour': c} for w, c in zip(COLOURS, perm)]
-    block_reps = N_TRIALS_IN_BLOCK // len(base)
+    # The subject's constrained sequence from the cohort file (see stroop_sequencer.py), or built now from the same seed
+    blocks = load_sequence(subject_id, COLOURS, N_BLOCKS, N_TRIALS_IN_BLOCK)
+    if blocks is None:
+        blocks = subject_sequence(subject_id, colours=COLOURS, n_blocks=N_BLOCKS, n_trials_in_block=N_TRIALS_IN_BLOCK)
     trials = []
-    for i in range(1, N_BLOCKS + 1):
-        block = base * block_reps
-        random.shuffle(block)
-        for j, trial in enumerate(block, 1):
+    for i, block in enumerate(blocks, 1):
+        for j, (word, colour) in enumerate(block, 1):
             trials.append(
-                {'subject_id': subject_id, 'block_id': i, 'trial_id': j, 'trial_type': 'match' if trial['word'] == trial['colour'] else 'mismatch',
-                 'word': trial['word'], 'colour': trial['colour'], 'correct_key': COLOUR_TO_KEY[trial['colour']]}
+                {'subject_id': subject_id, 'block_id': i, 'trial_id': j, 'trial_type': 'match' if word == colour else 'mismatch',
+                 'word': word, 'colour': colour, 'correct_key': COLOUR_TO_KEY[colour]}
             )
     return trials
 
 def run_trial(subject_id, block_id, trial_id, trial_type, word, colour, correct_key):
-    stim = stims[word][colour]
-    present_for(fixation, t=500)
-    stim.present()
+    stim = atlas.get(word, colour)
+    start = timeline['next_onset'] if timeline['next_onset'] is not None else exp.clock.time
+    fixation_lateness = present_at(fixation, target=start)
+    stimulus_lateness = present_at(stim, target=start + FIXATION_DURATION)
     key, rt = exp.keyboard.wait(KEYS)
     correct = key == correct_key
-    exp.data.add([subject_id, block_id, trial_id, trial_type, word, colour, rt, correct])
     feedback = feedback_correct if correct else feedback_incorrect
-    present_for(feedback, t=1000)
+    # The feedback is due at the key press, and lasts until the next trial
+    response_time = start + FIXATION_DURATION + stimulus_lateness + rt
+    feedback_lateness = present_at(feedback, target=response_time)
+    timeline['next_onset'] = response_time + FEEDBACK_DURATION
+    exp.data.add([block_id, trial_id, trial_type, word, colour, rt, correct,
+                  fixation_lateness, stimulus_lateness, feedback_lateness])
 
 control.start(subject_id=1)
 
+trials = get_trials(exp.subject)
+atlas.prerender(trials)
 present_instructions(INSTR_START)
 
-for trial in get_trials(exp.subject):
+for trial in trials:
     if trial['trial_id'] == 1 and trial['block_id'] != 1:
         present_instructions(INSTR_MID)
     run_trial(**trial)
 
 present_instructions(INSTR_END)
 
+atlas.close()
 control.end()
\ No newline at end of file
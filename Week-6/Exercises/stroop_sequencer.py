@@ -0,0 +1,292 @@
+"""
+Constrained trial sequences for stroop_balanced.py, for one subject or a whole cohort.
+
+Each block holds the subject's base trials (every colour as a match, and every
+word in its mismatch colour, see subject_base) repeated to fill the block, in an
+order that respects:
+- no immediate repetition of the word or of the colour (also across blocks)
+- a balanced transition matrix: match->match, match->mismatch, mismatch->match
+  and mismatch->mismatch are as equal in number as the block size allows
+- at most MAX_RUN trials of the same type in a row
+
+The sequences are built, not found by reshuffling until they pass:
+1. the trial types: the number of match and mismatch runs that balances the
+   transitions follows from the counts, and the run lengths are drawn uniformly
+   among the compositions with parts between 1 and MAX_RUN (counted exactly)
+2. the words and colours: a random depth-first search that places one trial at
+   a time and only backtracks on a dead end (which is rare). If an order of
+   trial types cannot be filled in MAX_STEPS placements, another one is drawn
+
+A cohort is generated in parallel and saved in one small file, TRIALS_FILE:
+every trial is one byte (word index * 16 + colour index), stored as hex.
+stroop_balanced.py loads the subject's sequence from it at start (and builds
+it itself, from the same seed, if the subject is not in the file).
+
+Usage:
+    python stroop_sequencer.py N_SUBJECTS [FIRST_SUBJECT_ID] [STUDY_SEED]
+"""
+
+import os
+import sys
+import json
+import gzip
+import math
+import random
+from functools import lru_cache
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+TRIALS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stroop_trials.json.gz')
+
+# As in stroop_balanced.py
+COLOURS = ['red', 'blue', 'green', 'orange']
+N_BLOCKS = 8
+N_TRIALS_IN_BLOCK = 128 // N_BLOCKS
+
+MAX_RUN = 3
+MAX_STEPS = 10000 # Placements tried for one block before drawing other trial types
+MAX_ATTEMPTS = 100 # Trial type orders tried for one block
+DEFAULT_STUDY_SEED = "STROOP"
+
+""" Derangements (the mismatch mapping of each subject) """
+@lru_cache(maxsize=None)
+def count_derangements(m, f=None):
+    # Permutations of m items in which f of them (all of them by default) must not stay in place
+    f = m if f is None else f
+    return sum((-1) ** j * math.comb(f, j) * math.factorial(m - j) for j in range(f + 1))
+
+def derangement_options(n, placed, i):
+    # Items still free for position i, each with the number of derangements that continue with it
+    left = [j for j in range(n) if j not in placed]
+    for j in left:
+        if j != i:
+            # After position i, the items with a higher index can still land on their own position
+            yield j, count_derangements(len(left) - 1, sum(1 for other in left if other > i and other != j))
+
+def unrank_derangement(lst, k):
+    # The k-th derangement of lst, in the order of itertools.permutations, without building the others
+    if not 0 <= k < count_derangements(len(lst)):
+        raise IndexError(f"There are only {count_derangements(len(lst))} derangements of {len(lst)} items")
+    placed = []
+    for i in range(len(lst)):
+        for j, count in derangement_options(len(lst), placed, i):
+            if k < count:
+                placed.append(j)
+                break
+            k -= count
+    return tuple(lst[j] for j in placed)
+
+def rank_derangement(lst, perm):
+    # Inverse of unrank_derangement
+    placed = []
+    k = 0
+    for i, item in enumerate(perm):
+        for j, count in derangement_options(len(lst), placed, i):
+            if lst[j] == item:
+                placed.append(j)
+                break
+            k += count
+    return k
+
+def subject_base(subject_id, colours=COLOURS):
+    # Each subject gets the next mismatch mapping (a derangement of the colours), computed directly
+    perm = unrank_derangement(colours, (subject_id - 1) % count_derangements(len(colours)))
+    return [(c, c) for c in colours] + list(zip(colours, perm))
+
+""" Trial types """
+# (previous is match, next is match): match->match, match->mismatch, mismatch->match, mismatch->mismatch
+TRANSITIONS = [(True, True), (True, False), (False, True), (False, False)]
+
+@lru_cache(maxsize=None)
+def count_compositions(n, n_parts, max_part):
+    # Ways to split n into n_parts ordered parts, each between 1 and max_part
+    if n_parts == 0:
+        return 1 if n == 0 else 0
+    return sum(count_compositions(n - part, n_parts - 1, max_part) for part in range(1, min(max_part, n) + 1))
+
+def random_composition(n, n_parts, max_part, rng):
+    # A composition drawn uniformly among all of them (each part is drawn with the number of ways to complete it)
+    parts = []
+    for left in range(n_parts, 0, -1):
+        k = rng.randrange(count_compositions(n, left, max_part))
+        for part in range(1, min(max_part, n) + 1):
+            count = count_compositions(n - part, left - 1, max_part)
+            if k < count:
+                break
+            k -= count
+        parts.append(part)
+        n -= part
+    return parts
+
+def transition_counts(n_match, n_mismatch, match_runs, mismatch_runs, match_first):
+    # (match->match, match->mismatch, mismatch->match, mismatch->mismatch) of a sequence with these runs
+    switches = match_runs + mismatch_runs - 1
+    to_mismatch = (switches + 1) // 2 if match_first else switches // 2
+    return (n_match - match_runs, to_mismatch, switches - to_mismatch, n_mismatch - mismatch_runs)
+
+def transition_options(n_match, n_mismatch, max_run):
+    # Every feasible (spread of the transition counts, match runs, mismatch runs, match first) with runs of at most max_run
+    options = []
+    for match_runs in range(1, n_match + 1):
+        for mismatch_runs in (match_runs - 1, match_runs, match_runs + 1):
+            if not (1 <= mismatch_runs <= n_mismatch and count_compositions(n_match, match_runs, max_run)
+                    and count_compositions(n_mismatch, mismatch_runs, max_run)):
+                continue
+            for match_first in (True, False):
+                if mismatch_runs != match_runs and match_first != (match_runs > mismatch_runs):
+                    continue # With unequal run numbers, the type with more runs starts (and ends)
+                counts = transition_counts(n_match, n_mismatch, match_runs, mismatch_runs, match_first)
+                options.append((max(counts) - min(counts), match_runs, mismatch_runs, match_first))
+    if not options:
+        raise ValueError(f"No order of {n_match} match and {n_mismatch} mismatch trials has runs of at most {max_run}")
+    return options
+
+def type_sequence(n_match, n_mismatch, max_run, rng):
+    # Match/mismatch order with the most balanced transitions and no run longer than max_run
+    options = transition_options(n_match, n_mismatch, max_run)
+    best = min(option[0] for option in options)
+    _, match_runs, mismatch_runs, match_first = rng.choice([option for option in options if option[0] == best])
+
+    runs = {'match': random_composition(n_match, match_runs, max_run, rng),
+            'mismatch': random_composition(n_mismatch, mismatch_runs, max_run, rng)}
+    order = ['match', 'mismatch'] if match_first else ['mismatch', 'match']
+    types = []
+    for i in range(match_runs + mismatch_runs):
+        trial_type = order[i % 2]
+        types.extend([trial_type] * runs[trial_type][i // 2])
+    return types
+
+""" Words and colours """
+def fill_block(types, items, previous, rng, max_steps=MAX_STEPS):
+    # Places the items (word, colour) on the trial types, without repeating a word or a colour in a row.
+    # Returns None if that is impossible, or not found in max_steps placements
+    left = {trial_type: Counter(item for item in items if (item[0] == item[1]) == (trial_type == 'match'))
+            for trial_type in ('match', 'mismatch')}
+    block = []
+    steps = [0]
+
+    def place(i, previous):
+        if i == len(types):
+            return True
+        steps[0] += 1
+        if steps[0] > max_steps:
+            return False
+        candidates = [item for item, count in left[types[i]].items() if count > 0 and
+                      (previous is None or (item[0] != previous[0] and item[1] != previous[1]))]
+        rng.shuffle(candidates)
+        for item in candidates:
+            left[types[i]][item] -= 1
+            block.append(item)
+            if place(i + 1, item):
+                return True
+            block.pop() # Dead end: try the next candidate
+            left[types[i]][item] += 1
+        return False
+
+    return block if place(0, previous) else None
+
+def make_sequence(base, n_blocks, n_trials_in_block, rng, max_run=MAX_RUN):
+    # The blocks of one subject: lists of (word, colour)
+    if n_trials_in_block < len(base) or n_trials_in_block % len(base) != 0:
+        raise ValueError(f"A block of {n_trials_in_block} trials cannot hold whole repetitions of the "
+                         f"{len(base)} base trials ({len(base) // 2} colours as match and as mismatch)")
+    items = base * (n_trials_in_block // len(base))
+    n_match = sum(1 for word, colour in items if word == colour)
+    blocks = []
+    previous = None
+    for _ in range(n_blocks):
+        for _ in range(MAX_ATTEMPTS):
+            types = type_sequence(n_match, len(items) - n_match, max_run, rng)
+            block = fill_block(types, items, previous, rng)
+            if block is not None:
+                break
+        else:
+            raise ValueError("These trials cannot be ordered without repeating a word or a colour")
+        blocks.append(block)
+        previous = block[-1]
+    return blocks
+
+def check_sequence(blocks, max_run=MAX_RUN):
+    # Returns the constraints the sequence breaks (an empty list if it respects them all)
+    trials = [item for block in blocks for item in block]
+    problems = []
+    if any(a[0] == b[0] or a[1] == b[1] for a, b in zip(trials, trials[1:])):
+        problems.append("word or colour repeated in a row")
+    for block in blocks:
+        types = [word == colour for word, colour in block]
+        run = 1
+        for a, b in zip(types, types[1:]):
+            run = run + 1 if a == b else 1
+            if run > max_run:
+                problems.append(f"more than {max_run} trials of the same type in a row")
+                return problems
+    for i, block in enumerate(blocks):
+        # The transitions must be as balanced as the block's match and mismatch counts allow
+        types = [word == colour for word, colour in block]
+        n_match = sum(types)
+        counts = Counter(zip(types, types[1:]))
+        spread = max(counts[pair] for pair in TRANSITIONS) - min(counts[pair] for pair in TRANSITIONS)
+        if spread > min(option[0] for option in transition_options(n_match, len(types) - n_match, max_run)):
+            problems.append(f"unbalanced transitions in block {i + 1}")
+    return problems
+
+def subject_sequence(subject_id, study_seed=DEFAULT_STUDY_SEED, colours=COLOURS,
+                     n_blocks=N_BLOCKS, n_trials_in_block=N_TRIALS_IN_BLOCK, max_run=MAX_RUN):
+    # The same arguments always give the same sequence
+    rng = random.Random(f"{study_seed}:{subject_id}")
+    return make_sequence(subject_base(subject_id, colours), n_blocks, n_trials_in_block, rng, max_run)
+
+""" Cohort file """
+def encode_sequence(blocks, colours):
+    return bytes(colours.index(word) * 16 + colours.index(colour) for block in blocks for word, colour in block).hex()
+
+def decode_sequence(code, colours, n_trials_in_block):
+    trials = [(colours[byte // 16], colours[byte % 16]) for byte in bytes.fromhex(code)]
+    return [trials[i:i + n_trials_in_block] for i in range(0, len(trials), n_trials_in_block)]
+
+def _encoded_subject_sequence(args):
+    subject_id, study_seed, colours, n_blocks, n_trials_in_block, max_run = args
+    return subject_id, encode_sequence(subject_sequence(*args), colours)
+
+def generate_cohort(subject_ids, study_seed=DEFAULT_STUDY_SEED, colours=COLOURS, n_blocks=N_BLOCKS,
+                    n_trials_in_block=N_TRIALS_IN_BLOCK, max_run=MAX_RUN, path=TRIALS_FILE):
+    # Generates the sequences of many subjects in a process pool and saves them in one file
+    jobs = [(subject_id, study_seed, colours, n_blocks, n_trials_in_block, max_run) for subject_id in subject_ids]
+    with ProcessPoolExecutor() as executor:
+        subjects = dict(executor.map(_encoded_subject_sequence, jobs, chunksize=32))
+    cohort = {'study_seed': study_seed, 'colours': colours, 'n_blocks': n_blocks,
+              'n_trials_in_block': n_trials_in_block, 'max_run': max_run,
+              'subjects': {str(subject_id): code for subject_id, code in subjects.items()}}
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump(cohort, f, separators=(',', ':'))
+    return cohort
+
+def load_sequence(subject_id, colours=COLOURS, n_blocks=N_BLOCKS, n_trials_in_block=N_TRIALS_IN_BLOCK, path=TRIALS_FILE):
+    # The subject's blocks from the cohort file, or None if the file has no (matching) sequence for them
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            cohort = json.load(f)
+    except FileNotFoundError:
+        return None
+    if (cohort['colours'] != colours or cohort['n_blocks'] != n_blocks or
+            cohort['n_trials_in_block'] != n_trials_in_block or str(subject_id) not in cohort['subjects']):
+        return None
+    return decode_sequence(cohort['subjects'][str(subject_id)], colours, n_trials_in_block)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit()
+    n_subjects = int(sys.argv[1])
+    first_subject_id = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    study_seed = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_STUDY_SEED
+
+    subject_ids = range(first_subject_id, first_subject_id + n_subjects)
+    cohort = generate_cohort(subject_ids, study_seed)
+    broken = [subject_id for subject_id in subject_ids
+              if check_sequence(decode_sequence(cohort['subjects'][str(subject_id)], COLOURS, N_TRIALS_IN_BLOCK))]
+    print(f"Saved the sequences of {n_subjects} subjects (study seed '{study_seed}') to '{TRIALS_FILE}'"
+          f" ({os.path.getsize(TRIALS_FILE)} bytes).")
+    if broken:
+        print(f"WARNING: The sequences of subjects {broken} break a constraint.")
@@ -3,15 +3,17 @@ This script runs the Potter & Fox (2009) Experiment 2,
 using the "Super-Block" counterbalancing logic described in
 the CORE1_Project1_counterbalance_1101.pdf.
 
-This single file contains all the logic. You do not need a
-separate 'build_counterbalance.py' file.
+The counterbalancing logic (plan and pools) lives in CORE1_plans.py,
+which can also pre-generate the plans of a whole study from one seed.
 
-- It generates the balanced 75-trial plan in memory.
-- It generates the master "pools" for quadrant combinations.
+- It loads the participant's pre-generated plan, or generates the
+  balanced 75-trial plan and the master "pools" for quadrant combinations.
 - It runs the 3 practice + 75 main trials.       ************* 72 NOT 75 *************
 - It "pops" from the pools for each frame, as per the PDF's logic.
 - It logs all data and verifies that the pools are empty at the end.
 - It no longer checks for a 'masks' folder and always uses procedural masks.
+- If CORE1_build_stimulus_store.py has been run, it loads the pre-scaled
+  pictures from the stimulus store instead of decoding the JPEGs.
 """
 ### ------- ALL VARIABLES -----
 ## 1. Independent Variables (the things we are testing)
@@ -42,7 +44,7 @@ separate 'build_counterbalance.py' file.
 ## 4. Setting Variables (The "Control Panel")
 # "N_SUPER_BLOCKS_TO_RUN": A number (you set it to 1 or 15). The "Test Mode" switch. 15 runs the full 75-trial experiment. 1 runs a quick 5-trial test.
 # "PICS_FOLDER": A file path. Tells the script where to find the stimuli folder.
-# "QUADRANT_POSITIONS": A dictionary. It maps a simple number 1 to a complex (x, y) coordinate (-165, 115), telling the script where "top-left" is.
+# "QUADRANT_POSITIONS": A dictionary (in CORE1_plans.py). It maps a simple number 1 to a complex (x, y) coordinate (-165, 115), telling the script where "top-left" is.
 
 
 ### ------OUTPUT analysis:-------
@@ -65,16 +67,32 @@ separate 'build_counterbalance.py' file.
 # correct: (Dependent Variable)
 #        0 = They were wrong.
 #        1 = They were correct.
+# rt_error: The largest possible timestamping error of rt in ms (the time since the previous
+#        keyboard poll, see wait_for_response).
 
 import random
-import itertools
+import math
 import os
 import sys
-# NEW SCRIPT: Import libraries needed for data analysis
-import csv
-from collections import defaultdict
-# END NEW SCRIPT
-from expyriment import design, control, stimuli, io, misc
+import time
+import json
+import mmap
+import pygame # Used to read the stimulus store
+# Worker threads that decode the next trial's pictures in the background
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, Counter
+from expyriment import design, control, stimuli, misc
+# Seeded plan generation (shared with the plan pre-generation and audit tools)
+from CORE1_plans import DURATIONS, QUADRANT_POSITIONS, generate_plan, get_plan_path, load_plan, save_plan
+# Frame compositing and data analysis (also used by the benchmarks)
+from CORE1_frames import create_mask_layers, new_frame_canvas
+from CORE1_analysis import create_results, record_response, get_running_accuracy, analyze_data
+# Pictures decoded without the stimulus store are scaled like the ones in the store
+from CORE1_build_stimulus_store import STORE_FORMAT, scale_to_slot
+# Cached list of the usable pictures (shared with the plan pre-generation)
+from CORE1_manifest import load_stimulus_manifest, get_usable_pictures
+# Crash-safe session journal (resume an interrupted session)
+from CORE1_journal import get_journal_path, read_journal, get_last_data_file, supersede_data_file, start_journal, add_trial, add_resume, close_journal
 # We try to import the correct key constants, but if it fails (e.g., older version),
 # we'll just use the ASCII values as a fallback.
 ## import the "official" names for the 'y' and 'n' keys (K_y, K_n) from the expyriment library and make the script less likely to crash due to version issues
@@ -94,11 +112,52 @@ except ImportError:
 # 1  = A short 5-trial test
 N_SUPER_BLOCKS_TO_RUN = 1
 
+# HEADLESS SIMULATION: runs a whole session without a display or a participant
+# (dummy video driver, simulated responses, no waiting), e.g. to test the
+# counterbalancing and the analysis, or as a throughput benchmark:
+#     python CORE1_Project1_1101.py --simulate [N_SUPER_BLOCKS]
+SIMULATE_PARTICIPANT = "--simulate" in sys.argv
+if SIMULATE_PARTICIPANT:
+    simulate_args = sys.argv[sys.argv.index("--simulate") + 1:]
+    if simulate_args and simulate_args[0].isdigit():
+        N_SUPER_BLOCKS_TO_RUN = int(simulate_args[0])
+
+# SESSION LOOP: runs back-to-back participants in one process. The stimulus manifest, the
+# stimulus store and the worker threads stay loaded; Expyriment is ended and initialised again
+# (window, masks, data file) for every participant. After each session, the experimenter
+# presses ENTER (next participant) or Q (quit).
+#     python CORE1_Project1_1101.py --sessions [MAX_SESSIONS]
+SESSION_LOOP = "--sessions" in sys.argv
+MAX_SESSIONS = None # None = until the experimenter quits
+if SESSION_LOOP:
+    session_args = sys.argv[sys.argv.index("--sessions") + 1:]
+    if session_args and session_args[0].isdigit():
+        MAX_SESSIONS = int(session_args[0])
+# The simulated participant: probability of pressing 'y'
+# for OLD pictures, by N-value and duration (hits)...
+SIMULATED_HIT_RATES = {
+    1: {240: 0.70, 400: 0.80, 720: 0.90},
+    2: {240: 0.55, 400: 0.65, 720: 0.80},
+    3: {240: 0.45, 400: 0.55, 720: 0.70},
+    4: {240: 0.40, 400: 0.50, 720: 0.65}
+}
+# ...and for NEW pictures, by duration (false alarms)
+SIMULATED_FALSE_ALARM_RATES = {240: 0.20, 400: 0.15, 720: 0.10}
+# Reaction times (ms) are drawn from a normal distribution, cut at SIMULATED_RT_MIN
+SIMULATED_RT_MEAN = 700
+SIMULATED_RT_SD = 200
+SIMULATED_RT_MIN = 150
+
 # Get the absolute path to the directory where this script is located
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Define paths relative to the script's location (guarantee to find the "stimuli" folder)
 PICS_FOLDER = os.path.join(SCRIPT_DIR, 'stimuli')
+# The list of the pictures (with sizes, hashes and a decode check) is cached by CORE1_manifest.py
+# Pre-scaled raw pixels of all pictures, built offline by CORE1_build_stimulus_store.py.
+# If the store exists and is up to date, pictures are created from it without JPEG decoding.
+STORE_FILE = os.path.join(SCRIPT_DIR, 'stimuli_store.bin')
+STORE_INDEX_FILE = os.path.join(SCRIPT_DIR, 'stimuli_store.json')
 ## Relative maths
 N_TRIALS = 5 * N_SUPER_BLOCKS_TO_RUN # e.g. 5 * 15 = 75
 N_PRACTICE = 3  # 3 practice trials
@@ -108,127 +167,126 @@ N_PICS_TOTAL_NEEDED = N_PICS_OLD + N_PICS_NEW  # e.g. 600 + 300 = 900
 
 TEST_PAUSE_DURATION = 200
 TEST_PIC_DURATION = 400
-
-# (x,y) positions for Quadrants 1, 2, 3, 4
-QUADRANT_POSITIONS = {
-    1: (-165, 115), # Top-Left
-    2: (165, 115), # Top-Right
-    3: (-165, -115), # Bottom-Left
-    4: (165, -115)   # Bottom-Right
-}
+# The next test picture and the next trial are prepared while the test pictures are shown
+# and during the pause before the test, never while a response is timed.
+# A preparation step only starts if more time is left than the longest step so far
+# (and at least PREPARATION_MARGIN ms), so a step cannot overrun the wait.
+# No picture is decoded there: the steps wait for the worker threads to decode them.
+PREPARATION_MARGIN = 20
+
+# Number of worker threads that decode upcoming pictures in the background
+PREFETCH_WORKERS = 4
+
+# Refresh-locked RSVP presentation: frame onsets are scheduled against absolute
+# deadlines counted in display refreshes, and every onset is logged to a
+# companion "_frame_timing.csv" file next to the .xpd data file.
+# The refresh interval is measured at startup (N_REFRESH_MEASUREMENTS screen updates).
+# REFRESH_RATE (Hz) is only used when it cannot be measured (no vertical sync, simulation).
+# Every frame lasts a whole number of refreshes: a duration (240, 400, 720 ms) that is
+# not a multiple of the refresh interval (within DURATION_TOLERANCE ms) is shown shorter
+# or longer, and a warning is given (e.g. at 60 Hz; at 75 Hz all three are whole).
+REFRESH_LOCKED_PRESENTATION = True
+REFRESH_RATE = 60
+N_REFRESH_MEASUREMENTS = 60
+DURATION_TOLERANCE = 1
+
+# Per-trial timing of the hot path (pool pops, compositing, preload, fixation,
+# every RSVP frame and every test item), written to "_trial_timing.csv" and
+# summarised (percentiles) in "_timing_summary.txt" next to the .xpd data file.
+PROFILE_TRIALS = False
+
+# Pictures are freed from the cache right after their last use in the plan.
+# Optionally, also cap the cache at this many MB (least recently used pictures go first);
+# None = no cap.
+PICTURE_CACHE_BUDGET_MB = None
+
+# Number of different mask layers (random arrangements of the masks) rendered at startup
+N_MASK_LAYERS = 4
+
+# (x,y) positions for Quadrants 1, 2, 3, 4: QUADRANT_POSITIONS, in CORE1_plans.py
+# (shared with the benchmarks)
 
 # 2. "Super-Block" Generator Logic (from PDF)
-## COUNTERBALANCING
-def get_super_block_prototype(): # defines what one 5-trial "Super-Block" looks like
-    """
-    Returns the 5-trial prototype
-    Inventory needed: 8 (N=1), 6 (N=2), 4 (N=3), 2 (N=4), 10 (N=0)
-    """
-   # N is the Number of pictures that are flashed on the screen at the same time in one frame
-    # e.g. the first trial has one N=4 frame, one N=2 frame, two N=1 frames, etc.
-    SUPER_BLOCK_PROTOTYPE = [
-        (4, 2, 1, 1, 0, 0), # Trial 1 (8 pics)
-        (4, 2, 1, 1, 0, 0), # Trial 2 (8 pics)
-        (3, 3, 1, 1, 0, 0), # Trial 3 (8 pics)
-        (3, 2, 2, 1, 0, 0), # Trial 4 (8 pics)
-        (3, 2, 2, 1, 0, 0)  # Trial 5 (8 pics)
-    ]
+# The plan and the pools are generated by CORE1_plans.py, from one seed per participant
+# (get_super_block_prototype, create_experiment_plan, create_master_pools, assign_pictures).
 
-    return SUPER_BLOCK_PROTOTYPE
+# 3. Setup Experiment
 
-def create_master_pools():
+# Initialize Expyriment (see initialize_display: a new experiment object for every session)
+exp = None
+# control.defaults.initialize_delay = 0  <-- This line was removed to fix the warning
+if SIMULATE_PARTICIPANT:
+    # No real display: render into an off-screen window, without OpenGL
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    control.set_develop_mode(True)
+    control.defaults.opengl = 0
+    control.defaults.window_size = (1920, 1200)
+    control.defaults.initialise_delay = 0
+    control.defaults.event_logging = 0
+# Load Stimuli (the part that does not need the display)
+def open_stimulus_store(folder_mtime):
     """
-    Creates the master pools for the entire experiment,
-    based on the Super-Block inventory from the PDF.
+    Maps the pre-scaled stimulus store into memory.
     Returns:
-        dict: {1: [...], 2: [...], 3: [...], 4: [...]}
+        tuple: (index, buffer), or ({}, None) if there is no store matching folder_mtime
     """
-    print("Generating master quadrant pools...")
-    
-    # Quadrant combos are tuples of quadrant numbers (1-4)
-    N1_QUADRANTS = list(itertools.combinations([1, 2, 3, 4], 1)) # 4 combos, e.g., (1,)
-    N2_QUADRANTS = list(itertools.combinations([1, 2, 3, 4], 2)) # 6 combos, e.g., (1, 2)
-    N3_QUADRANTS = list(itertools.combinations([1, 2, 3, 4], 3)) # 4 combos, e.g., (1, 2, 3)
-    N4_QUADRANTS = list(itertools.combinations([1, 2, 3, 4], 4)) # 1 combo,  e.g., (1, 2, 3, 4)
-    
-    pools = {1: [], 2: [], 3: [], 4: []}
-    
-    for _ in range(N_SUPER_BLOCKS_TO_RUN): # Do this 15 times (or 1 for testing)
-        pools[1].extend(N1_QUADRANTS * 2) # 8 frames = 4 combos * 2 reps
-        pools[2].extend(N2_QUADRANTS * 1) # 6 frames = 6 combos * 1 rep
-        pools[3].extend(N3_QUADRANTS * 1) # 4 frames = 4 combos * 1 rep
-        pools[4].extend(N4_QUADRANTS * 2) # 2 frames = 1 combo * 2 reps
-
-    # PDF: Level 1 Shuffle
-    print("Shuffling master pools (Level 1 Shuffle)...")
-    for pool in pools.values():
-        random.shuffle(pool)
-        
-    print(f"  Pool N=1 size: {len(pools[1])} (Expected 8*{N_SUPER_BLOCKS_TO_RUN}={8 * N_SUPER_BLOCKS_TO_RUN})")
-    print(f"  Pool N=2 size: {len(pools[2])} (Expected 6*{N_SUPER_BLOCKS_TO_RUN}={6 * N_SUPER_BLOCKS_TO_RUN})")
-    print(f"  Pool N=3 size: {len(pools[3])} (Expected 4*{N_SUPER_BLOCKS_TO_RUN}={4 * N_SUPER_BLOCKS_TO_RUN})")
-    print(f"  Pool N=4 size: {len(pools[4])} (Expected 2*{N_SUPER_BLOCKS_TO_RUN}={2 * N_SUPER_BLOCKS_TO_RUN})")
-    return pools
+    try:
+        with open(STORE_INDEX_FILE, 'r', encoding='utf-8') as f:
+            store_index = json.load(f)
+        if store_index["folder_mtime"] != folder_mtime or store_index.get("format") != STORE_FORMAT:
+            print("WARNING: The stimulus store is out of date (run CORE1_build_stimulus_store.py). Decoding the JPEGs instead.")
+            return {}, None
+        with open(STORE_FILE, 'rb') as f:
+            store_buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        print(f"Using the stimulus store ({len(store_index['pictures'])} pre-scaled pictures).")
+        return store_index["pictures"], store_buffer
+    except FileNotFoundError:
+        return {}, None # No store built: decode the JPEGs
+    except Exception as e:
+        print(f"Warning: Could not open the stimulus store: {e}. Decoding the JPEGs instead.")
+        return {}, None
 
-def create_experiment_plan():
+def load_stimuli():
     """
-    Generates the full, 3-level-shuffled plan.
-    
+    Startup job (runs on a worker thread while the window initialises):
+    the manifest of the stimuli folder and the stimulus store.
     Returns:
-        list: A 75-item list (or less), where each item is a dict
-              e.g., {"trial_id": 1, "duration": 400, "n_values": (0,2,4,0,0,2)}
+        tuple: (manifest, store_pictures, store_buffer)
     """
-    print(f"Generating {N_TRIALS}-trial plan...")
-    
-    # Create the Super Blocks
-    prototype = get_super_block_prototype()
-    full_trial_list = prototype * N_SUPER_BLOCKS_TO_RUN
-    
-    # PDF: Level 2 Shuffle
-    print("Shuffling trial order (Level 2 Shuffle)...")
-    random.shuffle(full_trial_list)
-    
-    # Create Duration Pool (N_TRIALS / 3 durations)
-    reps_per_duration = N_TRIALS // 3
-    # Make sure durations are also balanced if N_TRIALS is not divisible by 3 (e.g., 5 trials)
-    duration_pool = ([240] * reps_per_duration + [400] * reps_per_duration + [720] * reps_per_duration)
-    # Add any remaining
-    remaining_durations = [240, 400, 720] * (N_TRIALS % 3)
-    duration_pool.extend(remaining_durations[:N_TRIALS - len(duration_pool)])
-    random.shuffle(duration_pool)
-    
-    final_plan = []
-    for i in range(N_TRIALS):
-        
-        # PDF: Level 3 Shuffle 
-        # Shuffle the 6 frames within this trial
-        trial_n_values = list(full_trial_list[i])
-        random.shuffle(trial_n_values)
-        
-        final_plan.append({
-            "trial_id": i + 1,
-            "duration": duration_pool.pop(),
-            "n_values": trial_n_values # e.g.(0, 2, 0, 4, 0, 2)
-        })
-        
-    print("Experiment plan generation complete.")
-    return final_plan
+    manifest = load_stimulus_manifest()
+    store_pictures, store_buffer = open_stimulus_store(manifest["folder_mtime"])
+    return manifest, store_pictures, store_buffer
 
-# 3. Setup Experiment
+# Overlapped startup: the work that does not need the display runs on worker threads.
+# The stimuli are checked while the window initialises, the participant's plan
+# is loaded (and the first trials prepared) while the instructions are read.
+startup_executor = ThreadPoolExecutor(max_workers=2)
+stimuli_future = startup_executor.submit(load_stimuli)
 
-try:
-    experiment_plan = create_experiment_plan()
-    master_quadrant_pools = create_master_pools()
-except Exception as e:
-    print(f"FATAL ERROR during plan generation: {e}")
-    sys.exit()
+def simulated_wait(waiting_time, callback_function=None, *args, **kwargs):
+    """Replaces exp.clock.wait in simulation mode: returns at once."""
+    return None
 
-# Initialize Expyriment
-exp = design.Experiment(name="Potter & Fox (2009) Exp 2 (Super-Block)")
-# control.defaults.initialize_delay = 0  <-- This line was removed to fix the warning
-control.initialize(exp)
+def simulated_keyboard_wait(keys=None, duration=None, *args, **kwargs):
+    """Replaces exp.keyboard.wait in simulation mode (instruction screens): 'presses' the first key at once."""
+    return (keys[0] if keys else None), 0
 
-exp.data_variable_names = [
+def simulate_response(is_old, n_value, duration):
+    """
+    Draws the simulated participant's answer to one test picture.
+    Returns:
+        tuple: (key, rt) like exp.keyboard.wait
+    """
+    if is_old:
+        p_yes = SIMULATED_HIT_RATES.get(n_value, {}).get(duration, 0.5)
+    else:
+        p_yes = SIMULATED_FALSE_ALARM_RATES.get(duration, 0.5)
+    key = K_y if random.random() < p_yes else K_n
+    rt = max(SIMULATED_RT_MIN, int(random.gauss(SIMULATED_RT_MEAN, SIMULATED_RT_SD)))
+    return key, rt
+
+DATA_VARIABLE_NAMES = [
     "trial_id",
     "duration",
     "test_pic_file",
@@ -237,42 +295,50 @@ exp.data_variable_names = [
     "quadrant",  # The quadrant this pic was in (1-4)
     "response_key",
     "rt",
-    "correct"
+    "correct",
+    "rt_error" # Largest possible timestamping error of rt (ms)
 ]
 
-# Load Stimuli
+def initialize_display():
+    """
+    Initialises Expyriment (window, clock, keyboard) with a new experiment object:
+    Expyriment starts an experiment only once, so every session of the session loop
+    ends it (control.end) and initialises a new one.
+    In simulation mode, the waits are replaced.
+    """
+    global exp
+    exp = design.Experiment(name="Potter & Fox (2009) Exp 2 (Super-Block)")
+    control.initialize(exp)
+    if SIMULATE_PARTICIPANT:
+        exp.clock.wait = simulated_wait
+        exp.keyboard.wait = simulated_keyboard_wait
+    exp.data_variable_names = DATA_VARIABLE_NAMES
+
+initialize_display()
+
 print("Loading stimuli...")
-picture_stim_cache = {}
+# Loaded pictures, least recently used first: {filename: stimulus}
+picture_stim_cache = OrderedDict()
+picture_cache_bytes = {} # Surface size of every cached picture: {filename: bytes}
+# How many more times each picture file will be used (filled in when the plan is loaded):
+# once per pool entry (plotted in a frame or shown as a 'new' test picture),
+# plus once more for the 'old' pictures picked for the test (Role B)
+picture_uses_left = Counter()
 try:
-    all_pic_files = [f for f in os.listdir(PICS_FOLDER) if f.endswith(('.jpg', '.png', '.jpeg'))]
-    random.shuffle(all_pic_files)
+    # Checked on a worker thread while the window was initialising
+    manifest, store_pictures, store_buffer = stimuli_future.result()
+    # Broken pictures are reported now, before the session starts, and never used
+    all_pic_files, broken_pics = get_usable_pictures(manifest)
+    if broken_pics:
+        print(f"WARNING: {len(broken_pics)} pictures cannot be decoded and will not be used:")
+        for entry in broken_pics:
+            print(f"  {entry['file']}: {entry['error']}")
+    # The usable pictures are split into the 'old' and 'new' pools by the participant's plan
     
     if len(all_pic_files) == 0:
         print(f"FATAL ERROR: No pictures found in '{PICS_FOLDER}'.")
         sys.exit()
 
-    if len(all_pic_files) < N_PICS_TOTAL_NEEDED:
-        # THIS BLOCK IS EDITED TO ALLOW TESTING 
-        # In experiment we need 900 pictures
-        print(f"WARNING: NOT ENOUGH PICTURES")
-        print(f"Need {N_PICS_TOTAL_NEEDED}, but only found {len(all_pic_files)}.")
-        print("REUSING pictures. This is for TESTING ONLY.")
-        
-        # Create a new list by repeating the pictures
-        reused_pics_list = []
-        while len(reused_pics_list) < N_PICS_TOTAL_NEEDED:
-            reused_pics_list.extend(all_pic_files) # Add the pictures over and over
-            
-        # Trim the list to exactly the number needed
-        all_pic_files = reused_pics_list[:N_PICS_TOTAL_NEEDED]
-        print(f"Created a temporary list of {len(all_pic_files)} reused pictures.")
-
-    # Split into pools
-    old_pics_pool = all_pic_files[:N_PICS_OLD]
-    new_pics_pool = all_pic_files[N_PICS_OLD:N_PICS_TOTAL_NEEDED]
-    random.shuffle(new_pics_pool)
-    print(f"Loaded {len(old_pics_pool)} 'old' pictures and {len(new_pics_pool)} 'new' pictures.")
-
 except FileNotFoundError:
     print(f"FATAL ERROR: Picture folder '{PICS_FOLDER}' not found.")
     sys.exit()
@@ -281,19 +347,88 @@ except Exception as e:
     sys.exit()
 
 
+def load_picture(filename):
+    """Decodes one picture file into a Picture stimulus (safe to run on a worker thread)."""
+    if filename in store_pictures:
+        # Raw pixels straight from the memory-mapped store: no decoding
+        entry = store_pictures[filename]
+        size = (entry["width"], entry["height"])
+        n_bytes = size[0] * size[1] * len(entry["format"])
+        pixels = store_buffer[entry["offset"]:entry["offset"] + n_bytes]
+        pic = stimuli.Canvas(size=size)
+        pic.set_surface(pygame.image.frombuffer(pixels, size, entry["format"]).convert_alpha())
+        return pic
+    pic = stimuli.Picture(os.path.join(PICS_FOLDER, filename))
+    # Decode the JPEG now, so the main thread only has to preload the surface.
+    # It is scaled like in the store (only pictures larger than a quadrant slot, never enlarged),
+    # so the pictures have the same size with or without it. This applies to the test pictures too:
+    # an 'old' test picture is the same stimulus as in the RSVP frame, and a 'new' one must match it
+    pic.set_surface(scale_to_slot(pic.get_surface_copy()))
+    return pic
+
+# Pictures that are being decoded in the background: {filename: Future}
+picture_prefetch = {}
+prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS)
+
+def prefetch_pictures(filenames):
+    """Starts decoding pictures on the worker threads, unless they are already loaded or queued."""
+    for filename in filenames:
+        if filename not in picture_stim_cache and filename not in picture_prefetch:
+            picture_prefetch[filename] = prefetch_executor.submit(load_picture, filename)
+
+def get_upcoming_pictures(trial_data):
+    """
+    Returns the files the given trial will pop from the picture pools.
+    The pools are popped from the end, so the next trial always takes
+    the last pictures of each pool: sum(n_values) 'old' and 4 'new' ones.
+    Only valid for the next trial that will pop from the pools.
+    """
+    n_old = sum(trial_data["n_values"])
+    upcoming = old_pics_pool[-n_old:] if n_old > 0 else []
+    return upcoming + new_pics_pool[-4:]
+
+def cache_picture(key, pic):
+    """Adds a preloaded picture to the cache. With a budget, evicts the least recently used pictures."""
+    picture_stim_cache[key] = pic
+    if PICTURE_CACHE_BUDGET_MB is not None:
+        while sum(picture_cache_bytes.values()) > PICTURE_CACHE_BUDGET_MB * 1e6 and len(picture_stim_cache) > 1:
+            oldest_key = next(iter(picture_stim_cache))
+            evict_picture(oldest_key)
+
+def evict_picture(key):
+    """Removes a picture from the cache and frees its surface."""
+    pic = picture_stim_cache.pop(key, None)
+    picture_cache_bytes.pop(key, None)
+    if pic is not None:
+        pic.unload()
+
+def release_picture(filename):
+    """Counts one use of a picture. After its last use in the plan, the picture is evicted."""
+    picture_uses_left[filename] -= 1
+    if picture_uses_left[filename] <= 0:
+        del picture_uses_left[filename]
+        evict_picture(filename)
+
 def get_picture(filename):
     """A helper function to load pictures from cache."""
-    if filename not in picture_stim_cache:
+    if filename in picture_stim_cache:
+        picture_stim_cache.move_to_end(filename) # Most recently used
+    else:
         try:
-            pic = stimuli.Picture(os.path.join(PICS_FOLDER, filename))
-            pic.preload()
-            picture_stim_cache[filename] = pic
+            if filename in picture_prefetch:
+                # Already decoded (or being decoded) by a worker thread
+                pic = picture_prefetch.pop(filename).result()
+            else:
+                pic = load_picture(filename)
         except Exception as e:
             print(f"Warning: Could not load {filename}. Using placeholder. Error: {e}")
             pic = stimuli.Rectangle(size=(300, 200), colour=misc.constants.C_GREY)
             stimuli.TextLine(text=filename, text_size=12).plot(pic)
-            pic.preload()
-            picture_stim_cache[filename] = pic
+        # Measure the surface before preloading (in OpenGL mode preloading compresses it)
+        width, height = pic.surface_size
+        picture_cache_bytes[filename] = width * height * 4
+        pic.preload()
+        cache_picture(filename, pic)
     return picture_stim_cache[filename]
 
 def get_practice_picture(text="Practice"):
@@ -303,212 +438,85 @@ def get_practice_picture(text="Practice"):
         pic = stimuli.Rectangle(size=(300, 200), colour=misc.constants.C_GREY)
         stimuli.TextLine(text=text, text_size=20).plot(pic)
         pic.preload()
-        picture_stim_cache[key] = pic
+        picture_stim_cache[key] = pic # Small, and freed after the practice (see evict_practice_pictures)
     return picture_stim_cache[key]
 
-# Always use 8 procedural grey rectangles as masks.
-print("Using procedural grey rectangles as masks.")
-try:
-    MASK_STIMULI = [stimuli.Rectangle(size=(300, 200), colour=misc.constants.C_GREY) for _ in range(8)]
-    for mask in MASK_STIMULI:
-        mask.preload()
-except Exception as e:
-    print(f"FATAL ERROR: Could not create procedural masks: {e}")
-    sys.exit()
-
+def evict_practice_pictures():
+    """Frees the practice placeholders once the practice trials are over."""
+    for key in [key for key in picture_stim_cache if key.startswith("practice_")]:
+        evict_picture(key)
 
-# NEW SCRIPT: Define the Data Analysis Function
-def analyze_data(data_file_path):
+def create_masks():
     """
-    Reads the raw CSV data file, calculates key results,
-    saves them to a new text file, and returns a summary string.
+    Creates the masks, the mask layers and the mask-only frames for the current window
+    (again for every session of the session loop: they do not survive control.end()).
     """
-    
-    # These dictionaries will hold our aggregated data
-    # We use defaultdict to make it easy to add new keys without checking if they exist
-    # e.g., results_n_value['1'][240]['hits'] = 0
-    
-    # This stores Hit Rates, grouped by N-Value, then by Duration
-    # results_n_value[n_value][duration] = {'hits': 0, 'total_old': 0}
-    results_n_value = defaultdict(lambda: defaultdict(lambda: {'hits': 0, 'total_old': 0}))
-    
-    # This stores False Alarms, grouped by Duration
-    # results_duration[duration] = {'false_alarms': 0, 'total_new': 0}
-    results_duration = defaultdict(lambda: {'false_alarms': 0, 'total_new': 0})
-    
-    # These are for the simple, overall accuracy score
-    total_correct = 0
-    total_responses = 0
-
+    global MASK_STIMULI, MASK_LAYERS, MASK_ONLY_FRAMES
+    # Always use 8 procedural grey rectangles as masks.
+    print("Using procedural grey rectangles as masks.")
     try:
-        # Must look for the .csv file, not the .xpd file
-        # The data_file_path is ".../file.xpd", but the CSV is ".../file.csv"
-        csv_file_path = data_file_path.replace(".xpd", ".csv")
-
-        # Open the CSV file that Expyriment just saved
-        with open(csv_file_path, 'r', encoding='utf-8') as f:
-            # Use DictReader to read each row as a dictionary,
-            # which is easier than remembering column numbers
-            reader = csv.DictReader(f)
-            # Loop over every single row (e.g., all 576 responses)
-            for row in reader:
-                # Make sure row is not empty
-                if not row:
-                    continue
-
-                # We are processing one response
-                total_responses += 1
-                
-                # Read and convert data from the row
-                # We must convert strings "1" or "0" into integers 1 or 0
-                is_old = int(row['is_old'])
-                n_value = row['n_value'] # Keep as string '1', '2', '3', '4', or 'N/A'
-                duration = int(row['duration'])
-                correct = int(row['correct'])
-                response_key = int(row['response_key'])
-
-                # Add to the overall accuracy count
-                if correct == 1:
-                    total_correct += 1
-
-                # Now, sort this response into the correct bucket
-                if is_old == 1:
-                    # This was an "old" picture (Role A or B)
-                    # We store its data based on its N-Value and Duration
-                    
-                    # 'hits' = participant correctly pressed 'y'
-                    # We check if the key they pressed matches the 'y' key
-                    if response_key == K_y:
-                         results_n_value[n_value][duration]['hits'] += 1
-                    
-                    # 'total_old' = this was an "old" picture
-                    results_n_value[n_value][duration]['total_old'] += 1
-                
-                elif is_old == 0:
-                    # This was a "new" picture (Role C)
-                    # The paper groups these by *duration only*
-                    
-                    # 'false_alarms' = participant incorrectly pressed 'y'
-                    if response_key == K_y:
-                        results_duration[duration]['false_alarms'] += 1
-                    
-                    # 'total_new' = this was a "new" picture
-                    results_duration[duration]['total_new'] += 1
-        
-        # Data aggregation is finished. Now, build the text report. 
-        
-        # Create a list of strings that we will join together at the end
-        report = []
-        report.append("--- Experiment 2 Summary Report ---")
-        report.append(f"Data file: {os.path.basename(data_file_path)}")
-        report.append("\n")
-        
-        # Calculate overall percentage
-        overall_percent = (total_correct / total_responses) * 100 if total_responses > 0 else 0
-        report.append(f"Overall Accuracy (All Responses): {overall_percent:.2f}% ({total_correct} / {total_responses})")
-        report.append("\n" + "="*40 + "\n")
-
-        # Part 1: Hit Rate by N-Value (This is Figure 3 from the paper) 
-        report.append("Hit Rate (% 'Yes' to OLD pictures) by N-Value (All Durations Combined):")
-        
-        # Get the keys '1', '2', '3', '4' and sort them numerically
-        valid_n_values = sorted([k for k in results_n_value.keys() if str(k).isdigit()], key=int)
-        
-        for n_value in valid_n_values:
-            n_hits = 0
-            n_total = 0
-            # Sum up hits and totals from all durations (240, 400, 720) for this n_value
-            for data in results_n_value[str(n_value)].values():
-                n_hits += data['hits']
-                n_total += data['total_old']
-            
-            # Calculate percentage
-            n_percent = (n_hits / n_total) * 100 if n_total > 0 else 0
-            report.append(f"  N={n_value} Frames: {n_percent:.2f}% ({n_hits} / {n_total})")
-
-        report.append("\n" + "="*40 + "\n")
-
-        # Part 2: Hit Rate by Duration (Also in Figure 3) 
-        report.append("Hit Rate (% 'Yes' to OLD pictures) by Duration (All N-Values Combined):")
-        
-        # Get the keys 240, 400, 720 and sort them
-        sorted_durations = sorted(results_duration.keys())
-        for dur in sorted_durations:
-            dur_hits = 0
-            dur_total_old = 0
-            # We have to sum this up from the *other* dictionary (results_n_value)
-            for n_data in results_n_value.values():
-                if dur in n_data:
-                    dur_hits += n_data[dur]['hits']
-                    dur_total_old += n_data[dur]['total_old']
-            
-            dur_percent = (dur_hits / dur_total_old) * 100 if dur_total_old > 0 else 0
-            report.append(f"  {dur} ms: {dur_percent:.2f}% ({dur_hits} / {dur_total_old})")
+        MASK_STIMULI = [stimuli.Rectangle(size=(300, 200), colour=misc.constants.C_GREY) for _ in range(8)]
+        for mask in MASK_STIMULI:
+            mask.preload()
+    except Exception as e:
+        print(f"FATAL ERROR: Could not create procedural masks: {e}")
+        sys.exit()
 
-        report.append("\n" + "="*40 + "\n")
+    try:
+        # The masks in all 4 quadrants, rendered once (see CORE1_frames.py)
+        MASK_LAYERS = create_mask_layers(exp.screen.size, MASK_STIMULI, QUADRANT_POSITIONS, N_MASK_LAYERS)
+        # Mask-only frames (frames 1 and 8) are the same for every trial: preload them once
+        MASK_ONLY_FRAMES = [new_frame_canvas(MASK_LAYERS, exp.screen.size) for _ in range(N_MASK_LAYERS)]
+        for frame in MASK_ONLY_FRAMES:
+            frame.preload()
+    except Exception as e:
+        print(f"FATAL ERROR: Could not create mask layers: {e}")
+        sys.exit()
 
-        # Part 3: False Alarm Rate by Duration (The other line in Figure 3) 
-        report.append("False Alarm Rate (% 'Yes' to NEW pictures) by Duration:")
-        for dur in sorted_durations:
-            fa_hits = results_duration[dur]['false_alarms']
-            fa_total = results_duration[dur]['total_new']
-            
-            # Calculate percentage
-            fa_percent = (fa_hits / fa_total) * 100 if fa_total > 0 else 0
-            report.append(f"  {dur} ms: {fa_percent:.2f}% ({fa_hits} / {fa_total})")
+create_masks()
 
-        report.append("\n\n--- End of Report ---")
 
-        # Save the report to a new file 
-        
-        # Join all the report lines into one big string
-        report_content = "\n".join(report)
-        
-        # Create a new filename, e.g., "my_data.csv" -> "my_data_summary.txt"
-        report_filename = data_file_path.replace(".xpd", "_summary.txt")
-        
-        # Write the report content to the new text file
-        with open(report_filename, 'w', encoding='utf-8') as f:
-            f.write(report_content)
-        
-        print(f"Analysis complete. Summary saved to: {os.path.basename(report_filename)}")
-        
-        # Return the simple string for the final on-screen feedback
-        return f"Overall Accuracy: {overall_percent:.2f}%"
+# NEW SCRIPT: Data Analysis
+# The analysis functions (create_results, record_response, get_running_accuracy,
+# analyze_data) are in CORE1_analysis.py
 
-    except FileNotFoundError:
-        # Handle error if the data file wasn't created
-        print(f"Error: Could not find data file to analyze: {csv_file_path}")
-        return f"Analysis failed (File not found: {os.path.basename(csv_file_path)})."
-    except Exception as e:
-        # Handle any other unexpected analysis errors
-        print(f"Error during analysis: {e}")
-        return "Analysis could not be completed."
+# The results of this session, updated after every response in run_trial (new for every participant)
+session_results = create_results()
 # END NEW SCRIPT
 
 
-# 4. Define Trial-Running Function 
-def run_trial(trial_data, is_practice=False):
+# 4. Define Trial-Running Functions
+def compose_trial_steps(trial_data, is_practice, composed):
     """
-    Runs a single trial by "popping" from the master pools
-    as described in the PDF.
+    Builds the frames and the test list of a single trial by "popping"
+    from the master pools as described in the PDF.
+    This is a generator: it yields after every frame, so that the work can be
+    spread over the test of the previous trial (see advance_composition).
+    The results are stored in the 'composed' dict.
+    The random choices (mask layers, Role B pictures, test order) come from a generator
+    seeded with the plan's seed and the trial ID, so a resumed session makes the same ones.
     """
-    trial_id = trial_data["trial_id"]
-    duration = trial_data["duration"]
     n_values = trial_data["n_values"] # e.g. [0, 2, 4, 0, 0, 2]
+    rng = random.Random(f"{session_seed}:{trial_data['trial_id']}")
+    timings = {} if PROFILE_TRIALS else None
+    composed["timings"] = timings
     
     rsvp_frames = []
     trial_picture_log = [] # To store (file, n_value, quadrant)
     
     # PDF "Final Logic": "Popping" from the Pools 
     for n in n_values: # For each of the 6 frames (Frame 2-7)
-        frame_canvas = stimuli.Canvas(size=exp.screen.size)
+        # The masks in all 4 positions are already on the frame (copied from a mask layer)
+        start = time.perf_counter()
+        frame_canvas = new_frame_canvas(MASK_LAYERS, exp.screen.size, rng)
+        record_phase(timings, "compositing", start)
         quad_combos_to_plot = [] # This will be a tuple of quad numbers, e.g. (1, 4)
         
+        start = time.perf_counter()
         if n > 0:
             if is_practice:
                 # Practice: just grab a random combo
-                quad_combos_to_plot = random.sample([1, 2, 3, 4], n)
+                quad_combos_to_plot = rng.sample([1, 2, 3, 4], n)
             else:
                 try:
                     # "Pop" one item from the correct master pool
@@ -522,15 +530,8 @@ def run_trial(trial_data, is_practice=False):
                     print(f"FATAL ERROR: Tried to pop from a pool that doesn't exist (N={n})")
                     control.end()
                     sys.exit()
+        record_phase(timings, "pool_pops", start)
         
-        # Plot masks first in all 4 positions
-        random.shuffle(MASK_STIMULI)
-        for i in range(4):
-            quad_num = i + 1
-            pos_tuple = QUADRANT_POSITIONS[quad_num]
-            MASK_STIMULI[i].reposition(pos_tuple)
-            MASK_STIMULI[i].plot(frame_canvas)
-            
         # Now plot the pictures over the masks
         # The code was plotting N pictures, but only logging the last one.
         # This new loop correctly iterates over the tuple of quadrants.
@@ -544,15 +545,21 @@ def run_trial(trial_data, is_practice=False):
                 pic_stim = get_practice_picture(f"N={n}")
             else:
                 try:
+                    start = time.perf_counter()
                     pic_file = old_pics_pool.pop()
+                    record_phase(timings, "pool_pops", start)
+                    start = time.perf_counter()
                     pic_stim = get_picture(pic_file)
+                    record_phase(timings, "picture_lookup", start)
                 except IndexError:
                     print("FATAL ERROR: Ran out of 'old' pictures in the pool!")
                     control.end()
                     sys.exit()
 
+            start = time.perf_counter()
             pic_stim.reposition(position)
             pic_stim.plot(frame_canvas) # Plot on top
+            record_phase(timings, "compositing", start)
             
             # Log this picture's info
             trial_picture_log.append({
@@ -561,35 +568,19 @@ def run_trial(trial_data, is_practice=False):
                 "quadrant": quad_num
             })
 
+        # Keep the steps small: they run during the timed waits of the test (see wait_and_prepare)
+        yield
+        start = time.perf_counter()
         frame_canvas.preload()
+        record_phase(timings, "preload", start)
         rsvp_frames.append(frame_canvas)
+        yield
         
-    # Add frames 1 and 8 (mask-only)
-    frame_1_and_8 = stimuli.Canvas(size=exp.screen.size)
-    random.shuffle(MASK_STIMULI)
-    for i in range(4):
-        quad_num = i + 1
-        pos_tuple = QUADRANT_POSITIONS[quad_num]
-        MASK_STIMULI[i].reposition(pos_tuple)
-        MASK_STIMULI[i].plot(frame_1_and_8)
-    frame_1_and_8.preload()
-
-    final_rsvp_sequence = [frame_1_and_8] + rsvp_frames + [frame_1_and_8]
-
-    # 5b. Run the RSVP Sequence 
-    exp.screen.clear()
-    exp.screen.update()
-    
-    # Present fixation cross
-    stimuli.FixCross(size=(20, 20), line_width=3, colour=misc.constants.C_WHITE).present()
-    exp.clock.wait(500) # 500ms fixation
+    # Add frames 1 and 8 (mask-only, already preloaded)
+    frame_1_and_8 = rng.choice(MASK_ONLY_FRAMES)
 
-    for frame in final_rsvp_sequence:
-        frame.present(clear=True, update=True)
-        exp.clock.wait(duration)
-    
-    stimuli.BlankScreen().present(clear=True, update=True)
-    exp.clock.wait(TEST_PAUSE_DURATION)
+    composed["rsvp_sequence"] = [frame_1_and_8] + rsvp_frames + [frame_1_and_8]
+    yield
 
     # We need to test 4 "old" (Role B) and 4 "new" (C)
     
@@ -599,20 +590,34 @@ def run_trial(trial_data, is_practice=False):
         new_test_pics = [{"file": "practice_new", "n_value": "N/A", "quadrant": "N/A"}] * 4
     else:
         # Randomly select 4 "old" pics (Role B) from the 8 we showed
-        random.shuffle(trial_picture_log)
+        rng.shuffle(trial_picture_log)
         old_test_pics = trial_picture_log[:4] # Role B
         # Role A (not tested) are the ones left: trial_picture_log[4:]
         
+        # All the old pictures are plotted: Role A pictures are not needed anymore,
+        # Role B pictures are kept until their test
+        for pic_log in old_test_pics:
+            picture_uses_left[pic_log["file"]] += 1
+        for pic_log in trial_picture_log:
+            release_picture(pic_log["file"])
+        
         # Get 4 "new" pics (Role C)
         new_test_pics = []
         for _ in range(4):
             try:
+                start = time.perf_counter()
                 new_file = new_pics_pool.pop()
                 new_test_pics.append({"file": new_file, "n_value": "N/A", "quadrant": "N/A"})
+                record_phase(timings, "pool_pops", start)
             except IndexError:
                 print("FATAL ERROR: Ran out of 'new' pictures in the pool!")
                 control.end()
                 sys.exit()
+            # Have the test picture ready before the test starts
+            start = time.perf_counter()
+            get_picture(new_file)
+            record_phase(timings, "picture_lookup", start)
+            yield
     
     # Create and shuffle the final test list
     test_list = []
@@ -620,13 +625,376 @@ def run_trial(trial_data, is_practice=False):
         test_list.append((pic_log, 1)) # (log, is_old=1)
     for pic_log in new_test_pics:
         test_list.append((pic_log, 0)) # (log, is_old=0)
-    random.shuffle(test_list)
+    rng.shuffle(test_list)
+    composed["test_list"] = test_list
+
+# The trial that is being built in advance (double buffering):
+# its frames are built while the current trial shows its test pictures
+# ("pictures": the files it will plot, decoded on the worker threads beforehand)
+next_composition = {"trial_id": None, "is_practice": None, "steps": None, "composed": None, "pictures": []}
+
+def start_composition(trial_data, is_practice=False, pictures=()):
+    """Queues a trial to be built during the next timed waits (pictures: the files being prefetched for it)."""
+    composed = {}
+    next_composition["pictures"] = list(pictures)
+    next_composition["trial_id"] = trial_data["trial_id"]
+    next_composition["is_practice"] = is_practice
+    next_composition["steps"] = compose_trial_steps(trial_data, is_practice, composed)
+    next_composition["composed"] = composed
+
+def advance_composition():
+    """
+    Builds one more step of the queued trial. Used as a callback while waiting.
+    Returns:
+        bool: True if there is more to build
+    """
+    if next_composition["steps"] is not None:
+        try:
+            next(next_composition["steps"])
+            return True
+        except StopIteration:
+            next_composition["steps"] = None
+    return False
+
+def finish_composition(trial_data, is_practice=False):
+    """Returns the built trial, building whatever has not been built in advance."""
+    if next_composition["trial_id"] != trial_data["trial_id"] or next_composition["is_practice"] != is_practice:
+        start_composition(trial_data, is_practice)
+    if next_composition["steps"] is not None:
+        for _ in next_composition["steps"]:
+            pass
+    composed = next_composition["composed"]
+    next_composition.update(trial_id=None, is_practice=None, steps=None, composed=None, pictures=[])
+    return composed
+
+# Refresh-locked presentation and frame timing log
+frame_timing_file = None # Set after control.start(), when the data file name is known
+n_frames_presented = 0
+n_frames_missed = 0
+refresh_ms = 1000 / REFRESH_RATE # Measured at startup (see measure_refresh_interval)
+
+def now_ms():
+    """Current time of Expyriment's high-resolution clock, in (float) milliseconds."""
+    return misc.Clock.monotonic_time() * 1000
+
+def measure_refresh_interval():
+    """
+    Measures the refresh interval of the display: the median time between
+    N_REFRESH_MEASUREMENTS screen updates, which wait for the vertical sync.
+    If the updates do not wait (no vertical sync, e.g. without OpenGL), the
+    nominal REFRESH_RATE is used instead.
+    Returns:
+        float: the refresh interval in ms
+    """
+    blank_screen = stimuli.BlankScreen()
+    blank_screen.present()
+    onsets = []
+    for _ in range(N_REFRESH_MEASUREMENTS + 1):
+        exp.screen.update()
+        onsets.append(now_ms())
+    intervals = sorted(b - a for a, b in zip(onsets, onsets[1:]))
+    median = intervals[len(intervals) // 2]
+    if median < 1000 / 500: # Faster than any monitor: the updates did not wait for the refresh
+        print(f"WARNING: Could not measure the refresh interval (no vertical sync). Assuming {REFRESH_RATE} Hz.")
+        return 1000 / REFRESH_RATE
+    print(f"Measured refresh interval: {median:.3f} ms ({1000 / median:.2f} Hz).")
+    return median
+
+def check_durations(durations):
+    """
+    Checks that every frame duration is a whole number of refreshes.
+    Returns:
+        list: a warning line for every duration that will be shown shorter or longer
+    """
+    messages = []
+    for duration in durations:
+        refreshes = max(1, round(duration / refresh_ms))
+        shown = refreshes * refresh_ms
+        if abs(shown - duration) > DURATION_TOLERANCE:
+            messages.append(f"{duration} ms is not a whole number of refreshes at {1000 / refresh_ms:.2f} Hz: "
+                            f"shown for {refreshes} refreshes ({shown:.1f} ms).")
+    return messages
+
+def start_companion_file(suffix, header, previous_data_file=None, completed_trial_ids=()):
+    """
+    Creates a companion file next to the .xpd data file (e.g. "_frame_timing.csv") and writes its header.
+    When resuming, the rows of the completed trials are first taken over from the companion file
+    of the interrupted session (previous_data_file), so the file covers the whole session.
+    The rows of a trial that was interrupted are dropped: that trial is run again.
+    Returns:
+        tuple: (path, rows taken over, as lists of strings)
+    """
+    path = os.path.join(exp.data.directory, exp.data.filename.replace(".xpd", suffix))
+    rows = []
+    if previous_data_file is not None:
+        previous_path = os.path.join(exp.data.directory, previous_data_file.replace(".xpd", suffix))
+        completed = {str(trial_id) for trial_id in completed_trial_ids}
+        try:
+            with open(previous_path, 'r', encoding='utf-8') as f:
+                rows = [line.rstrip("\n").split(",") for line in f.readlines()[1:]]
+            rows = [row for row in rows if row[0] in completed]
+        except OSError as e:
+            print(f"Warning: Could not read {os.path.basename(previous_path)} of the interrupted session: {e}")
+    # (Same file name as the interrupted session: its completed rows are written back)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(header + "\n")
+        for row in rows:
+            f.write(",".join(row) + "\n")
+    return path, rows
+
+def start_frame_timing_file(previous_data_file=None, completed_trial_ids=()):
+    """Creates the frame timing file (with the frames of the completed trials when resuming)."""
+    global frame_timing_file, n_frames_presented, n_frames_missed
+    frame_timing_file, rows = start_companion_file(
+        "_frame_timing.csv", "trial_id,duration,frame,n_value,refreshes,target_onset,actual_onset,lateness,missed",
+        previous_data_file, completed_trial_ids)
+    # The end-of-session check counts the frames of the whole session
+    n_frames_presented = len(rows)
+    n_frames_missed = sum(int(row[-1]) for row in rows)
+
+def present_rsvp_locked(trial_id, duration, rsvp_sequence, frame_n_values, end_screen, timings=None):
+    """
+    Presents the RSVP frames (and then end_screen) against absolute deadlines.
+    Each frame lasts round(duration / refresh interval) refreshes (see check_durations), counted from the
+    onset of the first frame, so presentation costs do not add up over the sequence.
+    The onset of every frame (time right after the screen update) is recorded,
+    and a frame that starts more than half a refresh after its deadline is flagged as missed.
+    Returns:
+        list: one row per frame for the timing file (times in ms relative to the first onset)
+    """
+    refreshes = max(1, round(duration / refresh_ms))
+    timing_rows = []
+    first_onset = None
+    
+    # frame 9 is the blank screen that ends frame 8
+    for frame_number, frame in enumerate(rsvp_sequence + [end_screen], start=1):
+        if first_onset is not None:
+            deadline = first_onset + (frame_number - 1) * refreshes * refresh_ms
+            # Wait until half a refresh before the deadline: the screen update then lands on it
+            remaining = deadline - refresh_ms / 2 - now_ms()
+            if remaining > 0:
+                exp.clock.wait(remaining)
+        start = time.perf_counter()
+        frame.present(clear=True, update=True)
+        onset = now_ms()
+        record_phase(timings, f"frame_{frame_number}", start)
+        if first_onset is None:
+            first_onset = onset
+            deadline = onset
+        
+        lateness = onset - deadline
+        missed = lateness > refresh_ms / 2
+        timing_rows.append([
+            trial_id,
+            duration,
+            frame_number,
+            frame_n_values[frame_number - 1] if frame_number <= len(frame_n_values) else "N/A",
+            refreshes,
+            round(deadline - first_onset, 3),
+            round(onset - first_onset, 3),
+            round(lateness, 3),
+            1 if missed else 0
+        ])
+    return timing_rows
+
+def save_frame_timing(timing_rows):
+    """Appends the timing rows of one trial to the companion timing file and counts its missed frames."""
+    global n_frames_presented, n_frames_missed
+    if frame_timing_file is None:
+        return
+    n_frames_presented += len(timing_rows)
+    n_frames_missed += sum(row[-1] for row in timing_rows)
+    with open(frame_timing_file, 'a', encoding='utf-8') as f:
+        for row in timing_rows:
+            f.write(",".join(str(x) for x in row) + "\n")
+
+# The frame durations are counted in refreshes of this display
+if REFRESH_LOCKED_PRESENTATION:
+    if not SIMULATE_PARTICIPANT:
+        refresh_ms = measure_refresh_interval()
+    duration_warnings = check_durations(DURATIONS)
+    for warning in duration_warnings:
+        print(f"TIMING WARNING: {warning}")
+
+# Per-trial timing of the hot path (see PROFILE_TRIALS)
+# The phases, in the order of the columns of the timing table (times in ms)
+PROFILE_PHASES = (["pool_pops", "picture_lookup", "compositing", "preload", "fixation"] +
+                  [f"frame_{i}" for i in range(1, 10)] + # 8 RSVP frames + the blank screen after them
+                  [f"test_{i}_{part}" for i in range(1, 9) for part in ("lookup", "present", "response", "longest_step")])
+trial_timing_file = None # Set after control.start(), when the data file name is known
+trial_timings = [] # The timings of all main trials, for the end-of-session summary
+
+def record_phase(timings, phase, start):
+    """Adds the time since 'start' (a time.perf_counter() value) to a phase. Does nothing when profiling is off."""
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0) + (time.perf_counter() - start) * 1000
+
+def start_trial_timing_file(previous_data_file=None, completed_trial_ids=()):
+    """Creates the per-trial timing table (with the completed trials when resuming)."""
+    global trial_timing_file
+    trial_timing_file, rows = start_companion_file(
+        "_trial_timing.csv", ",".join(["trial_id"] + PROFILE_PHASES), previous_data_file, completed_trial_ids)
+    # The end-of-session summary covers the whole session
+    trial_timings.clear()
+    for row in rows:
+        trial_timings.append({phase: float(value) for phase, value in zip(PROFILE_PHASES, row[1:])})
+
+def save_trial_timing(trial_id, timings):
+    """Appends one trial's phase times to the timing table."""
+    trial_timings.append(timings)
+    with open(trial_timing_file, 'a', encoding='utf-8') as f:
+        f.write(",".join([str(trial_id)] + [f"{timings.get(phase, 0):.3f}" for phase in PROFILE_PHASES]) + "\n")
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def save_timing_summary():
+    """Writes the percentiles of every phase over all main trials next to the data file."""
+    summary_file = trial_timing_file.replace("_trial_timing.csv", "_timing_summary.txt")
+    lines = [f"--- Hot-path timing over {len(trial_timings)} trials (ms) ---",
+             f"{'phase':<20}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}"]
+    for phase in PROFILE_PHASES:
+        values = sorted(timings.get(phase, 0) for timings in trial_timings)
+        lines.append(f"{phase:<20}" + "".join(f"{percentile(values, p):>10.2f}" for p in (50, 90, 99, 100)))
+    with open(summary_file, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    print(f"Timing summary saved to: {os.path.basename(summary_file)}")
+
+def is_decoded(filename):
+    """True if a picture is in the cache or has been decoded by a worker thread (get_picture will not decode it)."""
+    return filename in picture_stim_cache or (filename in picture_prefetch and picture_prefetch[filename].done())
+
+def prepare_next_trial_step():
+    """
+    One step of building the next trial, once all its pictures are decoded
+    (until then, the step does nothing: the worker threads are decoding them).
+    Returns:
+        bool: True if there is more to do
+    """
+    if next_composition["pictures"]:
+        if not all(is_decoded(filename) for filename in next_composition["pictures"]):
+            return True
+        next_composition["pictures"] = [] # All decoded (the trial may free some of them once plotted)
+    return advance_composition()
+
+# The longest preparation step so far (ms): a step only starts if more time than this is left
+longest_preparation_step = 0
 
-    for pic_log_tuple, is_old in test_list:
+def wait_and_prepare(waiting_time, prepare_step, timings=None, phase=None):
+    """
+    Waits like exp.clock.wait, and uses the time to prepare: prepare_step() does one
+    small step of preparation (it returns False once there is nothing left to do).
+    A step only starts if the time left is longer than the longest step so far
+    (and than PREPARATION_MARGIN), so that the wait ends on time.
+    The longest step of this wait is recorded in timings[phase] (when profiling).
+    """
+    end = now_ms() + waiting_time
+    state = {"work_left": True, "longest_step": 0}
+
+    def step():
+        global longest_preparation_step
+        start = now_ms()
+        if state["work_left"] and end - start > max(PREPARATION_MARGIN, longest_preparation_step):
+            state["work_left"] = prepare_step()
+            cost = now_ms() - start
+            state["longest_step"] = max(state["longest_step"], cost)
+            longest_preparation_step = max(longest_preparation_step, cost)
+
+    exp.clock.wait(waiting_time, callback_function=step)
+    if timings is not None:
+        timings[phase] = state["longest_step"]
+
+def wait_for_response(keys):
+    """
+    Waits for one of the keys, like exp.keyboard.wait, polling the keyboard in a tight loop
+    (nothing else is done while a response is timed, see wait_and_prepare).
+    The key is timestamped at the first poll that sees it. It was pressed after the previous
+    poll, so the time between the two polls is the largest possible timestamping error.
+    Returns:
+        tuple: (key, rt, rt_error) with rt in ms (like exp.keyboard.wait) and rt_error in ms
+    """
+    exp.keyboard.clear()
+    start = now_ms()
+    previous_poll = start
+    while True:
+        key = exp.keyboard.check(keys)
+        poll_time = now_ms()
+        if key is not None:
+            break
+        if exp.mouse.process_quit_event():
+            control.end()
+            sys.exit()
+        previous_poll = poll_time
+    return key, int(poll_time - start), round(poll_time - previous_poll, 1)
+
+def run_trial(trial_data, is_practice=False, next_trial_data=None):
+    """
+    Runs a single trial. Its frames have normally been built
+    during the previous trial (see finish_composition).
+    If next_trial_data is given, the next trial is decoded in the background
+    and built while this trial shows its test pictures (see wait_and_prepare).
+    """
+    trial_id = trial_data["trial_id"]
+    duration = trial_data["duration"]
+    composed = finish_composition(trial_data, is_practice)
+    final_rsvp_sequence = composed["rsvp_sequence"]
+    test_list = composed["test_list"]
+    timings = composed["timings"] # None when profiling is off
+
+    # This trial has popped all its pictures: the pools now end with the next trial's pictures
+    if next_trial_data is not None:
+        upcoming_pictures = [] if is_practice else get_upcoming_pictures(next_trial_data)
+        prefetch_pictures(upcoming_pictures)
+        start_composition(next_trial_data, is_practice, upcoming_pictures)
+
+    # 5b. Run the RSVP Sequence 
+    blank_screen = stimuli.BlankScreen()
+    blank_screen.preload()
+    exp.screen.clear()
+    exp.screen.update()
+    
+    # Present fixation cross
+    start = time.perf_counter()
+    stimuli.FixCross(size=(20, 20), line_width=3, colour=misc.constants.C_WHITE).present()
+    exp.clock.wait(500) # 500ms fixation
+    record_phase(timings, "fixation", start)
+
+    if REFRESH_LOCKED_PRESENTATION:
+        # Frames 1 and 8 are mask-only (N=0)
+        frame_n_values = [0] + list(trial_data["n_values"]) + [0]
+        timing_rows = present_rsvp_locked(trial_id, duration, final_rsvp_sequence, frame_n_values, blank_screen, timings)
+        if not is_practice:
+            save_frame_timing(timing_rows)
+    else:
+        for frame_number, frame in enumerate(final_rsvp_sequence + [blank_screen], start=1):
+            start = time.perf_counter()
+            frame.present(clear=True, update=True)
+            record_phase(timings, f"frame_{frame_number}", start)
+            if frame is not blank_screen:
+                exp.clock.wait(duration)
+    # Build the next trial during the pause before the test
+    wait_and_prepare(TEST_PAUSE_DURATION, prepare_next_trial_step)
+
+    trial_rows = [] # The data rows of this trial, for the session journal
+    for item_number, (pic_log_tuple, is_old) in enumerate(test_list, start=1):
         pic_log = pic_log_tuple
         filename = pic_log["file"]
+        next_filename = test_list[item_number][0]["file"] if item_number < len(test_list) else None
+
+        def prepare_step():
+            """One step of preparation: first the next test picture, then the next trial's frames."""
+            if not is_practice and next_filename is not None and next_filename not in picture_stim_cache:
+                if is_decoded(next_filename):
+                    get_picture(next_filename) # Only preloads it
+                else:
+                    prefetch_pictures([next_filename]) # Decoded on a worker thread meanwhile
+                return True
+            return prepare_next_trial_step()
         
         # Present the test picture (centered)
+        start = time.perf_counter()
         if is_practice:
             if is_old:
                 test_stim = get_practice_picture("N=...")
@@ -634,18 +1002,28 @@ def run_trial(trial_data, is_practice=False):
                 test_stim = get_practice_picture("Practice New")
         else:
             test_stim = get_picture(filename)
+        record_phase(timings, f"test_{item_number}_lookup", start)
             
+        start = time.perf_counter()
         test_stim.reposition((0, 0))
         test_stim.present(clear=True, update=True)
-        exp.clock.wait(TEST_PIC_DURATION)
+        record_phase(timings, f"test_{item_number}_present", start)
+        # The next test picture and the next trial are prepared, step by step, while the picture is shown
+        wait_and_prepare(TEST_PIC_DURATION, prepare_step, timings, f"test_{item_number}_longest_step")
 
-        # Present blank screen until response
+        # Present blank screen until response (only the keyboard is polled: the RT is not delayed)
         stimuli.BlankScreen().present(clear=True, update=True)
-        key, rt = exp.keyboard.wait(keys=[K_y, K_n])
+        start = time.perf_counter()
+        if SIMULATE_PARTICIPANT:
+            key, rt = simulate_response(is_old, pic_log["n_value"], duration)
+            rt_error = 0
+        else:
+            key, rt, rt_error = wait_for_response([K_y, K_n])
+        record_phase(timings, f"test_{item_number}_response", start)
 
         if not is_practice:
             correct = (key == K_y and is_old) or (key == K_n and not is_old)
-            exp.data.add([
+            row = [
                 trial_id,
                 duration,
                 filename,
@@ -654,31 +1032,116 @@ def run_trial(trial_data, is_practice=False):
                 pic_log["quadrant"],
                 key,
                 rt,
-                1 if correct else 0
-            ])
+                1 if correct else 0,
+                rt_error
+            ]
+            exp.data.add(row)
+            trial_rows.append(row)
+            record_response(session_results, duration, is_old, pic_log["n_value"], key, 1 if correct else 0)
+            # Last use of this picture (unless the plan reuses the file later)
+            release_picture(filename)
+
+    if not is_practice:
+        # The trial is complete: a crash from now on resumes at the next trial
+        add_trial(journal_path, trial_id, trial_rows)
+    if timings is not None and not is_practice:
+        save_trial_timing(trial_id, timings)
 
 # 5. Run Experiment Flow 
 
-control.start(skip_ready_screen=True)
+# Load this participant's plan (or generate it, now that the subject ID is known)
+def load_participant_plan(subject_id):
+    """
+    Returns the participant's plan: the plan of their interrupted session if there is
+    a journal, otherwise the one pre-generated with CORE1_plans.py if there is one,
+    otherwise a new plan from a fresh seed, which is saved next to the data file
+    so it can be audited later.
+    Returns:
+        tuple: (plan, completed_trials), completed_trials being the journal records
+               of the trials already run (empty for a new session)
+    """
+    journal = read_journal(journal_path)
+    if journal is not None:
+        plan, completed_trials = journal
+        print(f"Resuming the interrupted session of subject {subject_id} after {len(completed_trials)} trials...")
+        return plan, completed_trials
+
+    plan_path = get_plan_path(subject_id)
+    if os.path.isfile(plan_path):
+        print(f"Loading the pre-generated plan {os.path.basename(plan_path)}...")
+        return load_plan(plan_path), []
+    
+    seed = random.randrange(2**32)
+    print(f"No pre-generated plan for subject {subject_id}. Generating one (seed {seed})...")
+    plan = generate_plan(subject_id, seed, N_SUPER_BLOCKS_TO_RUN, all_pic_files, verbose=True)
+    save_plan(plan, os.path.join(exp.data.directory, exp.data.filename.replace(".xpd", "_plan.json.gz")))
+    return plan, []
 
-# Instructions
-stimuli.TextScreen(
-    "Welcome to the Experiment",
-    ("You will see a series of rapidly presented pictures.\n\n"
-     "Please watch carefully and try to remember them.\n\n"
-     "After each sequence, you will be given a memory test.\n"
-     "Several pictures will be shown one by one.\n\n"
-     "--- TEST INSTRUCTIONS ---\n"
-     "1. A picture will FLASH for a very short time (400ms).\n"
-     "2. The screen will then go BLANK.\n"
-     "3. *When the screen is blank*, please respond:\n\n"
-     "Press 'y' for YES (you saw it in the sequence).\n"
-     "Press 'n' for NO (you did not see it).\n\n"
-     "We will begin with 3 practice trials.\n\nPress any key to start."),
-    text_size=24,
-    text_justification=0
-).present()
-exp.keyboard.wait()
+def apply_participant_plan(participant_plan, completed_trials):
+    """
+    Checks the participant's plan and makes it the plan of the session
+    (trial list, quadrant pools, picture pools and picture use counts).
+    For a resumed session, the completed trials are skipped: their pictures and
+    quadrant combos are taken off the pools and their data rows are added again.
+    """
+    global experiment_plan, master_quadrant_pools, old_pics_pool, new_pics_pool, session_seed, first_trial_index
+    if participant_plan["n_super_blocks"] != N_SUPER_BLOCKS_TO_RUN:
+        print(f"FATAL ERROR: The plan has {participant_plan['n_super_blocks']} Super-Blocks, but N_SUPER_BLOCKS_TO_RUN is {N_SUPER_BLOCKS_TO_RUN}.")
+        control.end()
+        sys.exit()
+    missing_pics = set(participant_plan["old_pics_pool"] + participant_plan["new_pics_pool"]) - set(all_pic_files)
+    if missing_pics:
+        print(f"FATAL ERROR: {len(missing_pics)} pictures of the plan are missing or broken, e.g. {sorted(missing_pics)[0]}.")
+        control.end()
+        sys.exit()
+
+    if [record["trial_id"] for record in completed_trials] != [trial["trial_id"] for trial in participant_plan["trials"][:len(completed_trials)]]:
+        print(f"FATAL ERROR: The journal {os.path.basename(journal_path)} does not match its plan.")
+        control.end()
+        sys.exit()
+
+    if completed_trials:
+        add_resume(journal_path, exp.data.filename, len(completed_trials))
+        exp.data.add_experiment_info(f"Resumed after {len(completed_trials)} trials (journal {os.path.basename(journal_path)})")
+        # The completed rows are added to this data file below: the interrupted run's file
+        # must not be counted as another subject by the analysis scripts
+        if previous_data_file is not None and previous_data_file != exp.data.filename:
+            superseded = supersede_data_file(exp.data.directory, previous_data_file)
+            if superseded is not None:
+                print(f"The data file of the interrupted run was renamed {superseded}.")
+                exp.data.add_experiment_info(f"Replaces {previous_data_file} (renamed {superseded})")
+    else:
+        # The plan as it is before the first trial: a crash can resume from it
+        start_journal(journal_path, participant_plan, exp.data.filename)
+
+    experiment_plan = participant_plan["trials"]
+    master_quadrant_pools = participant_plan["quadrant_pools"]
+    old_pics_pool = participant_plan["old_pics_pool"]
+    new_pics_pool = participant_plan["new_pics_pool"]
+
+    # The pools are popped from the end, in plan order: drop what the completed trials used
+    first_trial_index = len(completed_trials)
+    for trial_data in experiment_plan[:first_trial_index]:
+        for n in trial_data["n_values"]:
+            if n > 0:
+                master_quadrant_pools[n].pop()
+        del old_pics_pool[len(old_pics_pool) - sum(trial_data["n_values"]):]
+        del new_pics_pool[len(new_pics_pool) - 4:]
+    # The completed trials' data go into this session's data file and results too
+    for record in completed_trials:
+        for row in record["rows"]:
+            exp.data.add(row)
+            # row: trial_id, duration, test_pic_file, is_old, n_value, quadrant, response_key, rt, correct, ...
+            record_response(session_results, row[1], row[3], row[4], row[6], row[8])
+
+    print(f"Loaded {len(old_pics_pool)} 'old' pictures and {len(new_pics_pool)} 'new' pictures.")
+    picture_uses_left.update(old_pics_pool)
+    picture_uses_left.update(new_pics_pool)
+
+    # The choices made during the session (mask layer of each frame, Role B pictures, test order)
+    # also follow from the plan's seed
+    session_seed = participant_plan["seed"]
+    random.seed(f"{session_seed}:session")
 
 # Practice Trials (using a "dummy" trial plan)
 practice_plan = [
@@ -686,85 +1149,299 @@ practice_plan = [
     {"trial_id": -2, "duration": 400, "n_values": [4, 0, 0, 1, 0, 1]},
     {"trial_id": -3, "duration": 400, "n_values": [0, 2, 0, 2, 0, 2]},
 ]
-for trial in practice_plan:
-    run_trial(trial, is_practice=True)
-
-# Main Experiment
-stimuli.TextScreen(
-    "Practice Complete",
-    "The main experiment will now begin.\n\n" +
-    "The rules are the same as in the practice.\n" +
-    "Remember: Respond *after* the picture disappears, when the screen is blank.\n\n" +
-    "Please try your best to remember the pictures.\n\nPress any key to start.",
-    text_size=24,
-    text_justification=0
-).present()
-exp.keyboard.wait()
-
-
-for i, trial in enumerate(experiment_plan):
-    run_trial(trial, is_practice=False)
-    
-    # Rest breaks every 15 trials (if running full 75 trials)
-    if N_TRIALS > 5: # Only add breaks if not in a short test mode
-        if (i + 1) % 15 == 0 and (i + 1) < N_TRIALS:
-            stimuli.TextScreen(
-                "Rest Break",
-                f"You have completed {i+1} / {N_TRIALS} trials.\n\n" +
-                "Please take a short break.\n\nPress any key to continue.",
-                text_size=24,
-                text_justification=0
-            ).present()
-            exp.keyboard.wait()
 
+# What is prepared while the participant reads the instructions
+startup = {"plan_applied": False, "pictures_to_load": []}
 
+def prepare_first_trials():
+    """
+    Applies the plan, then starts decoding the first main trial's pictures
+    and queues the first practice trial (or, when resuming, the next main trial) to be built.
+    """
+    try:
+        participant_plan, completed_trials = plan_future.result()
+    except Exception as e:
+        print(f"FATAL ERROR during plan generation: {e}")
+        control.end()
+        sys.exit()
+    apply_participant_plan(participant_plan, completed_trials)
+    startup["plan_applied"] = True
+    if first_trial_index < len(experiment_plan):
+        startup["pictures_to_load"] = get_upcoming_pictures(experiment_plan[first_trial_index])
+        prefetch_pictures(startup["pictures_to_load"])
+    if resuming:
+        # No practice when resuming: the next main trial comes first
+        if first_trial_index < len(experiment_plan):
+            start_composition(experiment_plan[first_trial_index])
+    else:
+        start_composition(practice_plan[0], is_practice=True)
+
+def advance_startup():
+    """
+    Callback while the instructions are shown: applies the plan as soon as it is loaded,
+    then makes the first main trial's pictures resident (one per call, as soon as
+    they are decoded) and builds the first practice trial frame by frame.
+    """
+    if not startup["plan_applied"]:
+        if plan_future.done():
+            prepare_first_trials()
+        return
+    for filename in startup["pictures_to_load"]:
+        if filename in picture_prefetch and picture_prefetch[filename].done():
+            get_picture(filename) # Preloaded and kept in the cache until its last use
+            return
+    advance_composition()
+
+def finish_startup():
+    """Waits for whatever has not been prepared during the instructions (the rest is done by run_trial)."""
+    if not startup["plan_applied"]:
+        prepare_first_trials()
+    not_resident = [f for f in startup["pictures_to_load"] if f not in picture_stim_cache]
+    print(f"Startup: {len(startup['pictures_to_load']) - len(not_resident)} / {len(startup['pictures_to_load'])} "
+          f"pictures of the first trial resident, first trial "
+          f"{'built' if next_composition['steps'] is None else 'partly built'} when the instructions ended.")
+
+def run_session():
+    """
+    Runs the session of the participant whose data file was opened by control.start():
+    plan, instructions, practice, main trials, analysis and verification.
+    With SESSION_LOOP, the data file is saved and Expyriment is ended by start_next_participant.
+    """
+    global journal_path, resuming, previous_data_file, session_seed, first_trial_index, plan_future, session_results
+    # Nothing of the previous participant is kept (session loop), except the stimulus store
+    for key in list(picture_stim_cache):
+        evict_picture(key)
+    picture_prefetch.clear()
+    picture_uses_left.clear()
+    startup.update(plan_applied=False, pictures_to_load=[])
+    session_results = create_results()
+
+    # The session journal of this participant. If it is still there, the last session was interrupted:
+    # it is resumed at the next trial, with the same plan and the same remaining pools
+    journal_path = get_journal_path(exp.subject)
+    resuming = os.path.isfile(journal_path)
+    # The data file of the interrupted run (read before this run is added to the journal)
+    previous_data_file = get_last_data_file(journal_path) if resuming else None
+    session_seed = None # Set by apply_participant_plan
+    first_trial_index = 0 # Index of the first main trial to run (> 0 when resuming)
+
+    # The plan is loaded (or generated) on a worker thread while the instructions are shown
+    plan_future = startup_executor.submit(load_participant_plan, exp.subject)
+
+    if REFRESH_LOCKED_PRESENTATION:
+        # The durations actually shown are documented in the data file
+        exp.data.add_experiment_info(f"Refresh interval: {refresh_ms:.3f} ms ({1000 / refresh_ms:.2f} Hz)")
+        for warning in duration_warnings:
+            exp.data.add_experiment_info(f"TIMING WARNING: {warning}")
+
+    # Instructions
+    if resuming:
+        instructions_title = "Welcome Back"
+        instructions_end = "The experiment will continue where it stopped.\n\nPress any key to continue."
+    else:
+        instructions_title = "Welcome to the Experiment"
+        instructions_end = "We will begin with 3 practice trials.\n\nPress any key to start."
+    stimuli.TextScreen(
+        instructions_title,
+        ("You will see a series of rapidly presented pictures.\n\n"
+         "Please watch carefully and try to remember them.\n\n"
+         "After each sequence, you will be given a memory test.\n"
+         "Several pictures will be shown one by one.\n\n"
+         "--- TEST INSTRUCTIONS ---\n"
+         "1. A picture will FLASH for a very short time (400ms).\n"
+         "2. The screen will then go BLANK.\n"
+         "3. *When the screen is blank*, please respond:\n\n"
+         "Press 'y' for YES (you saw it in the sequence).\n"
+         "Press 'n' for NO (you did not see it).\n\n" +
+         instructions_end),
+        text_size=24,
+        text_justification=0
+    ).present()
+
+    # Prepare the plan, the first main trial's pictures and the first practice trial while the participant reads
+    exp.keyboard.wait(callback_function=advance_startup)
+    finish_startup()
+
+    # The timing files (when resuming, with the rows of the trials completed before the interruption)
+    completed_trial_ids = [trial["trial_id"] for trial in experiment_plan[:first_trial_index]]
+    if REFRESH_LOCKED_PRESENTATION:
+        start_frame_timing_file(previous_data_file, completed_trial_ids)
+    if PROFILE_TRIALS:
+        start_trial_timing_file(previous_data_file, completed_trial_ids)
+
+    if not resuming:
+        for i, trial in enumerate(practice_plan):
+            next_trial = practice_plan[i + 1] if i + 1 < len(practice_plan) else None
+            run_trial(trial, is_practice=True, next_trial_data=next_trial)
+        evict_practice_pictures()
+
+        # Main Experiment
+        stimuli.TextScreen(
+            "Practice Complete",
+            "The main experiment will now begin.\n\n" +
+            "The rules are the same as in the practice.\n" +
+            "Remember: Respond *after* the picture disappears, when the screen is blank.\n\n" +
+            "Please try your best to remember the pictures.\n\nPress any key to start.",
+            text_size=24,
+            text_justification=0
+        ).present()
+        # Build the first main trial while the participant reads
+        if experiment_plan:
+            start_composition(experiment_plan[0])
+        exp.keyboard.wait(callback_function=advance_composition)
+
+
+    session_start_time = time.perf_counter()
+    # (A resumed session starts after the trials completed before the interruption)
+    for i, trial in enumerate(experiment_plan[first_trial_index:], start=first_trial_index):
+        next_trial = experiment_plan[i + 1] if i + 1 < len(experiment_plan) else None
+        run_trial(trial, is_practice=False, next_trial_data=next_trial)
+    
+        # Rest breaks every 15 trials (if running full 75 trials)
+        if N_TRIALS > 5: # Only add breaks if not in a short test mode
+            if (i + 1) % 15 == 0 and (i + 1) < N_TRIALS:
+                # Running accuracy for the experimenter (console only)
+                print(f"Rest break after {i+1} / {N_TRIALS} trials. Accuracy so far: {get_running_accuracy(session_results):.2f}%")
+                stimuli.TextScreen(
+                    "Rest Break",
+                    f"You have completed {i+1} / {N_TRIALS} trials.\n\n" +
+                    "Please take a short break.\n\nPress any key to continue.",
+                    text_size=24,
+                    text_justification=0
+                ).present()
+                exp.keyboard.wait(callback_function=advance_composition)
+
+
+    session_elapsed = time.perf_counter() - session_start_time
+
+    # 6. End Experiment, Analyze & Verify
+
+    #  get the full path of the data file 
+    data_file_path = os.path.join(exp.data.directory, exp.data.filename)
+
+    # Analysis before ending the experiment 
+    if N_TRIALS > 0: # Only run analysis if we ran real trials (not 0)
+        print("Running analysis...")
+        analyze_data(data_file_path, session_results)
+    
+        # Create the final text to show the participant
+        final_goodbye_text = "Experiment complete. Thank you!"
+    else:
+        # This just handles the case where N_SUPER_BLOCKS_TO_RUN was set to 0
+        print("No trials run, skipping analysis.")
+        final_goodbye_text = "Experiment complete."
+
+
+    if SESSION_LOOP:
+        # Show the goodbye text and save the data file; Expyriment is ended
+        # after asking the experimenter about the next participant (start_next_participant)
+        stimuli.TextLine(final_goodbye_text, text_size=int(exp.text_size * 1.2),
+                         text_colour=misc.constants.C_EXPYRIMENT_PURPLE).present()
+        exp.clock.wait(5000)
+        exp.data.save()
+    else:
+        # We end the Expyriment session, which finalizes and closes the data file
+        # We pass our feedback string to the 'goodbye_text'
+        # and add a 5-second delay so the user can read it.
+        control.end(goodbye_text=final_goodbye_text, goodbye_delay=0 if SIMULATE_PARTICIPANT else 5000)
+
+    # The session is complete: the journal is kept, but a new session for this subject starts from scratch
+    close_journal(journal_path)
+
+
+    # Verification (as PDF) 
+    # This final check runs in the console (not the experiment window)
+    print("\n--- Experiment Finished. Verifying balance... ---")
+    # Check if all the "Big Buckets" for quadrants are empty
+    if all(len(pool) == 0 for pool in master_quadrant_pools.values()):
+        print("VERIFICATION SUCCESS: All master pools are empty.")
+        print("All balanced items were used exactly once.")
+    else:
+        # If a bucket is not empty, something went wrong in our logic
+        print("VERIFICATION FAILED: Some master pools still have items.")
+        for n, pool in master_quadrant_pools.items():
+            if len(pool) > 0:
+                print(f"  Pool N={n} has {len(pool)} items left.")
+
+    # Check if the picture "Big Buckets" are empty
+    if len(old_pics_pool) > 0:
+        print(f"VERIFICATION FAILED: {len(old_pics_pool)} 'old' pictures were left unused.")
+    if len(new_pics_pool) > 0:
+        print(f"VERIFICATION FAILED: {len(new_pics_pool)} 'new' pictures were left unused.")
+
+    # Hot-path timing summary
+    if PROFILE_TRIALS and trial_timings:
+        save_timing_summary()
+
+    # Throughput of the simulated session
+    if SIMULATE_PARTICIPANT:
+        n_trials_run = N_TRIALS - first_trial_index
+        print(f"SIMULATION: {n_trials_run} trials in {session_elapsed:.2f} s ({n_trials_run / session_elapsed:.1f} trials/s).")
+
+    # Check that the picture cache was emptied as the plan went along
+    if len(picture_stim_cache) == 0:
+        print("CACHE OK: All pictures were freed after their last use.")
+    else:
+        print(f"CACHE WARNING: {len(picture_stim_cache)} pictures are still cached ({sum(picture_cache_bytes.values()) / 1e6:.1f} MB).")
+
+    # Check the frame timing of the RSVP sequences
+    if REFRESH_LOCKED_PRESENTATION:
+        for warning in duration_warnings:
+            print(f"TIMING WARNING: {warning}")
+        if n_frames_missed == 0:
+            print(f"TIMING OK: All {n_frames_presented} frames started on their deadline.")
+        else:
+            print(f"TIMING WARNING: {n_frames_missed} of {n_frames_presented} frames missed their deadline.")
+            print(f"  See {os.path.basename(frame_timing_file)} for details.")
 
-# 6. End Experiment, Analyze & Verify
+    print("-------------------------------------------------")
 
-#  get the name of the data file 
-data_file_path = exp.data.filename
+def start_next_participant():
+    """
+    Session loop: asks the experimenter whether another participant follows, then ends
+    Expyriment. If another participant follows, Expyriment is initialised and started again
+    (new window, subject ID and data file). The stimulus manifest, the stimulus store
+    and the worker threads are kept; the masks are created again for the new window.
+    Returns:
+        bool: True if the next session can start, False if the experimenter quits
+    """
+    stimuli.TextScreen(
+        "Session Complete",
+        f"The data of subject {exp.subject} are saved.\n\n" +
+        "Press ENTER for the next participant,\nor Q to quit.",
+        text_size=24,
+        text_justification=0
+    ).present()
+    key, _ = exp.keyboard.wait([misc.constants.K_RETURN, misc.constants.K_q])
+    # Nothing drawn in this window may be used after control.end()
+    for cache_key in list(picture_stim_cache):
+        evict_picture(cache_key)
+    control.end(goodbye_delay=0)
+    if key == misc.constants.K_q:
+        return False
+    initialize_display()
+    create_masks()
+    control.start(skip_ready_screen=True)
+    return True
 
-# Analysis before ending the experiment 
-if N_TRIALS > 0: # Only run analysis if we ran real trials (not 0)
-    print("Running analysis...")
-    feedback_summary = analyze_data(data_file_path)
-    
-    # Create the final text to show the participant
-    final_goodbye_text = (f"Experiment complete. Thank you!")
-else:
-    # This just handles the case where N_SUPER_BLOCKS_TO_RUN was set to 0
-    print("No trials run, skipping analysis.")
-    feedback_summary = "No trials run."
-    final_goodbye_text = "Experiment complete."
-
-
-# We end the Expyriment session, which finalizes and closes the data file
-# We pass our feedback string to the 'goodbye_text'
-# and add a 5-second delay so the user can read it.
-control.end(goodbye_text=final_goodbye_text, goodbye_delay=5000)
-
-
-# Verification (as PDF) 
-# This final check runs in the console (not the experiment window)
-print("\n--- Experiment Finished. Verifying balance... ---")
-# Check if all the "Big Buckets" for quadrants are empty
-if all(len(pool) == 0 for pool in master_quadrant_pools.values()):
-    print("VERIFICATION SUCCESS: All master pools are empty.")
-    print("All balanced items were used exactly once.")
-else:
-    # If a bucket is not empty, something went wrong in our logic
-    print("VERIFICATION FAILED: Some master pools still have items.")
-    for n, pool in master_quadrant_pools.items():
-        if len(pool) > 0:
-            print(f"  Pool N={n} has {len(pool)} items left.")
-
-# Check if the picture "Big Buckets" are empty
-if len(old_pics_pool) > 0:
-    print(f"VERIFICATION FAILED: {len(old_pics_pool)} 'old' pictures were left unused.")
-if len(new_pics_pool) > 0:
-    print(f"VERIFICATION FAILED: {len(new_pics_pool)} 'new' pictures were left unused.")
-
-print("-------------------------------------------------")
+control.start(skip_ready_screen=True)
+n_sessions = 0
+while True:
+    run_session()
+    n_sessions += 1
+    if not SESSION_LOOP:
+        break
+    if n_sessions == MAX_SESSIONS:
+        # The goodbye text was shown after the last session
+        control.end(goodbye_delay=0)
+        break
+    if not start_next_participant():
+        break
+    print(f"SESSION LOOP: subject {exp.subject} is the participant {n_sessions + 1} of this run.")
+
+# No more pictures to decode: stop the worker threads
+prefetch_executor.shutdown(wait=False, cancel_futures=True)
+startup_executor.shutdown(wait=False)
 # END NEW SCRIPT
 
 
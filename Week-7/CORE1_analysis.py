@@ -0,0 +1,188 @@
+"""
+Data analysis for CORE1_Project1_1101.py (Potter & Fox (2009) Experiment 2).
+
+The result tables are updated after every response of the memory test
+(record_response), so the summary report (analyze_data) is ready as soon
+as the last trial ends, without re-reading the data file.
+Kept in its own module so that the benchmarks (CORE1_benchmark.py) can run it
+without starting an experiment.
+"""
+
+import os
+from collections import defaultdict
+
+# The 'y' key means "Yes, I saw this picture"
+try:
+    from expyriment.misc.constants import K_y
+except ImportError:
+    K_y = 121
+
+# d', c and A' with bootstrap confidence intervals (needs NumPy)
+try:
+    from CORE1_sdt import session_sdt_report
+except ImportError:
+    session_sdt_report = None
+
+
+def create_results():
+    """
+    Creates the empty result tables. They are updated after every response
+    (see record_response), so the summary is ready as soon as the last trial ends.
+    """
+    # We use defaultdict to make it easy to add new keys without checking if they exist
+    # e.g., results["n_value"]['1'][240]['hits'] = 0
+    return {
+        # This stores Hit Rates, grouped by N-Value, then by Duration
+        # results["n_value"][n_value][duration] = {'hits': 0, 'total_old': 0}
+        "n_value": defaultdict(lambda: defaultdict(lambda: {'hits': 0, 'total_old': 0})),
+        # This stores False Alarms, grouped by Duration
+        # results["duration"][duration] = {'false_alarms': 0, 'total_new': 0}
+        "duration": defaultdict(lambda: {'false_alarms': 0, 'total_new': 0}),
+        # These are for the simple, overall accuracy score
+        "total_correct": 0,
+        "total_responses": 0
+    }
+
+
+def record_response(results, duration, is_old, n_value, response_key, correct):
+    """Adds one response of the memory test to the result tables."""
+    # We are processing one response
+    results["total_responses"] += 1
+    
+    # Add to the overall accuracy count
+    if correct == 1:
+        results["total_correct"] += 1
+
+    # Now, sort this response into the correct bucket
+    if is_old == 1:
+        # This was an "old" picture (Role A or B)
+        # We store its data based on its N-Value (as a string '1'-'4') and Duration
+        n_data = results["n_value"][str(n_value)][duration]
+        
+        # 'hits' = participant correctly pressed 'y'
+        if response_key == K_y:
+            n_data['hits'] += 1
+        
+        # 'total_old' = this was an "old" picture
+        n_data['total_old'] += 1
+    
+    elif is_old == 0:
+        # This was a "new" picture (Role C)
+        # The paper groups these by *duration only*
+        
+        # 'false_alarms' = participant incorrectly pressed 'y'
+        if response_key == K_y:
+            results["duration"][duration]['false_alarms'] += 1
+        
+        # 'total_new' = this was a "new" picture
+        results["duration"][duration]['total_new'] += 1
+
+
+def get_running_accuracy(results):
+    """Returns the overall accuracy (%) of the responses recorded so far."""
+    if results["total_responses"] == 0:
+        return 0
+    return (results["total_correct"] / results["total_responses"]) * 100
+
+
+def analyze_data(data_file_path, results, with_sdt=True):
+    """
+    Builds the summary report from the result tables collected during the session,
+    saves it next to the data file, and returns a summary string.
+    with_sdt=False leaves out the signal-detection part (its bootstrap is by far
+    the slowest part of the report; the benchmarks time it on its own).
+    """
+    results_n_value = results["n_value"]
+    results_duration = results["duration"]
+    total_correct = results["total_correct"]
+    total_responses = results["total_responses"]
+
+    try:
+        # Create a list of strings that we will join together at the end
+        report = []
+        report.append("--- Experiment 2 Summary Report ---")
+        report.append(f"Data file: {os.path.basename(data_file_path)}")
+        report.append("\n")
+        
+        # Calculate overall percentage
+        overall_percent = get_running_accuracy(results)
+        report.append(f"Overall Accuracy (All Responses): {overall_percent:.2f}% ({total_correct} / {total_responses})")
+        report.append("\n" + "="*40 + "\n")
+
+        # Part 1: Hit Rate by N-Value (This is Figure 3 from the paper) 
+        report.append("Hit Rate (% 'Yes' to OLD pictures) by N-Value (All Durations Combined):")
+        
+        # Get the keys '1', '2', '3', '4' and sort them numerically
+        valid_n_values = sorted([k for k in results_n_value.keys() if str(k).isdigit()], key=int)
+        
+        for n_value in valid_n_values:
+            n_hits = 0
+            n_total = 0
+            # Sum up hits and totals from all durations (240, 400, 720) for this n_value
+            for data in results_n_value[str(n_value)].values():
+                n_hits += data['hits']
+                n_total += data['total_old']
+            
+            # Calculate percentage
+            n_percent = (n_hits / n_total) * 100 if n_total > 0 else 0
+            report.append(f"  N={n_value} Frames: {n_percent:.2f}% ({n_hits} / {n_total})")
+
+        report.append("\n" + "="*40 + "\n")
+
+        # Part 2: Hit Rate by Duration (Also in Figure 3) 
+        report.append("Hit Rate (% 'Yes' to OLD pictures) by Duration (All N-Values Combined):")
+        
+        # Get the keys 240, 400, 720 and sort them
+        sorted_durations = sorted(results_duration.keys())
+        for dur in sorted_durations:
+            dur_hits = 0
+            dur_total_old = 0
+            # We have to sum this up from the *other* dictionary (results_n_value)
+            for n_data in results_n_value.values():
+                if dur in n_data:
+                    dur_hits += n_data[dur]['hits']
+                    dur_total_old += n_data[dur]['total_old']
+            
+            dur_percent = (dur_hits / dur_total_old) * 100 if dur_total_old > 0 else 0
+            report.append(f"  {dur} ms: {dur_percent:.2f}% ({dur_hits} / {dur_total_old})")
+
+        report.append("\n" + "="*40 + "\n")
+
+        # Part 3: False Alarm Rate by Duration (The other line in Figure 3) 
+        report.append("False Alarm Rate (% 'Yes' to NEW pictures) by Duration:")
+        for dur in sorted_durations:
+            fa_hits = results_duration[dur]['false_alarms']
+            fa_total = results_duration[dur]['total_new']
+            
+            # Calculate percentage
+            fa_percent = (fa_hits / fa_total) * 100 if fa_total > 0 else 0
+            report.append(f"  {dur} ms: {fa_percent:.2f}% ({fa_hits} / {fa_total})")
+
+        # Part 4: Signal Detection (d', c, A') by N-Value x Duration
+        if with_sdt and session_sdt_report is not None:
+            report.append("\n" + "="*40 + "\n")
+            report.extend(session_sdt_report(results_n_value, results_duration))
+
+        report.append("\n\n--- End of Report ---")
+
+        # Save the report to a new file 
+        
+        # Join all the report lines into one big string
+        report_content = "\n".join(report)
+        
+        # Create a new filename, e.g., "my_data.xpd" -> "my_data_summary.txt"
+        report_filename = data_file_path.replace(".xpd", "_summary.txt")
+        
+        # Write the report content to the new text file
+        with open(report_filename, 'w', encoding='utf-8') as f:
+            f.write(report_content)
+        
+        print(f"Analysis complete. Summary saved to: {os.path.basename(report_filename)}")
+        
+        # Return the simple string for the final on-screen feedback
+        return f"Overall Accuracy: {overall_percent:.2f}%"
+
+    except Exception as e:
+        # Handle any unexpected analysis errors
+        print(f"Error during analysis: {e}")
+        return "Analysis could not be completed."
@@ -0,0 +1,279 @@
+"""
+Monte-Carlo audit of the CORE1 counterbalancing (CORE1_plans.py).
+
+Generates many participants' plans with the real create_experiment_plan and
+create_master_pools (the same seeds and the same order of random calls as
+generate_plan), encodes each plan as integer arrays:
+- durations:  (trials,)          duration index (0 = 240, 1 = 400, 2 = 720 ms)
+- n_values:   (trials, frames)   N-value of every frame
+- quadrants:  (trials, frames)   bit mask of the quadrants of every frame
+                                 (bit 0 = quadrant 1), the pools being popped
+                                 in trial and frame order as in run_trial
+and computes the statistics with NumPy on whole chunks of plans:
+
+Part 1 - Within-plan balance: the share of plans in which the durations,
+    the N-value inventory, the quadrants of every N-value and the
+    duration x N-value cells are exactly balanced (with the spread of the cells).
+Part 2 - Bias across participants: the mean of every duration x N-value x quadrant
+    cell over all plans vs. its expected value (z = bias / standard error).
+Part 3 - Order effects: trial position x duration, trial position x trial type,
+    frame position x N-value, trial and frame position x quadrant (chi-square
+    against the expected shares, z = (chi2 - df) / sqrt(2 df)), and how often
+    consecutive trials repeat a duration or a trial type.
+|z| > Z_FLAG is flagged. With many plans a real bias shows up as a large |z|.
+For the chi-square tests only z > Z_FLAG is a bias: a chi2 below df is expected
+when the pools balance a plan exactly (e.g. the quadrants), because the positions
+then vary less than with independent draws.
+
+The plans are generated in chunks by worker processes (generating a plan is
+pure Python and takes most of the time). Measured on one core: about 2200
+plans/s generated and analysed, so 100000 plans take about 45 s; more cores
+divide this roughly by their number. The report ends with the measured rate.
+The report is printed and saved in the 'plans' folder.
+
+Usage:
+    python CORE1_audit.py [N_PLANS] [N_SUPER_BLOCKS] [STUDY_SEED]
+(default: 100000 plans of 15 Super-Blocks, study seed 'CORE1')
+"""
+
+import os
+import sys
+import time
+import random
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from CORE1_plans import (DEFAULT_N_SUPER_BLOCKS, DURATIONS, PLANS_FOLDER, QUADRANTS,
+                         get_super_block_prototype, get_inventory, get_subject_seed,
+                         create_experiment_plan, create_master_pools)
+
+N_PLANS = 100000
+CHUNK_SIZE = 1000 # Plans per worker job
+DEFAULT_STUDY_SEED = "CORE1"
+Z_FLAG = 4 # |z| above this is reported as a possible bias
+
+# The statistics of chunk_statistics with one row per plan (the others are summed over the plans)
+PER_PLAN_STATISTICS = ["durations", "n_frames", "n_quadrant", "duration_n", "duration_n_quadrant",
+                       "duration_repeats", "type_repeats"]
+
+# Bit mask of every quadrant, and of every quadrant ticket, e.g. (1, 3) -> 0b0101
+QUADRANT_BITS = np.array([1 << (q - 1) for q in QUADRANTS], dtype=np.uint8)
+TICKET_MASKS = {ticket: sum(1 << (q - 1) for q in ticket)
+                for n in range(1, len(QUADRANTS) + 1) for ticket in itertools.combinations(QUADRANTS, n)}
+
+
+def get_trial_types(prototype):
+    """The distinct trials of the prototype (as sorted N-values), e.g. [(4, 2, 1, 1, 0, 0), ...]"""
+    return sorted({tuple(sorted(trial, reverse=True)) for trial in prototype}, reverse=True)
+
+
+def generate_chunk(study_seed, first_subject_id, n_plans, n_super_blocks):
+    """
+    Generates the plans of n_plans subjects (the trial list and the quadrant pools,
+    like generate_plan) and encodes them as integer arrays.
+    Returns:
+        tuple: (durations, n_values, trial_types, quadrants)
+    """
+    prototype = get_super_block_prototype()
+    trial_types = {trial_type: i for i, trial_type in enumerate(get_trial_types(prototype))}
+    n_trials = len(prototype) * n_super_blocks
+    n_frames = len(prototype[0])
+
+    durations = np.empty((n_plans, n_trials), dtype=np.int8)
+    n_values = np.empty((n_plans, n_trials, n_frames), dtype=np.int8)
+    types = np.empty((n_plans, n_trials), dtype=np.int8)
+    pools = {n: np.empty((n_plans, n_frames_n * n_super_blocks), dtype=np.uint8)
+             for n, n_frames_n in get_inventory(prototype).items()}
+    for k in range(n_plans):
+        rng = random.Random(get_subject_seed(study_seed, first_subject_id + k))
+        trials = create_experiment_plan(n_super_blocks, rng, verbose=False)
+        quadrant_pools = create_master_pools(n_super_blocks, rng, verbose=False)
+        durations[k] = [DURATIONS.index(trial["duration"]) for trial in trials]
+        n_values[k] = [trial["n_values"] for trial in trials]
+        types[k] = [trial_types[tuple(sorted(trial["n_values"], reverse=True))] for trial in trials]
+        for n, pool in quadrant_pools.items():
+            # In the order they are popped (from the end)
+            pools[n][k] = [TICKET_MASKS[ticket] for ticket in reversed(pool)]
+
+    # The k-th frame with N=n (in trial and frame order) gets the k-th ticket of pool n
+    flat_n_values = n_values.reshape(n_plans, -1)
+    quadrants = np.zeros(flat_n_values.shape, dtype=np.uint8)
+    for n, pool in pools.items():
+        is_n = flat_n_values == n
+        ticket_index = np.maximum(np.cumsum(is_n, axis=1) - 1, 0)
+        quadrants[is_n] = np.take_along_axis(pool, ticket_index, axis=1)[is_n]
+    return durations, n_values, types, quadrants.reshape(n_values.shape)
+
+
+def chunk_statistics(args):
+    """
+    Worker: generates one chunk of plans and computes its statistics.
+    Returns:
+        dict: per-plan cell counts (one row per plan) and position counts (summed over the plans)
+    """
+    study_seed, first_subject_id, n_plans, n_super_blocks = args
+    durations, n_values, types, quadrants = generate_chunk(study_seed, first_subject_id, n_plans, n_super_blocks)
+    n_types = len(get_trial_types(get_super_block_prototype()))
+
+    is_duration = durations[..., None] == np.arange(len(DURATIONS)) # (plan, trial, duration)
+    is_n = n_values[..., None] == np.arange(1, 5) # (plan, trial, frame, N=1..4)
+    in_quadrant = (quadrants[..., None] & QUADRANT_BITS) > 0 # (plan, trial, frame, quadrant)
+    is_type = types[..., None] == np.arange(n_types) # (plan, trial, type)
+    is_n_value = n_values[..., None] == np.arange(0, 5) # (plan, trial, frame, N=0..4)
+
+    i = np.int32
+    return {
+        # Per plan
+        "durations": is_duration.sum(axis=1, dtype=i),
+        "n_frames": is_n.sum(axis=(1, 2), dtype=i),
+        "n_quadrant": np.einsum('ptfn,ptfq->pnq', is_n.astype(i), in_quadrant.astype(i)),
+        "duration_n": np.einsum('ptd,ptfn->pdn', is_duration.astype(i), is_n.astype(i)),
+        "duration_n_quadrant": np.einsum('ptd,ptfn,ptfq->pdnq', is_duration.astype(i), is_n.astype(i),
+                                         in_quadrant.astype(i), optimize=True),
+        "duration_repeats": (durations[:, 1:] == durations[:, :-1]).sum(axis=1, dtype=i),
+        "type_repeats": (types[:, 1:] == types[:, :-1]).sum(axis=1, dtype=i),
+        # Summed over the plans of the chunk
+        "trial_duration": is_duration.sum(axis=0, dtype=np.int64),
+        "trial_type": is_type.sum(axis=0, dtype=np.int64),
+        "frame_n_value": is_n_value.sum(axis=(0, 1), dtype=np.int64),
+        "trial_quadrant": in_quadrant.sum(axis=(0, 2), dtype=np.int64),
+        "frame_quadrant": in_quadrant.sum(axis=(0, 1), dtype=np.int64),
+    }
+
+
+def run_audit(n_plans, n_super_blocks, study_seed):
+    """Generates the plans in worker processes. Returns the statistics of all plans (see chunk_statistics)."""
+    jobs = [(study_seed, first, min(CHUNK_SIZE, n_plans + 1 - first), n_super_blocks)
+            for first in range(1, n_plans + 1, CHUNK_SIZE)]
+    with ProcessPoolExecutor() as executor:
+        chunks = list(executor.map(chunk_statistics, jobs))
+    statistics = {}
+    for key in chunks[0]:
+        if key in PER_PLAN_STATISTICS:
+            statistics[key] = np.concatenate([chunk[key] for chunk in chunks])
+        else:
+            statistics[key] = np.sum([chunk[key] for chunk in chunks], axis=0)
+    return statistics
+
+
+def chi_square_z(observed, expected):
+    """Chi-square of observed against expected counts (one row per position). Returns (chi2, df, z)."""
+    chi2 = np.sum((observed - expected) ** 2 / expected)
+    df = observed.shape[0] * (observed.shape[1] - 1)
+    return chi2, df, (chi2 - df) / np.sqrt(2 * df)
+
+
+def flag(z, one_sided=False):
+    """Marks a z-score above Z_FLAG (in absolute value, unless one_sided)."""
+    return "  <-- POSSIBLE BIAS" if (z if one_sided else abs(z)) > Z_FLAG else ""
+
+
+def format_report(statistics, n_plans, n_super_blocks, study_seed):
+    """Builds the audit report. Returns it as a string."""
+    prototype = get_super_block_prototype()
+    inventory = get_inventory(prototype)
+    n_trials = len(prototype) * n_super_blocks
+    n_frames = len(prototype[0])
+    trial_types = get_trial_types(prototype)
+    n_values = list(inventory)
+
+    report = [f"--- CORE1 counterbalancing audit: {n_plans} plans, {n_super_blocks} Super-Blocks, "
+              f"study seed '{study_seed}' ---", ""]
+
+    # Part 1: Within-plan balance
+    report.append("Part 1: Within-plan balance (% of plans)")
+    duration_counts = statistics["durations"]
+    expected_durations = duration_counts.mean(axis=0)
+    equal_durations = np.all(duration_counts == duration_counts[:, :1], axis=1)
+    report.append(f"  Durations all equal ({'/'.join(str(c) for c in duration_counts[0])}): "
+                  f"{100 * equal_durations.mean():.2f}%")
+    expected_inventory = np.array([inventory[n] * n_super_blocks for n in n_values])
+    report.append(f"  N-value inventory ({'/'.join(map(str, expected_inventory))} frames): "
+                  f"{100 * np.all(statistics['n_frames'] == expected_inventory, axis=1).mean():.2f}%")
+    n_quadrant = statistics["n_quadrant"]
+    report.append(f"  Quadrants equal within every N-value: "
+                  f"{100 * np.all(n_quadrant == n_quadrant[:, :, :1], axis=(1, 2)).mean():.2f}%")
+    # Frames of every N-value, split over the durations in proportion to the trials
+    duration_n = statistics["duration_n"]
+    expected_duration_n = np.outer(expected_durations / n_trials, expected_inventory)
+    report.append(f"  Duration x N-value frames equal to the expected counts: "
+                  f"{100 * np.all(duration_n == expected_duration_n, axis=(1, 2)).mean():.2f}%")
+    report.append(f"    {'cell':<14}{'expected':>9}{'mean':>9}{'SD':>7}{'min':>6}{'max':>6}")
+    for d, duration in enumerate(DURATIONS):
+        for j, n in enumerate(n_values):
+            cell = duration_n[:, d, j]
+            report.append(f"    {f'{duration} ms N={n}':<14}{expected_duration_n[d, j]:>9.2f}{cell.mean():>9.2f}"
+                          f"{cell.std():>7.2f}{cell.min():>6}{cell.max():>6}")
+    report.append("")
+
+    # Part 2: Bias across participants
+    report.append("Part 2: Bias across participants (mean over the plans vs. expected, z = bias / SE)")
+    cells = statistics["duration_n_quadrant"].astype(np.float64)
+    expected_cells = np.broadcast_to((expected_duration_n * np.array(n_values) / len(QUADRANTS))[:, :, None],
+                                     cells.shape[1:])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (cells.mean(axis=0) - expected_cells) / (cells.std(axis=0) / np.sqrt(n_plans))
+    z = np.nan_to_num(z) # Cells with no spread at all are exactly balanced
+    d, j, q = np.unravel_index(np.argmax(np.abs(z)), z.shape)
+    report.append(f"  Duration x N-value x quadrant pictures ({z.size} cells): max |z| = {abs(z[d, j, q]):.2f} "
+                  f"({DURATIONS[d]} ms, N={n_values[j]}, quadrant {QUADRANTS[q]}: "
+                  f"mean {cells[:, d, j, q].mean():.3f}, expected {expected_cells[d, j, q]:.3f}){flag(z[d, j, q])}")
+    report.append("")
+
+    # Part 3: Order effects
+    report.append("Part 3: Order effects (chi-square vs. expected shares, z = (chi2 - df) / sqrt(2 df))")
+    type_shares = np.array([sum(tuple(sorted(trial, reverse=True)) == trial_type for trial in prototype)
+                            for trial_type in trial_types]) / len(prototype)
+    n_value_shares = np.array([sum(trial.count(n) for trial in prototype) for n in range(5)]) / (len(prototype) * n_frames)
+    tests = [
+        ("Trial position x duration", statistics["trial_duration"],
+         np.broadcast_to(n_plans * expected_durations / n_trials, (n_trials, len(DURATIONS)))),
+        ("Trial position x trial type", statistics["trial_type"],
+         np.broadcast_to(n_plans * type_shares, (n_trials, len(trial_types)))),
+        ("Frame position x N-value", statistics["frame_n_value"],
+         np.broadcast_to(n_plans * n_trials * n_value_shares, (n_frames, 5))),
+    ]
+    for name in ["trial_quadrant", "frame_quadrant"]:
+        observed = statistics[name]
+        # Every picture is equally likely to be in any quadrant
+        expected = np.broadcast_to(observed.sum(axis=1, keepdims=True) / len(QUADRANTS), observed.shape)
+        tests.append((f"{name.split('_')[0].capitalize()} position x quadrant", observed, expected))
+    for name, observed, expected in tests:
+        chi2, df, z = chi_square_z(observed, expected)
+        deviation = 100 * (observed - expected) / observed.sum(axis=1, keepdims=True)
+        report.append(f"  {name + ':':<30} chi2 = {chi2:9.1f}, df = {df:3d}, z = {z:6.2f}, "
+                      f"largest share deviation {np.abs(deviation).max():.2f} points{flag(z, one_sided=True)}")
+
+    # Repeats in a random order of a fixed set of trials: sum c (c - 1) / (T (T - 1)) per pair of neighbours
+    type_counts = np.round(type_shares * n_trials)
+    for name, repeats, counts in [("duration", statistics["duration_repeats"], expected_durations),
+                                  ("trial type", statistics["type_repeats"], type_counts)]:
+        expected_share = np.sum(counts * (counts - 1)) / (n_trials * (n_trials - 1))
+        share = repeats / (n_trials - 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = (share.mean() - expected_share) / (share.std() / np.sqrt(n_plans))
+        report.append(f"  Consecutive trials with the same {name}: {100 * share.mean():.2f}% "
+                      f"(expected {100 * expected_share:.2f}% for a random order, z = {z:.2f}){flag(z)}")
+    return "\n".join(report)
+
+
+if __name__ == "__main__":
+    n_plans = int(sys.argv[1]) if len(sys.argv) > 1 else N_PLANS
+    n_super_blocks = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_N_SUPER_BLOCKS
+    study_seed = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_STUDY_SEED
+
+    print(f"Generating {n_plans} plans...")
+    start = time.perf_counter()
+    statistics = run_audit(n_plans, n_super_blocks, study_seed)
+    elapsed = time.perf_counter() - start
+    report = format_report(statistics, n_plans, n_super_blocks, study_seed)
+    report += f"\n\n({n_plans} plans generated and analysed in {elapsed:.1f} s, {n_plans / elapsed:.0f} plans/s)"
+    print(report)
+
+    os.makedirs(PLANS_FOLDER, exist_ok=True)
+    report_path = os.path.join(PLANS_FOLDER, f"CORE1_audit_{n_plans}_{n_super_blocks}_{study_seed}.txt")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write(report + "\n")
+    print(f"Report saved to {report_path}")
@@ -0,0 +1,222 @@
+"""
+Batch analysis for the Potter & Fox (2009) Experiment 2 replication
+(the data files written by CORE1_Project1_1101.py).
+
+analyze_data() in the experiment script only handles one participant.
+This script reads every CORE1 data file (.xpd) of a folder, parses the files
+in parallel (one process per file) and computes, in one pass:
+- the Hit Rate (% 'Yes' to OLD pictures) by N-value x duration (Figure 3)
+- the False Alarm Rate (% 'Yes' to NEW pictures) by duration
+for every subject and for the group (mean and standard error over subjects).
+
+The results are written to two CSV files in the data folder:
+- CORE1_subject_summary.csv: one row per subject x measure x N-value x duration
+- CORE1_group_summary.csv:   one row per measure x N-value x duration
+
+Usage:
+    python CORE1_batch_analysis.py [data_folder]
+(default: the 'data' folder next to this script)
+"""
+
+import os
+import sys
+import csv
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from CORE1_journal import SUPERSEDED_SUFFIX
+
+# Get the absolute path to the directory where this script is located
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_FOLDER = os.path.join(SCRIPT_DIR, 'data')
+
+SUBJECT_SUMMARY_FILE = "CORE1_subject_summary.csv"
+GROUP_SUMMARY_FILE = "CORE1_group_summary.csv"
+
+# The 'y' key (K_y in expyriment) means "Yes, I saw this picture"
+K_Y = 121
+
+# N-values of the frames the old pictures were shown in (0 = new picture, "N/A" in the data)
+N_VALUES = [1, 2, 3, 4]
+
+
+def parse_data_file(path):
+    """
+    Reads one CORE1 data file (runs in a worker process).
+    Returns:
+        dict: the file name, subject id and one array per column
+              (duration, is_old, n_value with 0 for new pictures, yes = 1 if 'y' was pressed),
+              or None if the file is not a CORE1 data file.
+    """
+    rows = []
+    header = None
+    with open(path, 'r', encoding='utf-8') as f:
+        # Expyriment data files start with comment lines beginning with '#'
+        reader = csv.reader(line for line in f if not line.startswith('#'))
+        for row in reader:
+            if not row:
+                continue
+            if header is None:
+                header = row
+                if not {"subject_id", "duration", "is_old", "n_value", "response_key"} <= set(header):
+                    return None
+                columns = {name: i for i, name in enumerate(header)}
+                continue
+            rows.append(row)
+
+    if header is None or len(rows) == 0:
+        return None
+
+    duration = np.array([int(row[columns["duration"]]) for row in rows], dtype=np.int32)
+    is_old = np.array([int(row[columns["is_old"]]) for row in rows], dtype=np.int8)
+    n_value = np.array([int(row[columns["n_value"]]) if row[columns["n_value"]].isdigit() else 0
+                        for row in rows], dtype=np.int8)
+    yes = np.array([int(row[columns["response_key"]]) == K_Y for row in rows], dtype=np.int8)
+    return {
+        "file": os.path.basename(path),
+        "subject_id": rows[0][columns["subject_id"]],
+        "duration": duration,
+        "is_old": is_old,
+        "n_value": n_value,
+        "yes": yes
+    }
+
+
+def load_data_folder(data_folder):
+    """
+    Parses all the .xpd files of a folder in a process pool. Returns the parsed files.
+    The data files of interrupted runs are skipped: the resumed session's file holds their rows.
+    """
+    paths = sorted(os.path.join(data_folder, f) for f in os.listdir(data_folder)
+                   if f.endswith(".xpd") and not f.endswith(SUPERSEDED_SUFFIX))
+    with ProcessPoolExecutor() as executor:
+        parsed = list(executor.map(parse_data_file, paths))
+
+    subjects = []
+    for path, data in zip(paths, parsed):
+        if data is None:
+            print(f"Skipping {os.path.basename(path)} (not a CORE1 data file or empty).")
+        else:
+            subjects.append(data)
+    return subjects
+
+
+def count_responses(subjects):
+    """
+    Counts the responses of all subjects at once.
+    Every response gets a flat index (subject, N-value, duration) and
+    the counts are computed with np.bincount.
+    Returns:
+        tuple: (durations, yes_counts, totals)
+               yes_counts and totals have the shape (n_subjects, 5, n_durations);
+               index 0 on the N-value axis holds the NEW pictures.
+    """
+    subject_index = np.concatenate([np.full(len(s["duration"]), i, dtype=np.int64)
+                                    for i, s in enumerate(subjects)])
+    duration = np.concatenate([s["duration"] for s in subjects])
+    n_value = np.concatenate([s["n_value"] for s in subjects]).astype(np.int64)
+    yes = np.concatenate([s["yes"] for s in subjects])
+
+    # e.g. [240, 400, 720] and the position of every response's duration in it
+    durations, duration_index = np.unique(duration, return_inverse=True)
+    n_durations = len(durations)
+    n_slots = len(N_VALUES) + 1
+
+    flat_index = (subject_index * n_slots + n_value) * n_durations + duration_index
+    shape = (len(subjects), n_slots, n_durations)
+    size = shape[0] * shape[1] * shape[2]
+    totals = np.bincount(flat_index, minlength=size).reshape(shape)
+    yes_counts = np.bincount(flat_index, weights=yes, minlength=size).reshape(shape).astype(np.int64)
+    return durations, yes_counts, totals
+
+
+def rate(yes_counts, totals):
+    """Percentage of 'yes' responses (NaN where there were no responses)."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(totals > 0, yes_counts / totals * 100, np.nan)
+
+
+def group_mean_sem(rates):
+    """Mean and standard error over subjects (axis 0), ignoring missing cells."""
+    n = np.sum(~np.isnan(rates), axis=0)
+    # Cells without data (or with a single subject) give NaN: no need to warn about them
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(rates, axis=0) if rates.shape[0] > 0 else np.full(rates.shape[1:], np.nan)
+        sd = np.nanstd(rates, axis=0, ddof=1) if rates.shape[0] > 1 else np.full(rates.shape[1:], np.nan)
+        sem = np.where(n > 1, sd / np.sqrt(n), np.nan)
+    return mean, sem, n
+
+
+def format_rate(value):
+    return "NA" if np.isnan(value) else f"{value:.2f}"
+
+
+def analyze_folder(data_folder):
+    """Runs the whole batch analysis for one folder and writes the two summary files."""
+    subjects = load_data_folder(data_folder)
+    if len(subjects) == 0:
+        print(f"No CORE1 data files found in '{data_folder}'.")
+        return
+    print(f"Parsed {len(subjects)} data files.")
+
+    durations, yes_counts, totals = count_responses(subjects)
+
+    # Hits: N-value x duration; Hit rate by duration: all N-values combined
+    hit_rates = rate(yes_counts[:, 1:, :], totals[:, 1:, :])
+    hit_rates_by_duration = rate(yes_counts[:, 1:, :].sum(axis=1), totals[:, 1:, :].sum(axis=1))
+    # False alarms: new pictures (N-value slot 0), by duration
+    fa_rates = rate(yes_counts[:, 0, :], totals[:, 0, :])
+
+    # Per-subject table
+    subject_file = os.path.join(data_folder, SUBJECT_SUMMARY_FILE)
+    with open(subject_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["subject_id", "file", "measure", "n_value", "duration", "yes", "total", "rate"])
+        for s, data in enumerate(subjects):
+            for i, n in enumerate(N_VALUES):
+                for d, dur in enumerate(durations):
+                    writer.writerow([data["subject_id"], data["file"], "hit_rate", n, dur,
+                                     yes_counts[s, n, d], totals[s, n, d], format_rate(hit_rates[s, i, d])])
+            for d, dur in enumerate(durations):
+                writer.writerow([data["subject_id"], data["file"], "hit_rate", "all", dur,
+                                 yes_counts[s, 1:, d].sum(), totals[s, 1:, d].sum(),
+                                 format_rate(hit_rates_by_duration[s, d])])
+            for d, dur in enumerate(durations):
+                writer.writerow([data["subject_id"], data["file"], "false_alarm_rate", "N/A", dur,
+                                 yes_counts[s, 0, d], totals[s, 0, d], format_rate(fa_rates[s, d])])
+
+    # Group table (mean over subjects)
+    hit_mean, hit_sem, hit_n = group_mean_sem(hit_rates)
+    dur_mean, dur_sem, dur_n = group_mean_sem(hit_rates_by_duration)
+    fa_mean, fa_sem, fa_n = group_mean_sem(fa_rates)
+    group_file = os.path.join(data_folder, GROUP_SUMMARY_FILE)
+    with open(group_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["measure", "n_value", "duration", "n_subjects", "mean_rate", "sem"])
+        for i, n in enumerate(N_VALUES):
+            for d, dur in enumerate(durations):
+                writer.writerow(["hit_rate", n, dur, hit_n[i, d], format_rate(hit_mean[i, d]), format_rate(hit_sem[i, d])])
+        for d, dur in enumerate(durations):
+            writer.writerow(["hit_rate", "all", dur, dur_n[d], format_rate(dur_mean[d]), format_rate(dur_sem[d])])
+        for d, dur in enumerate(durations):
+            writer.writerow(["false_alarm_rate", "N/A", dur, fa_n[d], format_rate(fa_mean[d]), format_rate(fa_sem[d])])
+
+    # Short group report in the console
+    print("\nGroup Hit Rate (% 'Yes' to OLD pictures) by N-Value x Duration:")
+    print("         " + "".join(f"{dur:>10} ms" for dur in durations))
+    for i, n in enumerate(N_VALUES):
+        print(f"  N={n}    " + "".join(f"{format_rate(hit_mean[i, d]):>13}" for d in range(len(durations))))
+    print("Group False Alarm Rate (% 'Yes' to NEW pictures) by Duration:")
+    print("         " + "".join(f"{format_rate(fa_mean[d]):>13}" for d in range(len(durations))))
+    print(f"\nSaved {SUBJECT_SUMMARY_FILE} and {GROUP_SUMMARY_FILE} to '{data_folder}'.")
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else DATA_FOLDER
+    if not os.path.isdir(folder):
+        print(f"FATAL ERROR: Data folder '{folder}' not found.")
+        sys.exit()
+    analyze_folder(folder)
@@ -0,0 +1,351 @@
+"""
+Benchmarks for the CORE1 counterbalancing, compositing and analysis code
+(CORE1_plans.py, CORE1_frames.py and CORE1_analysis.py).
+
+Every stage is run headlessly (no window, no participant) with synthetic
+stimuli, for growing numbers of Super-Blocks (N_SUPER_BLOCKS_TO_RUN):
+- trials:    create_experiment_plan (the trial list)
+- pools:     create_master_pools (the quadrant pools)
+- pictures:  assign_pictures (the 'old' and 'new' picture pools)
+- compose:   all the RSVP frames of the plan (mask layer copy, pictures plotted
+             on top as popped from the pools, preload)
+- analysis:  record_response for every test response + analyze_data
+             (without the signal-detection part)
+- sdt:       session_sdt_report (d', c and A' with their bootstrap CIs,
+             N_RESAMPLES resamples) on the recorded responses
+
+Each (stage, size) measurement runs in a fresh process, so that its peak
+memory is not hidden by an earlier, bigger one. For every measurement we report:
+- time_s:         the best wall-clock time of REPEATS runs (fewer for the slow ones)
+- peak_python_mb: the peak of the Python allocations (tracemalloc)
+- peak_rss_mb:    the peak resident memory of the whole process (includes the SDL surfaces)
+
+The results are saved as JSON in the 'benchmarks' folder. Pass a previous
+results file to compare with it (stages that got more than 20% slower are flagged).
+
+The full run takes several minutes (composing the 30000 frames of 1000
+Super-Blocks is the slow part).
+
+Usage:
+    python CORE1_benchmark.py [--sizes 1,15,100,1000] [--compare benchmarks/old.json]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+# The quadrant layout of the experiment
+from CORE1_plans import QUADRANT_POSITIONS
+
+try:
+    import resource # Not available on Windows
+except ImportError:
+    resource = None
+
+# Get the absolute path to the directory where this script is located
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARKS_FOLDER = os.path.join(SCRIPT_DIR, 'benchmarks')
+
+DEFAULT_SIZES = [1, 15, 100, 1000]
+STAGES = ["trials", "pools", "pictures", "compose", "analysis", "sdt"]
+REPEATS = 3
+# No more repeats once a measurement has taken this long (seconds)
+TIME_BUDGET = 10
+
+# The screen of the benchmark (no window is opened)
+SCREEN_SIZE = (1920, 1080)
+N_MASK_LAYERS = 4
+
+# Number of different synthetic pictures (the file names of the plan are mapped onto them)
+N_SYNTHETIC_PICTURES = 32
+# Number of synthetic picture file names (900 = what the full 15 Super-Block experiment needs)
+N_SYNTHETIC_FILES = 900
+
+# A stage is flagged in the comparison if it got this much slower
+REGRESSION_THRESHOLD = 1.2
+
+
+def setup_headless():
+    """
+    Starts an Expyriment experiment that never draws on a real screen
+    (stimuli can only be preloaded once an experiment is initialised).
+    """
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+    from expyriment import design, control
+    control.set_develop_mode(True)
+    control.defaults.opengl = 0
+    control.defaults.window_size = SCREEN_SIZE
+    control.defaults.initialise_delay = 0
+    control.defaults.event_logging = 0
+    exp = design.Experiment(name="CORE1 benchmark")
+    control.initialize(exp)
+    return exp
+
+
+def synthetic_picture_files():
+    """The synthetic picture 'files' the plans are built from."""
+    return [f"synthetic_{i:04d}.jpg" for i in range(N_SYNTHETIC_FILES)]
+
+
+def bench_trials(n_super_blocks, seed):
+    """Trial list of one participant (Level 2 + Level 3 shuffles)."""
+    from CORE1_plans import create_experiment_plan
+    create_experiment_plan(n_super_blocks, random.Random(seed), verbose=False)
+
+
+def bench_pools(n_super_blocks, seed):
+    """Quadrant pools of one participant (Level 1 shuffle)."""
+    from CORE1_plans import create_master_pools
+    create_master_pools(n_super_blocks, random.Random(seed), verbose=False)
+
+
+def bench_pictures(n_super_blocks, seed, context):
+    """'Old' and 'new' picture pools of one participant."""
+    from CORE1_plans import assign_pictures
+    assign_pictures(context["picture_files"], n_super_blocks, random.Random(seed), verbose=False)
+
+
+def bench_compose(n_super_blocks, seed, context):
+    """
+    Composes every RSVP frame of one participant's plan, as compose_trial_steps does:
+    a copy of a mask layer, with the N pictures popped from the pools plotted on top.
+    The frames of a trial are dropped after the trial, as in the experiment.
+    """
+    from CORE1_frames import new_frame_canvas
+    plan = context["plan"]
+    quadrant_pools = {n: list(pool) for n, pool in plan["quadrant_pools"].items()}
+    old_pics_pool = list(plan["old_pics_pool"])
+    pictures = context["pictures"]
+    # The file names are mapped onto the synthetic pictures in turn (hash() of a str changes every run)
+    picture_index = 0
+    for trial_data in plan["trials"]:
+        frames = []
+        for n in trial_data["n_values"]:
+            frame_canvas = new_frame_canvas(context["mask_layers"], SCREEN_SIZE)
+            if n > 0:
+                for quad_num in quadrant_pools[n].pop():
+                    old_pics_pool.pop()
+                    pic_stim = pictures[picture_index % len(pictures)]
+                    picture_index += 1
+                    pic_stim.reposition(QUADRANT_POSITIONS[quad_num])
+                    pic_stim.plot(frame_canvas)
+            frame_canvas.preload()
+            frames.append(frame_canvas)
+        for frame_canvas in frames:
+            frame_canvas.unload()
+
+
+def record_test_responses(plan, seed):
+    """
+    Records the 8 test responses of every trial of the plan (random 'y'/'n' answers).
+    Returns:
+        dict: the result tables of CORE1_analysis.py
+    """
+    from CORE1_analysis import create_results, record_response, K_y
+    rng = random.Random(seed)
+    results = create_results()
+    for trial_data in plan["trials"]:
+        shown_n_values = [n for n in trial_data["n_values"] for _ in range(n)]
+        old_n_values = rng.sample(shown_n_values, 4)
+        test_items = [(1, n) for n in old_n_values] + [(0, "N/A")] * 4
+        for is_old, n_value in test_items:
+            response_key = K_y if rng.random() < 0.5 else 0
+            correct = (response_key == K_y) == (is_old == 1)
+            record_response(results, trial_data["duration"], is_old, n_value, response_key, 1 if correct else 0)
+    return results
+
+
+def bench_analysis(n_super_blocks, seed, context):
+    """
+    Records the test responses of every trial of the plan and writes the summary
+    report with analyze_data, without its signal-detection part (see bench_sdt).
+    """
+    from CORE1_analysis import analyze_data
+    results = record_test_responses(context["plan"], seed)
+    analyze_data(os.path.join(context["data_folder"], "benchmark.xpd"), results, with_sdt=False)
+
+
+def bench_sdt(n_super_blocks, seed, context):
+    """The signal-detection part of the summary report (bootstrap of one session)."""
+    from CORE1_sdt import session_sdt_report
+    results = context["results"]
+    session_sdt_report(results["n_value"], results["duration"])
+
+
+def prepare_context(stage, n_super_blocks, seed):
+    """Builds, outside the timed part, what a stage needs (plan, synthetic stimuli, folders)."""
+    context = {}
+    if stage == "pictures":
+        context["picture_files"] = synthetic_picture_files()
+    if stage in ("compose", "analysis", "sdt"):
+        from CORE1_plans import generate_plan
+        context["plan"] = generate_plan(1, seed, n_super_blocks, synthetic_picture_files())
+    if stage == "compose":
+        from expyriment import stimuli
+        from CORE1_frames import create_mask_layers
+        masks = [stimuli.Rectangle(size=(300, 200), colour=(128, 128, 128)) for _ in range(8)]
+        context["mask_layers"] = create_mask_layers(SCREEN_SIZE, masks, QUADRANT_POSITIONS, N_MASK_LAYERS)
+        # Synthetic pictures: 300x200 canvases of random colours
+        rng = random.Random(seed)
+        pictures = []
+        for _ in range(N_SYNTHETIC_PICTURES):
+            picture = stimuli.Canvas(size=(300, 200), colour=tuple(rng.randrange(256) for _ in range(3)))
+            picture.preload()
+            pictures.append(picture)
+        context["pictures"] = pictures
+    if stage == "sdt":
+        context["results"] = record_test_responses(context["plan"], seed)
+    if stage == "analysis":
+        context["data_folder"] = tempfile.mkdtemp(prefix="core1_benchmark_")
+    return context
+
+
+def run_measurement(args):
+    """
+    Runs one (stage, size) measurement (in its own worker process).
+    Returns:
+        dict: stage, n_super_blocks, n_trials, time_s, runs, peak_python_mb, peak_rss_mb
+    """
+    stage, n_super_blocks, seed, repeats = args
+    # Expyriment and analyze_data print to the console: keep the benchmark output readable
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        setup_headless()
+        context = prepare_context(stage, n_super_blocks, seed)
+        run_stage = {
+            "trials": lambda: bench_trials(n_super_blocks, seed),
+            "pools": lambda: bench_pools(n_super_blocks, seed),
+            "pictures": lambda: bench_pictures(n_super_blocks, seed, context),
+            "compose": lambda: bench_compose(n_super_blocks, seed, context),
+            "analysis": lambda: bench_analysis(n_super_blocks, seed, context),
+            "sdt": lambda: bench_sdt(n_super_blocks, seed, context)
+        }[stage]
+
+        # Timed runs (without tracemalloc, which slows down Python code a lot).
+        # Big sizes stop repeating once TIME_BUDGET seconds have been spent.
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run_stage()
+            times.append(time.perf_counter() - start)
+            if sum(times) > TIME_BUDGET:
+                break
+
+        # One more run to measure the peak of the Python allocations
+        tracemalloc.start()
+        run_stage()
+        peak_python = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        sys.stdout.close()
+        sys.stdout = sys.__stdout__
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss_mb = None
+    if resource is not None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_rss_mb = maxrss / 1e6 if sys.platform == "darwin" else maxrss / 1e3
+    return {
+        "stage": stage,
+        "n_super_blocks": n_super_blocks,
+        "n_trials": 5 * n_super_blocks,
+        "time_s": min(times),
+        "runs": len(times),
+        "peak_python_mb": peak_python / 1e6,
+        "peak_rss_mb": peak_rss_mb
+    }
+
+
+def run_benchmarks(sizes, seed="CORE1-benchmark", repeats=REPEATS):
+    """Runs every stage for every size, one fresh process per measurement. Returns the results."""
+    jobs = [(stage, n, seed, repeats) for stage in STAGES for n in sizes]
+    results = []
+    for job in jobs:
+        # One worker per measurement: a fresh process, run alone so the timings don't compete
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_measurement, job).result()
+        results.append(result)
+        print(f"  {result['stage']:<9} {result['n_super_blocks']:>5} Super-Blocks: {result['time_s']:.4f} s")
+    return results
+
+
+def format_mb(value):
+    return "NA" if value is None else f"{value:.1f}"
+
+
+def print_table(results, previous=None):
+    """Prints the results (and the change since a previous run if there is one)."""
+    previous_times = {}
+    if previous is not None:
+        previous_times = {(r["stage"], r["n_super_blocks"]): r["time_s"] for r in previous["results"]}
+
+    print(f"\n{'stage':<9} {'blocks':>6} {'trials':>6} {'time (s)':>10} {'peak py (MB)':>13} {'peak rss (MB)':>14}"
+          + ("   vs previous" if previous_times else ""))
+    regressions = []
+    for r in results:
+        line = (f"{r['stage']:<9} {r['n_super_blocks']:>6} {r['n_trials']:>6} {r['time_s']:>10.4f} "
+                f"{format_mb(r['peak_python_mb']):>13} {format_mb(r['peak_rss_mb']):>14}")
+        old_time = previous_times.get((r["stage"], r["n_super_blocks"]))
+        if old_time:
+            ratio = r["time_s"] / old_time
+            line += f"   x{ratio:.2f}"
+            if ratio > REGRESSION_THRESHOLD:
+                line += "  <-- SLOWER"
+                regressions.append(r)
+        print(line)
+
+    if previous_times:
+        if regressions:
+            print(f"\nWARNING: {len(regressions)} measurement(s) more than "
+                  f"{(REGRESSION_THRESHOLD - 1) * 100:.0f}% slower than the previous run.")
+        else:
+            print("\nNo regressions compared with the previous run.")
+    return regressions
+
+
+def save_results(results, sizes):
+    """Saves the results (and where they were measured) as JSON. Returns the file path."""
+    os.makedirs(BENCHMARKS_FOLDER, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(BENCHMARKS_FOLDER, f"CORE1_benchmark_{timestamp}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "timestamp": timestamp,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": sizes,
+            "repeats": REPEATS,
+            "results": results
+        }, f, indent=2)
+    return path
+
+
+if __name__ == "__main__":
+    sizes = DEFAULT_SIZES
+    previous = None
+    args = sys.argv[1:]
+    try:
+        if "--sizes" in args:
+            sizes = [int(n) for n in args[args.index("--sizes") + 1].split(",")]
+        if "--compare" in args:
+            with open(args[args.index("--compare") + 1], 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+    except (IndexError, ValueError, OSError) as e:
+        print(f"FATAL ERROR: Bad arguments ({e}).")
+        print(__doc__)
+        sys.exit()
+
+    print(f"Benchmarking {', '.join(STAGES)} for {sizes} Super-Blocks ({REPEATS} runs each)...")
+    results = run_benchmarks(sizes)
+    regressions = print_table(results, previous)
+    path = save_results(results, sizes)
+    print(f"\nSaved the results to '{path}'.")
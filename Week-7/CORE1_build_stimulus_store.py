@@ -0,0 +1,102 @@
+"""
+Builds the pre-scaled stimulus store for CORE1_Project1_1101.py.
+
+Without the store, every picture is a JPEG that is decoded when it is first
+needed. This script does that work once, offline: every picture of the
+'stimuli' folder is decoded, scaled down to fit the 300x200 quadrant slots
+(keeping its aspect ratio; smaller pictures keep their size) and written as raw pixels into one file:
+- stimuli_store.bin:  the raw pixels of all pictures, one after the other
+- stimuli_store.json: the index {file: offset, width, height, format}
+
+The experiment maps the .bin file into memory (mmap) and creates the picture
+surfaces straight from it, without any JPEG decoding.
+Re-run this script whenever the stimuli folder changes (the experiment
+falls back to decoding the JPEGs if the store is out of date).
+
+Usage:
+    python CORE1_build_stimulus_store.py
+"""
+
+import os
+import sys
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+# The picture folder and extensions are the manifest's
+from CORE1_manifest import SCRIPT_DIR, PICS_FOLDER, PICTURE_EXTENSIONS
+
+STORE_FILE = os.path.join(SCRIPT_DIR, 'stimuli_store.bin')
+STORE_INDEX_FILE = os.path.join(SCRIPT_DIR, 'stimuli_store.json')
+
+# Size of the quadrant slots (the masks are 300x200 too)
+SLOT_SIZE = (300, 200)
+# Version of the store's scaling rule: a store built with another rule is out of date
+STORE_FORMAT = 2
+
+
+def scale_to_slot(surface):
+    """
+    Scales a picture surface down to fit SLOT_SIZE, keeping its aspect ratio.
+    Pictures that already fit are never enlarged (returned as they are).
+    Also used by the experiment when it decodes the JPEGs itself.
+    """
+    width, height = surface.get_size()
+    scale = min(SLOT_SIZE[0] / width, SLOT_SIZE[1] / height)
+    if scale >= 1:
+        return surface
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    # smoothscale only works on 24 and 32 bit surfaces
+    if surface.get_bitsize() not in (24, 32):
+        surface = surface.convert(32, 0)
+    return pygame.transform.smoothscale(surface, size)
+
+
+def transcode_picture(filename):
+    """
+    Decodes one picture and scales it down to fit SLOT_SIZE (see scale_to_slot).
+    Returns:
+        tuple: (filename, width, height, pixel format, raw pixels), or (filename, error message)
+    """
+    try:
+        surface = scale_to_slot(pygame.image.load(os.path.join(PICS_FOLDER, filename)))
+        size = surface.get_size()
+        pixel_format = "RGBA" if surface.get_flags() & pygame.SRCALPHA else "RGB"
+        return filename, size[0], size[1], pixel_format, pygame.image.tobytes(surface, pixel_format)
+    except Exception as e:
+        return filename, str(e)
+
+
+def build_store():
+    """Transcodes the whole stimuli folder and writes the store and its index."""
+    filenames = sorted(f for f in os.listdir(PICS_FOLDER) if f.endswith(PICTURE_EXTENSIONS))
+    print(f"Transcoding {len(filenames)} pictures to {SLOT_SIZE[0]}x{SLOT_SIZE[1]}...")
+
+    index = {}
+    offset = 0
+    with open(STORE_FILE, 'wb') as store, ThreadPoolExecutor() as executor:
+        for result in executor.map(transcode_picture, filenames):
+            if len(result) == 2:
+                print(f"Warning: Could not transcode {result[0]}: {result[1]}")
+                continue
+            filename, width, height, pixel_format, pixels = result
+            store.write(pixels)
+            index[filename] = {"offset": offset, "width": width, "height": height, "format": pixel_format}
+            offset += len(pixels)
+
+    with open(STORE_INDEX_FILE, 'w', encoding='utf-8') as f:
+        json.dump({
+            "folder_mtime": os.stat(PICS_FOLDER).st_mtime,
+            "format": STORE_FORMAT,
+            "slot_size": SLOT_SIZE,
+            "pictures": index
+        }, f)
+    print(f"Stored {len(index)} pictures ({offset / 1e6:.1f} MB) in {os.path.basename(STORE_FILE)}.")
+
+
+if __name__ == "__main__":
+    if not os.path.isdir(PICS_FOLDER):
+        print(f"FATAL ERROR: Picture folder '{PICS_FOLDER}' not found.")
+        sys.exit()
+    build_store()
@@ -0,0 +1,43 @@
+"""
+RSVP frame compositing for CORE1_Project1_1101.py.
+
+The four masks are rendered once into a few full-screen "mask layers".
+Every frame then starts as a copy of one layer, and only its N pictures
+are plotted on top of it.
+Kept in its own module so that the benchmarks (CORE1_benchmark.py) can run it
+without starting an experiment.
+"""
+
+import random
+
+from expyriment import stimuli
+
+
+def create_mask_layers(screen_size, mask_stimuli, quadrant_positions, n_layers):
+    """
+    Renders the masks in all 4 quadrants once, into n_layers full-screen canvases.
+    Each layer uses a different random arrangement of mask_stimuli,
+    so textured masks still vary from frame to frame.
+    Returns:
+        list: the mask layers (not preloaded, they are only copied)
+    """
+    layers = []
+    for _ in range(n_layers):
+        layer = stimuli.Canvas(size=screen_size)
+        random.shuffle(mask_stimuli)
+        for i in range(4):
+            quad_num = i + 1
+            mask_stimuli[i].reposition(quadrant_positions[quad_num])
+            mask_stimuli[i].plot(layer)
+        layers.append(layer)
+    return layers
+
+
+def new_frame_canvas(mask_layers, screen_size, rng=random):
+    """
+    Returns a new frame that starts as a copy of a random mask layer (pictures go on top).
+    rng picks the layer (e.g. a random.Random seeded per trial).
+    """
+    frame_canvas = stimuli.Canvas(size=screen_size)
+    frame_canvas.set_surface(rng.choice(mask_layers).get_surface_copy())
+    return frame_canvas
@@ -0,0 +1,134 @@
+"""
+Crash-safe session journal for CORE1_Project1_1101.py.
+
+The journal of a participant is an append-only JSON Lines file:
+- the first record holds the participant's plan, as it was before the first trial
+  (trial list, quadrant pools and picture pools, in the order they are popped)
+- then one record per completed main trial, with the data rows of that trial
+
+Every record is flushed to disk (fsync) as soon as it is written, so after a crash
+the journal holds everything up to the last completed trial. The pools are
+always popped in plan order, so the pool positions follow from the number of
+completed trials: nothing else has to be saved.
+
+A resumed session writes all its data (the completed trials' rows too) into a new
+data file: the data file of the interrupted run is renamed "..._superseded.xpd",
+so that the analysis scripts count every subject once.
+
+When the session ends normally, the journal is renamed to "..._complete.jsonl"
+and a new session for the same subject ID starts from scratch.
+A journal that is still there at startup belongs to an interrupted session:
+the experiment then resumes at the next trial.
+
+This module does not need Expyriment.
+"""
+
+import os
+import json
+from datetime import datetime
+
+# Get the absolute path to the directory where this script is located
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+JOURNAL_FOLDER = os.path.join(SCRIPT_DIR, 'journals')
+# Data files of interrupted runs, replaced by the data file of the resumed session
+SUPERSEDED_SUFFIX = "_superseded.xpd"
+
+
+def get_journal_path(subject_id, journal_folder=JOURNAL_FOLDER):
+    """File name of the journal of a participant's unfinished session."""
+    return os.path.join(journal_folder, f"CORE1_journal_{subject_id:03d}.jsonl")
+
+
+def append_record(path, record):
+    """Appends one record to a journal and makes sure it is on disk."""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, separators=(',', ':')) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def start_journal(path, plan, data_file):
+    """Creates the journal of a new session, starting with the (not yet popped) plan."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    append_record(path, {"type": "plan", "data_file": data_file, "plan": plan})
+
+
+def add_trial(path, trial_id, rows):
+    """Records a completed main trial and its data rows."""
+    append_record(path, {"type": "trial", "trial_id": trial_id, "rows": rows})
+
+
+def add_resume(path, data_file, n_completed):
+    """Records that the session was resumed (in a new data file)."""
+    append_record(path, {"type": "resume", "data_file": data_file, "n_completed": n_completed})
+
+
+def read_journal(path):
+    """
+    Reads the journal of an unfinished session.
+    A last line cut off by a crash is ignored.
+    Returns:
+        tuple: (plan, completed_trials) with completed_trials the list of trial records
+               in the order they were run, or None if there is no journal
+    """
+    if not os.path.isfile(path):
+        return None
+    plan = None
+    completed_trials = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break # Cut off while being written: the trial was not completed
+            if record["type"] == "plan":
+                plan = record["plan"]
+            elif record["type"] == "trial":
+                completed_trials.append(record)
+    if plan is None:
+        return None
+    # JSON turns the quadrant pool keys into strings and the tickets into lists
+    plan["quadrant_pools"] = {int(n): [tuple(ticket) for ticket in pool]
+                              for n, pool in plan["quadrant_pools"].items()}
+    return plan, completed_trials
+
+
+def get_last_data_file(path):
+    """
+    The data file of the last run of an unfinished session (the first one, or the last resume):
+    it holds the data and the timing rows of all the trials completed so far.
+    Returns:
+        str: the data file name, or None if there is no journal
+    """
+    if not os.path.isfile(path):
+        return None
+    data_file = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if record["type"] in ("plan", "resume"):
+                data_file = record["data_file"]
+    return data_file
+
+
+def supersede_data_file(data_folder, data_file):
+    """
+    Renames the data file of an interrupted run (its rows are in the resumed session's data file).
+    Returns:
+        str: the new file name, or None if there was no such file
+    """
+    path = os.path.join(data_folder, data_file)
+    if not os.path.isfile(path):
+        return None
+    new_path = path.replace(".xpd", SUPERSEDED_SUFFIX)
+    os.replace(path, new_path)
+    return os.path.basename(new_path)
+
+
+def close_journal(path):
+    """Marks the session as complete: the journal is kept, under a new name."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.replace(path, path.replace(".jsonl", f"_{timestamp}_complete.jsonl"))
@@ -0,0 +1,88 @@
+"""
+Cached manifest of the CORE1 stimuli folder, for CORE1_Project1_1101.py
+and the plan pre-generation (CORE1_plans.py).
+
+The manifest lists every picture of the 'stimuli' folder with its size,
+dimensions, SHA-1 hash and whether it can be decoded. It is cached in
+stimuli_manifest.json and only rebuilt when the folder's modification time
+has changed. Pictures that cannot be decoded are never put in a plan.
+
+The manifest code used to live in CORE1_Project1_1101.py. It has its own
+module so that the plan pre-generation and the stimulus store build
+(CORE1_build_stimulus_store.py) share one picture folder and one list of
+picture extensions with the experiment. This module does not need Expyriment.
+"""
+
+import os
+import json
+import hashlib
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+# Get the absolute path to the directory where this script is located
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PICS_FOLDER = os.path.join(SCRIPT_DIR, 'stimuli')
+MANIFEST_FILE = os.path.join(SCRIPT_DIR, 'stimuli_manifest.json')
+PICTURE_EXTENSIONS = ('.jpg', '.png', '.jpeg')
+
+# Number of worker threads that check the pictures when the manifest is rebuilt
+MANIFEST_WORKERS = 4
+
+
+def check_picture_file(filename):
+    """Reads, hashes and decodes one picture file. Returns its manifest entry."""
+    path = os.path.join(PICS_FOLDER, filename)
+    entry = {"file": filename, "size": None, "width": None, "height": None, "sha1": None, "ok": False, "error": None}
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+        entry["size"] = len(content)
+        entry["sha1"] = hashlib.sha1(content).hexdigest()
+        surface = pygame.image.load(BytesIO(content), filename)
+        entry["width"], entry["height"] = surface.get_size()
+        entry["ok"] = True
+    except Exception as e:
+        entry["error"] = str(e)
+    return entry
+
+
+def load_stimulus_manifest():
+    """
+    Returns the manifest of the stimuli folder:
+    {"folder": ..., "folder_mtime": ..., "pictures": [entry, ...]}
+    The manifest is cached in MANIFEST_FILE and only rebuilt (every file
+    read, hashed and decoded) when the folder's modification time has changed.
+    """
+    folder_mtime = os.stat(PICS_FOLDER).st_mtime
+    try:
+        with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest["folder"] == PICS_FOLDER and manifest["folder_mtime"] == folder_mtime:
+            return manifest
+    except (OSError, ValueError, KeyError):
+        pass # No (valid) cached manifest: build it
+
+    print("Building the stimulus manifest (first run, or the stimuli folder has changed)...")
+    filenames = sorted(f for f in os.listdir(PICS_FOLDER) if f.endswith(PICTURE_EXTENSIONS))
+    with ThreadPoolExecutor(max_workers=MANIFEST_WORKERS) as executor:
+        entries = list(executor.map(check_picture_file, filenames))
+    manifest = {"folder": PICS_FOLDER, "folder_mtime": folder_mtime, "pictures": entries}
+    try:
+        with open(MANIFEST_FILE, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1)
+    except OSError as e:
+        print(f"Warning: Could not save the stimulus manifest: {e}")
+    return manifest
+
+
+def get_usable_pictures(manifest):
+    """
+    Splits the manifest into the pictures that can be used and the broken ones.
+    Returns:
+        tuple: (usable file names, broken entries)
+    """
+    usable = [entry["file"] for entry in manifest["pictures"] if entry["ok"]]
+    broken = [entry for entry in manifest["pictures"] if not entry["ok"]]
+    return usable, broken
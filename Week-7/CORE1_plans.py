@@ -0,0 +1,416 @@
+"""
+Seeded experiment-plan generator for CORE1_Project1_1101.py
+(Potter & Fox (2009) Experiment 2, "Super-Block" counterbalancing).
+
+Every random choice of a participant's plan comes from one explicit seed, so
+a plan can be regenerated and audited afterwards. A plan holds:
+- the trial list (Level 2 + Level 3 shuffles): trial_id, duration, n_values
+- the master quadrant pools (Level 1 shuffle), in the order they are popped
+- the 'old' and 'new' picture pools, in the order they are popped
+
+Plans are saved as small gzip-compressed JSON files. The experiment script loads
+the plan of the current subject from PLANS_FOLDER if there is one, and
+generates (and saves) a new one otherwise.
+
+The quadrant pools are built for any display layout (a list of positions)
+and any Super-Block prototype, see create_balanced_pool.
+
+Pre-generate the plans of a whole study (in parallel), from the usable pictures
+of the stimulus manifest (CORE1_manifest.py); N_SUPER_BLOCKS must match
+N_SUPER_BLOCKS_TO_RUN of the experiment script (15 = full experiment, 1 = short test):
+    python CORE1_plans.py N_PARTICIPANTS N_SUPER_BLOCKS [FIRST_SUBJECT_ID] [STUDY_SEED]
+Check which layouts (numbers of positions) can be balanced for N Super-Blocks:
+    python CORE1_plans.py --check-layouts N_SUPER_BLOCKS N_POSITIONS...
+
+This module does not need Expyriment and can be imported by analysis tools.
+"""
+
+import os
+import sys
+import json
+import gzip
+import math
+import random
+import itertools
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+# Get the absolute path to the directory where this script is located
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PICS_FOLDER = os.path.join(SCRIPT_DIR, 'stimuli')
+PLANS_FOLDER = os.path.join(SCRIPT_DIR, 'plans')
+
+# 15 = Full 75-trial experiment, 1 = A short 5-trial test
+DEFAULT_N_SUPER_BLOCKS = 15
+
+DURATIONS = [240, 400, 720]
+
+# Quadrants 1, 2, 3, 4
+QUADRANTS = [1, 2, 3, 4]
+
+# (x,y) positions for Quadrants 1, 2, 3, 4 (used by the experiment and the benchmarks)
+QUADRANT_POSITIONS = {
+    1: (-165, 115), # Top-Left
+    2: (165, 115), # Top-Right
+    3: (-165, -115), # Bottom-Left
+    4: (165, -115)   # Bottom-Right
+}
+
+
+def get_super_block_prototype(): # defines what one 5-trial "Super-Block" looks like
+    """
+    Returns the 5-trial prototype
+    Inventory needed: 8 (N=1), 6 (N=2), 4 (N=3), 2 (N=4), 10 (N=0)
+    """
+    # N is the Number of pictures that are flashed on the screen at the same time in one frame
+    # e.g. the first trial has one N=4 frame, one N=2 frame, two N=1 frames, etc.
+    SUPER_BLOCK_PROTOTYPE = [
+        (4, 2, 1, 1, 0, 0), # Trial 1 (8 pics)
+        (4, 2, 1, 1, 0, 0), # Trial 2 (8 pics)
+        (3, 3, 1, 1, 0, 0), # Trial 3 (8 pics)
+        (3, 2, 2, 1, 0, 0), # Trial 4 (8 pics)
+        (3, 2, 2, 1, 0, 0)  # Trial 5 (8 pics)
+    ]
+
+    return SUPER_BLOCK_PROTOTYPE
+
+
+def get_inventory(prototype):
+    """
+    Number of frames of every N-value (N > 0) in one Super-Block.
+    Returns:
+        dict: e.g. {1: 8, 2: 6, 3: 4, 4: 2} for the 4-quadrant prototype
+    """
+    inventory = Counter(n for trial in prototype for n in trial if n > 0)
+    return dict(sorted(inventory.items()))
+
+
+def describe_pool(n_positions, n, n_tickets):
+    """
+    Describes, in closed form, the balanced pool of n_tickets tickets of n positions
+    that create_balanced_pool builds (nothing is generated):
+    - "combinations": every combination of n positions, the same number of times.
+      Used when the number of combinations divides n_tickets (e.g. 4 quadrants).
+      Every combination, and so every position, is used equally often.
+    - "cyclic": rounds of windows of n consecutive positions, stepping by n around
+      the circle of positions, each round under a random relabelling of the positions.
+      A round has n_positions / gcd(n, n_positions) tickets and uses every position
+      n / gcd(n, n_positions) times, so complete rounds use every position equally often.
+      Only the single positions are balanced: the combinations are not all used,
+      nor used equally often.
+    Raises:
+        ValueError: if n is not between 1 and n_positions
+    Returns:
+        dict: method, n_combinations, repetitions (combinations) or round_size (cyclic),
+              uses_per_position (if balanced), balanced
+    """
+    if not 0 < n <= n_positions:
+        raise ValueError(f"Cannot place {n} pictures on {n_positions} positions "
+                         f"(N must be between 1 and {n_positions})")
+    n_combinations = math.comb(n_positions, n)
+    # Every position can only be used equally often if the n * n_tickets uses split evenly
+    balanced = (n * n_tickets) % n_positions == 0
+    description = {
+        "n_positions": n_positions,
+        "n": n,
+        "n_tickets": n_tickets,
+        "n_combinations": n_combinations,
+        "balanced": balanced,
+        "uses_per_position": n * n_tickets // n_positions if balanced else None
+    }
+    if n_tickets % n_combinations == 0:
+        description["method"] = "combinations"
+        description["repetitions"] = n_tickets // n_combinations
+    else:
+        description["method"] = "cyclic"
+        description["round_size"] = n_positions // math.gcd(n, n_positions)
+    return description
+
+
+def create_balanced_pool(positions, n, n_tickets, rng):
+    """
+    Builds a pool of n_tickets tickets (tuples of n positions), in which every position
+    is used equally often (see describe_pool for how, and for when this is possible;
+    with the cyclic method, the combinations themselves are not balanced).
+    Only small pools enumerate the combinations: a 16-position layout never builds
+    the 12870 combinations of 8 positions.
+    The pool is shuffled (Level 1 Shuffle).
+    Returns:
+        list: the tickets, e.g. [(1, 3), (2, 4), ...]
+    """
+    positions = list(positions)
+    description = describe_pool(len(positions), n, n_tickets)
+
+    if description["method"] == "combinations":
+        pool = list(itertools.combinations(positions, n)) * description["repetitions"]
+    else:
+        # Windows of n consecutive positions, starting at 0, n, 2n, ... around the circle
+        n_positions = len(positions)
+        windows = [[(start + j) % n_positions for j in range(n)]
+                   for start in range(0, description["round_size"] * n, n)]
+        pool = []
+        while len(pool) < n_tickets:
+            # Each round uses a new random relabelling of the positions
+            labels = rng.sample(positions, n_positions)
+            for window in windows[:n_tickets - len(pool)]:
+                pool.append(tuple(sorted(labels[i] for i in window)))
+
+    rng.shuffle(pool)
+    return pool
+
+
+def verify_pool_balance(pool, positions, n):
+    """
+    Checks a pool against the closed-form expectation of describe_pool
+    (one pass over the pool).
+    Returns:
+        tuple: (ok, counts) with counts the number of uses of every position
+    """
+    counts = Counter(position for ticket in pool for position in ticket)
+    counts = {position: counts.get(position, 0) for position in positions}
+    description = describe_pool(len(counts), n, len(pool))
+    ok = (all(len(ticket) == n and len(set(ticket)) == n for ticket in pool) and
+          description["balanced"] and
+          all(count == description["uses_per_position"] for count in counts.values()))
+    return ok, counts
+
+
+def create_master_pools(n_super_blocks, rng, verbose=True, positions=QUADRANTS, prototype=None):
+    """
+    Creates the master pools for the entire experiment,
+    based on the Super-Block inventory from the PDF.
+    Args:
+        n_super_blocks: number of Super-Blocks
+        rng: the random.Random used for the Level 1 Shuffle
+        positions: the display positions (default: the 4 quadrants)
+        prototype: the Super-Block prototype (default: get_super_block_prototype())
+    Returns:
+        dict: {1: [...], 2: [...], 3: [...], 4: [...]}
+    """
+    if verbose:
+        print("Generating master quadrant pools...")
+    if prototype is None:
+        prototype = get_super_block_prototype()
+
+    # With the 4 quadrants, this is every combination of quadrants, e.g. for one Super-Block:
+    # N=1: 8 frames = 4 combos * 2 reps, N=2: 6 frames = 6 combos * 1 rep,
+    # N=3: 4 frames = 4 combos * 1 rep,  N=4: 2 frames = 1 combo * 2 reps
+    pools = {}
+    for n, n_frames in get_inventory(prototype).items():
+        pools[n] = create_balanced_pool(positions, n, n_frames * n_super_blocks, rng)
+
+    if verbose:
+        print("Shuffled master pools (Level 1 Shuffle).")
+        for n, n_frames in get_inventory(prototype).items():
+            description = describe_pool(len(positions), n, n_frames * n_super_blocks)
+            print(f"  Pool N={n} size: {len(pools[n])} (Expected {n_frames}*{n_super_blocks}={n_frames * n_super_blocks}), "
+                  f"{description['method']}, "
+                  f"{'each position ' + str(description['uses_per_position']) + ' times' if description['balanced'] else 'NOT BALANCED'}")
+    return pools
+
+
+def create_experiment_plan(n_super_blocks, rng, verbose=True, prototype=None):
+    """
+    Generates the full, 3-level-shuffled plan.
+    Args:
+        n_super_blocks: number of 5-trial Super-Blocks
+        rng: the random.Random used for the Level 2 and Level 3 Shuffles
+        prototype: the Super-Block prototype (default: get_super_block_prototype())
+    Returns:
+        list: A 75-item list (or less), where each item is a dict
+              e.g., {"trial_id": 1, "duration": 400, "n_values": [0,2,4,0,0,2]}
+    """
+    # Create the Super Blocks
+    if prototype is None:
+        prototype = get_super_block_prototype()
+    n_trials = len(prototype) * n_super_blocks
+    if verbose:
+        print(f"Generating {n_trials}-trial plan...")
+
+    full_trial_list = prototype * n_super_blocks
+
+    # PDF: Level 2 Shuffle
+    rng.shuffle(full_trial_list)
+
+    # Create Duration Pool (N_TRIALS / 3 durations)
+    reps_per_duration = n_trials // 3
+    # Make sure durations are also balanced if N_TRIALS is not divisible by 3 (e.g., 5 trials)
+    duration_pool = []
+    for duration in DURATIONS:
+        duration_pool.extend([duration] * reps_per_duration)
+    # Add any remaining
+    remaining_durations = DURATIONS * (n_trials % 3)
+    duration_pool.extend(remaining_durations[:n_trials - len(duration_pool)])
+    rng.shuffle(duration_pool)
+
+    final_plan = []
+    for i in range(n_trials):
+
+        # PDF: Level 3 Shuffle
+        # Shuffle the 6 frames within this trial
+        trial_n_values = list(full_trial_list[i])
+        rng.shuffle(trial_n_values)
+
+        final_plan.append({
+            "trial_id": i + 1,
+            "duration": duration_pool.pop(),
+            "n_values": trial_n_values # e.g.(0, 2, 0, 4, 0, 2)
+        })
+
+    if verbose:
+        print("Experiment plan generation complete.")
+    return final_plan
+
+
+def assign_pictures(picture_files, n_super_blocks, rng, verbose=True, prototype=None):
+    """
+    Splits the pictures into the 'old' pool (40 per Super-Block, shown in the RSVP)
+    and the 'new' pool (4 per trial, memory test distractors).
+    If there are not enough pictures, they are reused (for TESTING ONLY).
+    Returns:
+        tuple: (old_pics_pool, new_pics_pool), both in the order they are popped
+    """
+    if prototype is None:
+        prototype = get_super_block_prototype()
+    n_pics_old = sum(map(sum, prototype)) * n_super_blocks # e.g. 40 * 15 = 600
+    n_pics_new = 4 * len(prototype) * n_super_blocks # e.g. 4 * 75 = 300
+    n_pics_total_needed = n_pics_old + n_pics_new # e.g. 600 + 300 = 900
+
+    all_pic_files = sorted(picture_files)
+    rng.shuffle(all_pic_files)
+
+    if len(all_pic_files) < n_pics_total_needed:
+        # In experiment we need 900 pictures
+        if verbose:
+            print("WARNING: NOT ENOUGH PICTURES")
+            print(f"Need {n_pics_total_needed}, but only found {len(all_pic_files)}.")
+            print("REUSING pictures. This is for TESTING ONLY.")
+
+        # Create a new list by repeating the pictures
+        reused_pics_list = []
+        while len(reused_pics_list) < n_pics_total_needed:
+            reused_pics_list.extend(all_pic_files) # Add the pictures over and over
+
+        # Trim the list to exactly the number needed
+        all_pic_files = reused_pics_list[:n_pics_total_needed]
+
+    # Split into pools
+    old_pics_pool = all_pic_files[:n_pics_old]
+    new_pics_pool = all_pic_files[n_pics_old:n_pics_total_needed]
+    rng.shuffle(new_pics_pool)
+    return old_pics_pool, new_pics_pool
+
+
+def get_subject_seed(study_seed, subject_id):
+    """The seed of one participant's plan, derived from the study seed."""
+    return f"{study_seed}:{subject_id}"
+
+
+def generate_plan(subject_id, seed, n_super_blocks, picture_files, verbose=False, positions=QUADRANTS, prototype=None):
+    """
+    Generates the complete plan of one participant from one seed.
+    The same arguments always give the same plan.
+    Returns:
+        dict: subject_id, seed, n_super_blocks, trials, quadrant_pools, old_pics_pool, new_pics_pool
+    """
+    rng = random.Random(seed)
+    trials = create_experiment_plan(n_super_blocks, rng, verbose, prototype)
+    quadrant_pools = create_master_pools(n_super_blocks, rng, verbose, positions, prototype)
+    old_pics_pool, new_pics_pool = assign_pictures(picture_files, n_super_blocks, rng, verbose, prototype)
+    return {
+        "subject_id": subject_id,
+        "seed": seed,
+        "n_super_blocks": n_super_blocks,
+        "trials": trials,
+        "quadrant_pools": quadrant_pools,
+        "old_pics_pool": old_pics_pool,
+        "new_pics_pool": new_pics_pool
+    }
+
+
+def get_plan_path(subject_id, plans_folder=PLANS_FOLDER):
+    """File name of a participant's pre-generated plan."""
+    return os.path.join(plans_folder, f"CORE1_plan_{subject_id:03d}.json.gz")
+
+
+def save_plan(plan, path):
+    """Saves a plan as gzip-compressed JSON."""
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump(plan, f, separators=(',', ':'))
+
+
+def load_plan(path):
+    """Loads a plan saved with save_plan (quadrant tickets become tuples again)."""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        plan = json.load(f)
+    plan["quadrant_pools"] = {int(n): [tuple(ticket) for ticket in pool]
+                              for n, pool in plan["quadrant_pools"].items()}
+    return plan
+
+
+def _generate_and_save(args):
+    """Worker of generate_plans: generates one participant's plan and saves it."""
+    subject_id, study_seed, n_super_blocks, picture_files, plans_folder = args
+    plan = generate_plan(subject_id, get_subject_seed(study_seed, subject_id), n_super_blocks, picture_files)
+    path = get_plan_path(subject_id, plans_folder)
+    save_plan(plan, path)
+    return path
+
+
+def generate_plans(subject_ids, study_seed, n_super_blocks, picture_files, plans_folder=PLANS_FOLDER):
+    """Generates and saves the plans of many participants in a process pool. Returns the file paths."""
+    os.makedirs(plans_folder, exist_ok=True)
+    jobs = [(subject_id, study_seed, n_super_blocks, picture_files, plans_folder) for subject_id in subject_ids]
+    with ProcessPoolExecutor() as executor:
+        return list(executor.map(_generate_and_save, jobs, chunksize=16))
+
+
+def print_layout_check(n_super_blocks, n_positions_list, prototype=None):
+    """Prints, for every layout, how each pool of the prototype would be balanced (closed form)."""
+    if prototype is None:
+        prototype = get_super_block_prototype()
+    inventory = get_inventory(prototype)
+    for n_positions in n_positions_list:
+        print(f"{n_positions} positions, {n_super_blocks} Super-Blocks:")
+        for n, n_frames in inventory.items():
+            if n > n_positions:
+                print(f"  N={n}: IMPOSSIBLE (more pictures than positions)")
+                continue
+            description = describe_pool(n_positions, n, n_frames * n_super_blocks)
+            balance = (f"each position {description['uses_per_position']} times" if description["balanced"]
+                       else "NOT BALANCED (position uses cannot split evenly)")
+            print(f"  N={n}: {description['n_tickets']} tickets, {description['method']} "
+                  f"({description['n_combinations']} combinations), {balance}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit()
+    if sys.argv[1] == "--check-layouts":
+        print_layout_check(int(sys.argv[2]), [int(k) for k in sys.argv[3:]])
+        sys.exit()
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit()
+    # Only needed here: the manifest decodes the pictures with pygame
+    from CORE1_manifest import load_stimulus_manifest, get_usable_pictures
+    n_participants = int(sys.argv[1])
+    n_super_blocks = int(sys.argv[2])
+    first_subject_id = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    study_seed = sys.argv[4] if len(sys.argv) > 4 else "CORE1"
+
+    try:
+        picture_files, broken_pics = get_usable_pictures(load_stimulus_manifest())
+    except FileNotFoundError:
+        print(f"FATAL ERROR: Picture folder '{PICS_FOLDER}' not found.")
+        sys.exit()
+    # Broken pictures would make the plans fail when they are loaded, with the participant seated
+    if broken_pics:
+        print(f"WARNING: {len(broken_pics)} pictures cannot be decoded and are left out of the plans:")
+        for entry in broken_pics:
+            print(f"  {entry['file']}: {entry['error']}")
+
+    subject_ids = range(first_subject_id, first_subject_id + n_participants)
+    paths = generate_plans(subject_ids, study_seed, n_super_blocks, picture_files)
+    print(f"Saved {len(paths)} plans ({n_super_blocks} Super-Blocks, study seed '{study_seed}') to '{PLANS_FOLDER}'.")
@@ -0,0 +1,274 @@
+"""
+Signal-detection statistics for the Potter & Fox (2009) Experiment 2 replication
+(the data files written by CORE1_Project1_1101.py).
+
+For every N-value x duration cell, the hits (old pictures of that cell) are
+compared with the false alarms of the same duration (new pictures have no
+N-value) to compute:
+- d' (sensitivity):  z(H) - z(F)
+- c (criterion):     -(z(H) + z(F)) / 2
+- A' (non-parametric sensitivity, Snodgrass & Corwin, 1988)
+The rates use the log-linear correction (Hautus, 1995): (yes + 0.5) / (n + 1),
+so rates of 0% and 100% still give finite values.
+
+Confidence intervals come from bootstrap resampling, done on NumPy arrays:
+- per subject: the trials of every cell are resampled with replacement.
+  This is the same as drawing the number of 'yes' answers of the cell from
+  a binomial distribution, so a resample of a whole session is one
+  rng.binomial() call (all resamples at once).
+- for the group: the subjects are resampled with replacement.
+The subjects are bootstrapped in parallel worker processes.
+
+The results are written to two CSV files in the data folder:
+- CORE1_sdt_subject_summary.csv: one row per subject x N-value x duration
+- CORE1_sdt_group_summary.csv:   one row per N-value x duration
+
+Usage:
+    python CORE1_sdt.py [data_folder] [N_RESAMPLES] [SEED]
+(default: the 'data' folder next to this script, 10000 resamples)
+"""
+
+import os
+import sys
+import csv
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from CORE1_batch_analysis import DATA_FOLDER, N_VALUES, load_data_folder, count_responses
+
+SUBJECT_SDT_FILE = "CORE1_sdt_subject_summary.csv"
+GROUP_SDT_FILE = "CORE1_sdt_group_summary.csv"
+
+N_RESAMPLES = 10000
+CI_LEVEL = 95 # % confidence intervals (percentile bootstrap)
+DEFAULT_SEED = 2009
+
+MEASURES = ["d_prime", "c", "a_prime"]
+
+
+def norm_ppf(p):
+    """
+    Inverse of the standard normal CDF (z-score of a probability), for arrays.
+    Uses Acklam's rational approximation (relative error below 1.2e-9),
+    so that NumPy is the only dependency.
+    """
+    a = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+         1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+    b = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+         6.680131188771972e+01, -1.328068155288572e+01]
+    c = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+         -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+    d = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+         3.754408661907416e+00]
+    p = np.asarray(p, dtype=np.float64)
+    z = np.full(p.shape, np.nan)
+    p_low = 0.02425
+
+    # Lower tail, central region and upper tail
+    low = p < p_low
+    q = np.sqrt(-2 * np.log(p[low]))
+    z[low] = (((((c[0]*q + c[1])*q + c[2])*q + c[3])*q + c[4])*q + c[5]) / \
+             ((((d[0]*q + d[1])*q + d[2])*q + d[3])*q + 1)
+    central = (p >= p_low) & (p <= 1 - p_low)
+    q = p[central] - 0.5
+    r = q * q
+    z[central] = (((((a[0]*r + a[1])*r + a[2])*r + a[3])*r + a[4])*r + a[5]) * q / \
+                 (((((b[0]*r + b[1])*r + b[2])*r + b[3])*r + b[4])*r + 1)
+    high = p > 1 - p_low
+    q = np.sqrt(-2 * np.log(1 - p[high]))
+    z[high] = -(((((c[0]*q + c[1])*q + c[2])*q + c[3])*q + c[4])*q + c[5]) / \
+               ((((d[0]*q + d[1])*q + d[2])*q + d[3])*q + 1)
+    return z
+
+
+def sdt_measures(hits, n_old, false_alarms, n_new):
+    """
+    d', c and A' from counts (any array shapes that broadcast together).
+    Cells without old or without new pictures give NaN.
+    Returns:
+        dict: {"hit_rate", "fa_rate", "d_prime", "c", "a_prime"} (rates are the corrected ones)
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hit_rate = np.where(n_old > 0, (hits + 0.5) / (n_old + 1), np.nan)
+        fa_rate = np.where(n_new > 0, (false_alarms + 0.5) / (n_new + 1), np.nan)
+        z_hit = norm_ppf(hit_rate)
+        z_fa = norm_ppf(fa_rate)
+
+        # A' has one formula for H >= F and its mirror image for H < F
+        diff = hit_rate - fa_rate
+        a_above = 0.5 + diff * (1 + diff) / (4 * hit_rate * (1 - fa_rate))
+        a_below = 0.5 + diff * (1 - diff) / (4 * fa_rate * (1 - hit_rate))
+        a_prime = np.where(diff >= 0, a_above, a_below)
+    return {
+        "hit_rate": hit_rate,
+        "fa_rate": fa_rate,
+        "d_prime": z_hit - z_fa,
+        "c": -(z_hit + z_fa) / 2,
+        "a_prime": a_prime
+    }
+
+
+def subject_cells(yes_counts, totals):
+    """
+    Splits the counts of one subject (shape (5, n_durations), slot 0 = new pictures)
+    into the hits of every N-value x duration cell and the false alarms of every duration.
+    Returns:
+        tuple: (hits, n_old, false_alarms, n_new), shapes (4, n_durations) and (1, n_durations)
+    """
+    return yes_counts[1:], totals[1:], yes_counts[:1], totals[:1]
+
+
+def bootstrap_subject(args):
+    """
+    Point estimates and bootstrap confidence intervals of one subject
+    (runs in a worker process).
+    Returns:
+        dict: {measure: (estimate, ci_low, ci_high)}, arrays of shape (4, n_durations)
+    """
+    yes_counts, totals, n_resamples, seed = args
+    rng = np.random.default_rng(seed)
+    hits, n_old, false_alarms, n_new = subject_cells(yes_counts, totals)
+    estimates = sdt_measures(hits, n_old, false_alarms, n_new)
+
+    # Resampling the trials of a cell = drawing its 'yes' count from Binomial(n, observed rate)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p_hit = np.where(n_old > 0, hits / n_old, 0)
+        p_fa = np.where(n_new > 0, false_alarms / n_new, 0)
+    resampled = sdt_measures(rng.binomial(n_old, p_hit, size=(n_resamples,) + n_old.shape), n_old,
+                             rng.binomial(n_new, p_fa, size=(n_resamples,) + n_new.shape), n_new)
+
+    tail = (100 - CI_LEVEL) / 2
+    results = {}
+    for measure in ["hit_rate", "fa_rate"] + MEASURES:
+        # fa_rate has one row (durations only): repeat it for the 4 N-values
+        estimate = np.broadcast_to(estimates[measure], hits.shape)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning) # All-NaN cells
+            low, high = np.nanpercentile(resampled[measure], [tail, 100 - tail], axis=0)
+        results[measure] = (estimate, np.broadcast_to(low, hits.shape), np.broadcast_to(high, hits.shape))
+    return results
+
+
+def bootstrap_group(subject_estimates, n_resamples, rng):
+    """
+    Group mean of a measure and its bootstrap confidence interval (subjects resampled).
+    Args:
+        subject_estimates: array (n_subjects, 4, n_durations), NaN for missing cells
+    Returns:
+        tuple: (mean, ci_low, ci_high, n_subjects), arrays of shape (4, n_durations)
+    """
+    n_subjects = subject_estimates.shape[0]
+    samples = rng.integers(0, n_subjects, size=(n_resamples, n_subjects))
+    tail = (100 - CI_LEVEL) / 2
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning) # Cells without data in a resample
+        mean = np.nanmean(subject_estimates, axis=0)
+        resampled_means = np.nanmean(subject_estimates[samples], axis=1)
+        low, high = np.nanpercentile(resampled_means, [tail, 100 - tail], axis=0)
+    return mean, low, high, np.sum(~np.isnan(subject_estimates), axis=0)
+
+
+def session_sdt_report(results_n_value, results_duration, n_resamples=N_RESAMPLES, seed=DEFAULT_SEED):
+    """
+    The signal-detection part of the summary report of one session,
+    from the result tables of CORE1_analysis.py (no worker processes: one subject).
+    Returns:
+        list: the report lines
+    """
+    durations = sorted(results_duration.keys())
+    yes_counts = np.zeros((len(N_VALUES) + 1, len(durations)), dtype=np.int64)
+    totals = np.zeros_like(yes_counts)
+    for d, dur in enumerate(durations):
+        yes_counts[0, d] = results_duration[dur]['false_alarms']
+        totals[0, d] = results_duration[dur]['total_new']
+        for n in N_VALUES:
+            cell = results_n_value.get(str(n), {}).get(dur, {'hits': 0, 'total_old': 0})
+            yes_counts[n, d] = cell['hits']
+            totals[n, d] = cell['total_old']
+
+    results = bootstrap_subject((yes_counts, totals, n_resamples, seed))
+    report = [f"Signal Detection by N-Value x Duration ({CI_LEVEL}% bootstrap CI, {n_resamples} resamples):"]
+    for i, n in enumerate(N_VALUES):
+        for d, dur in enumerate(durations):
+            line = f"  N={n}, {dur} ms:"
+            for measure in MEASURES:
+                estimate, low, high = (values[i, d] for values in results[measure])
+                line += f"  {measure} {format_value(estimate)} [{format_value(low)}, {format_value(high)}]"
+            report.append(line)
+    return report
+
+
+def format_value(value):
+    return "NA" if np.isnan(value) else f"{value:.3f}"
+
+
+def analyze_folder(data_folder, n_resamples=N_RESAMPLES, seed=DEFAULT_SEED):
+    """Computes the subject and group signal-detection tables of one folder and writes them."""
+    subjects = load_data_folder(data_folder)
+    if len(subjects) == 0:
+        print(f"No CORE1 data files found in '{data_folder}'.")
+        return
+    print(f"Bootstrapping {len(subjects)} subjects ({n_resamples} resamples each)...")
+
+    durations, yes_counts, totals = count_responses(subjects)
+    # Independent random streams for the subjects and the group
+    seeds = np.random.SeedSequence(seed).spawn(len(subjects) + 1)
+    jobs = [(yes_counts[s], totals[s], n_resamples, seeds[s]) for s in range(len(subjects))]
+    with ProcessPoolExecutor() as executor:
+        subject_results = list(executor.map(bootstrap_subject, jobs))
+
+    # Per-subject table
+    subject_file = os.path.join(data_folder, SUBJECT_SDT_FILE)
+    with open(subject_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["subject_id", "file", "n_value", "duration", "hit_rate", "fa_rate"] +
+                        [f"{measure}{suffix}" for measure in MEASURES for suffix in ("", "_ci_low", "_ci_high")])
+        for data, results in zip(subjects, subject_results):
+            for i, n in enumerate(N_VALUES):
+                for d, dur in enumerate(durations):
+                    row = [data["subject_id"], data["file"], n, dur,
+                           format_value(results["hit_rate"][0][i, d]), format_value(results["fa_rate"][0][i, d])]
+                    for measure in MEASURES:
+                        row.extend(format_value(values[i, d]) for values in results[measure])
+                    writer.writerow(row)
+
+    # Group table: mean of the subjects' estimates, subjects resampled
+    group_rng = np.random.default_rng(seeds[-1])
+    group = {measure: bootstrap_group(np.stack([results[measure][0] for results in subject_results]),
+                                      n_resamples, group_rng)
+             for measure in MEASURES}
+    group_file = os.path.join(data_folder, GROUP_SDT_FILE)
+    with open(group_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["n_value", "duration"] +
+                        [f"{measure}{suffix}" for measure in MEASURES
+                         for suffix in ("_n_subjects", "_mean", "_ci_low", "_ci_high")])
+        for i, n in enumerate(N_VALUES):
+            for d, dur in enumerate(durations):
+                row = [n, dur]
+                for measure in MEASURES:
+                    # Each measure counts the subjects with a defined estimate in this cell
+                    row.append(group[measure][3][i, d])
+                    row.extend(format_value(values[i, d]) for values in group[measure][:3])
+                writer.writerow(row)
+
+    # Short group report in the console
+    print(f"\nGroup d' by N-Value x Duration (mean [{CI_LEVEL}% CI]):")
+    print("         " + "".join(f"{dur:>22} ms" for dur in durations))
+    for i, n in enumerate(N_VALUES):
+        cells = [f"{format_value(group['d_prime'][0][i, d])} [{format_value(group['d_prime'][1][i, d])}, "
+                 f"{format_value(group['d_prime'][2][i, d])}]" for d in range(len(durations))]
+        print(f"  N={n}    " + "".join(f"{cell:>25}" for cell in cells))
+    print(f"\nSaved {SUBJECT_SDT_FILE} and {GROUP_SDT_FILE} to '{data_folder}'.")
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else DATA_FOLDER
+    n_resamples = int(sys.argv[2]) if len(sys.argv) > 2 else N_RESAMPLES
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_SEED
+    if not os.path.isdir(folder):
+        print(f"FATAL ERROR: Data folder '{folder}' not found.")
+        sys.exit()
+    analyze_folder(folder, n_resamples, seed)